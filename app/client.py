@@ -0,0 +1,73 @@
+"""Thin client for the object server started with the `daemon` command.
+
+Usage: python -m app.client <command> [args...]
+
+The command is forwarded to the daemon serving the current repository over
+its Unix socket; when none is listening it runs in this process instead.
+Only the standard library is imported, so a forwarded command costs an
+interpreter start and one round trip.
+"""
+
+import base64
+import io
+import json
+import os
+import sys
+
+DEFAULT_SOCKET = os.path.join(".git", "daemon.sock")
+# What connecting raises when no daemon serves the repository
+NO_DAEMON_ERRORS = (FileNotFoundError, ConnectionRefusedError)
+
+
+def request(
+    argv: list[str], *, stdin: bytes = b"", socket_path: str = DEFAULT_SOCKET
+) -> dict:
+    """Run `argv` on the daemon listening on `socket_path`.
+
+    Returns the response: the exit "status", base64 "stdout", "stderr" text
+    and the "elapsed" seconds the daemon spent on the command.
+    """
+    # Imported here: the CLI parser imports this module for DEFAULT_SOCKET
+    import socket
+
+    message = {
+        "argv": argv,
+        "cwd": os.getcwd(),
+        "stdin": base64.b64encode(stdin).decode(),
+    }
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(message).encode() + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError(f"Daemon on {socket_path} closed the connection")
+    return json.loads(line)
+
+
+def _reads_stdin(argv: list[str]) -> bool:
+    return argv[:1] == ["cat-file"] and any(arg.startswith("--batch") for arg in argv)
+
+
+def main(argv: list[str] | None = None, *, socket_path: str = DEFAULT_SOCKET) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    stdin = sys.stdin.buffer.read() if _reads_stdin(argv) else b""
+    try:
+        response = request(argv, stdin=stdin, socket_path=socket_path)
+    except NO_DAEMON_ERRORS:
+        # No daemon for this repository: run the command here
+        from app.main import main as run
+
+        sys.stdin = io.TextIOWrapper(io.BytesIO(stdin))
+        run(argv)
+        return 0
+
+    sys.stdout.flush()
+    sys.stdout.buffer.write(base64.b64decode(response["stdout"]))
+    sys.stdout.flush()
+    sys.stderr.write(response["stderr"])
+    return response["status"]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""Long-running object server for one repository.
+
+`daemon` keeps a `Git` instance, and with it the object store and its
+memory-mapped pack indexes, alive between commands. Clients (see
+app.client) send one JSON line per command:
+
+    {"argv": [...], "cwd": "...", "stdin": "<base64>"}
+
+and get back one JSON line per command:
+
+    {"status": 0, "stdout": "<base64>", "stderr": "...", "elapsed": 0.0004}
+
+Commands run one at a time, through the same dispatch as the CLI.
+"""
+
+import base64
+import contextlib
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import time
+import traceback
+
+from app.client import DEFAULT_SOCKET
+from app.main import main
+from app.models import Git
+
+__all__ = ["GitDaemon", "serve"]
+
+# Commands that serve until interrupted, or run long enough to hold up every
+# client queued behind them: refused, to be run on their own instead
+LONG_RUNNING_COMMANDS = {"daemon", "http-backend", "mirror"}
+
+
+@contextlib.contextmanager
+def _redirect_stdin(stream):
+    old_stdin = sys.stdin
+    sys.stdin = stream
+    try:
+        yield stream
+    finally:
+        sys.stdin = old_stdin
+
+
+class _CommandHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            response = self.server.run(json.loads(line))
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class GitDaemon(socketserver.UnixStreamServer):
+    """Serve the repository in the current directory on `socket_path`."""
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET, *, log=None):
+        self.git = Git()
+        self.cwd = os.getcwd()
+        self.log = log
+        self._remove_stale_socket(socket_path)
+        super().__init__(socket_path, _CommandHandler)
+
+    @staticmethod
+    def _remove_stale_socket(socket_path: str):
+        if not os.path.exists(socket_path):
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(socket_path)
+            except ConnectionRefusedError:
+                os.unlink(socket_path)  # left behind by a daemon that died
+                return
+        raise RuntimeError(f"A daemon is already listening on {socket_path}")
+
+    def server_close(self):
+        super().server_close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.server_address)
+        self.git.store.close()
+
+    def run(self, request: dict) -> dict:
+        """Run one command and return its response."""
+        start = time.perf_counter()
+        argv = request["argv"]
+        stdout = io.TextIOWrapper(io.BytesIO(), write_through=True)
+        stderr = io.StringIO()
+        stdin = io.TextIOWrapper(io.BytesIO(base64.b64decode(request.get("stdin", ""))))
+        status = 0
+
+        if request.get("cwd") != self.cwd:
+            status = 1
+            stderr.write(f"This daemon serves {self.cwd}\n")
+        elif argv[:1] == ["daemon"]:
+            status = 1
+            stderr.write("A daemon cannot start another daemon\n")
+        elif argv and argv[0] in LONG_RUNNING_COMMANDS:
+            status = 1
+            stderr.write(f"The daemon does not run {argv[0]}: run it directly\n")
+        else:
+            with (
+                contextlib.redirect_stdout(stdout),
+                contextlib.redirect_stderr(stderr),
+                _redirect_stdin(stdin),
+            ):
+                try:
+                    main(argv, git=self.git)
+                except SystemExit as e:
+                    # Same convention as the interpreter: None is success
+                    status = e.code if isinstance(e.code, int) else int(bool(e.code))
+                except Exception:  # noqa: BLE001
+                    # A failed command, whatever the error, must not take the
+                    # daemon down: report it to the client and to the log
+                    traceback.print_exc()
+                    status = 1
+                    if self.log is not None:
+                        traceback.print_exc(file=self.log)
+            stdout.flush()
+
+        elapsed = time.perf_counter() - start
+        if self.log is not None:
+            command = argv[0] if argv else ""
+            self.log.write(f"{command} exited {status} in {elapsed * 1000:.2f}ms\n")
+            self.log.flush()
+        return {
+            "status": status,
+            "stdout": base64.b64encode(stdout.buffer.getvalue()).decode(),
+            "stderr": stderr.getvalue(),
+            "elapsed": elapsed,
+        }
+
+
+def serve(socket_path: str = DEFAULT_SOCKET):
+    with GitDaemon(socket_path, log=sys.stderr) as server:
+        sys.stderr.write(f"Serving {server.cwd} on {socket_path}\n")
+        with contextlib.suppress(KeyboardInterrupt):
+            server.serve_forever()
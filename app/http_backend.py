@@ -0,0 +1,471 @@
+"""Serve the repositories below a directory over smart HTTP, as git http-backend.
+
+Usage: python -m app.main http-backend [ROOT] [--bind HOST] [--port PORT]
+
+`git clone http://HOST:PORT/<path>` clones the repository at ROOT/<path>,
+a work tree or a bare repository, with or without a ".git" suffix. Only
+fetching is served (git-upload-pack), in protocol v0 with the
+multi_ack_detailed, no-done, side-band-64k, ofs-delta and thin-pack
+capabilities: shallow and partial clones are not.
+
+Packs are sent while they are generated. Objects already stored in a pack
+are copied as they are, deltas included when their base is sent before
+them or, in a thin pack, is one the client has.
+"""
+
+import contextlib
+import gzip
+import hashlib
+import io
+import struct
+import sys
+import zlib
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+from app.models import Git
+from app.models.clone import FLUSH_PKT, GitClone
+from app.models.pack import (
+    OBJ_COMMIT,
+    OBJ_OFS_DELTA,
+    OBJ_REF_DELTA,
+    OBJ_TAG,
+    OBJ_TREE,
+    encode_entry_header,
+    encode_ofs_distance,
+)
+
+__all__ = ["GitHttpServer", "PackStats", "UploadPack", "serve"]
+
+CAPABILITIES = [
+    "multi_ack_detailed",
+    "no-done",
+    "side-band-64k",
+    "side-band",
+    "ofs-delta",
+    "thin-pack",
+    "agent=git-python",
+]
+# Data bytes of a side-band-64k packet: 65520, less the length and the band
+LARGE_PACKET_DATA_MAX = 65515
+# And of a side-band packet
+PACKET_DATA_MAX = 995
+# Tree entries of submodules: commits of another repository
+GITLINK_MODE = "160000"
+
+pkt_line = GitClone.format_pkt_line
+
+
+@dataclass
+class PackStats:
+    objects: int = 0
+    deltas: int = 0
+    reused: int = 0  # entries copied from a local pack without inflating them
+
+    def __str__(self):
+        return f"Total {self.objects} (delta {self.deltas}), reused {self.reused}"
+
+
+def side_band(
+    chunks: Iterable[bytes], band: int = 1, *, size: int = LARGE_PACKET_DATA_MAX
+) -> Iterator[bytes]:
+    """Frame `chunks` as pkt-lines of `band`, filling each up to `size` bytes."""
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= size:
+            yield pkt_line(bytes([band]) + buffer[:size])
+            del buffer[:size]
+    if buffer:
+        yield pkt_line(bytes([band]) + buffer)
+
+
+class UploadPack:
+    """git-upload-pack for the repository in `git_dir`, one stateless request
+    at a time, as smart HTTP calls it.
+    """
+
+    def __init__(self, git_dir: Path):
+        self.git_dir = Path(git_dir)
+        self.git = Git(self.git_dir)
+        self.store = self.git.store
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.store.close()
+
+    def advertise_refs(self) -> bytes:
+        """The refs, HEAD first and tags followed by what they peel to."""
+        refs = self.git.read_refs()
+        head = (self.git_dir / "HEAD").read_text().strip()
+        capabilities = list(CAPABILITIES)
+        advertised = []
+        if head.startswith("ref: "):
+            target = head.removeprefix("ref: ")
+            if target in refs:
+                advertised.append((refs[target], "HEAD"))
+                capabilities.append(f"symref=HEAD:{target}")
+        else:
+            advertised.append((head, "HEAD"))
+        for name, sha1 in sorted(refs.items()):
+            advertised.append((sha1, name))
+            if name.startswith("refs/tags/"):
+                peeled = self._peel(sha1)
+                if peeled != sha1:
+                    advertised.append((peeled, f"{name}^{{}}"))
+        if not advertised:
+            # An empty repository still advertises its capabilities
+            advertised.append(("0" * 40, "capabilities^{}"))
+
+        (sha1, name), *rest = advertised
+        lines = [f"{sha1} {name}\0{' '.join(capabilities)}\n"]
+        lines.extend(f"{sha1} {name}\n" for sha1, name in rest)
+        return b"".join(pkt_line(line) for line in lines) + FLUSH_PKT
+
+    def _peel(self, sha1: str) -> str:
+        obj = self.store.read(sha1)
+        while obj.type == OBJ_TAG:
+            sha1 = obj.data.split(b"\n", 1)[0].removeprefix(b"object ").decode()
+            obj = self.store.read(sha1)
+        return sha1
+
+    @staticmethod
+    def _parse_request(request: bytes) -> tuple[list[str], set[str], list[str], bool]:
+        """Split an upload-pack request into (wants, capabilities, haves, done)."""
+        stream = io.BytesIO(request)
+        wants = []
+        capabilities = set()
+        haves = []
+        done = False
+        while stream.tell() < len(request):
+            line = GitClone._read_pkt_line(stream)
+            if line is None:
+                continue  # ends the wants, or a round of haves
+            command, _, argument = line.decode().partition(" ")
+            if command == "want":
+                sha1, *words = argument.split()
+                if not wants:
+                    capabilities.update(words)
+                wants.append(sha1)
+            elif command == "have":
+                haves.append(argument.strip())
+            elif command == "done":
+                done = True
+            # "shallow" and "deepen" need capabilities that are not advertised
+        return wants, capabilities, haves, done
+
+    def upload_pack(self, request: bytes) -> Iterator[bytes]:
+        """Answer `request`: acknowledge the haves of a negotiation round,
+        then send the pack once the client is done, or as soon as we are
+        ready if it allows "no-done".
+        """
+        wants, capabilities, haves, done = self._parse_request(request)
+        for sha1 in wants:
+            if sha1 not in self.store:
+                yield pkt_line(f"ERR upload-pack: not our ref {sha1}\n")
+                return
+        common = [sha1 for sha1 in haves if sha1 in self.store]
+
+        if not done:
+            ready = bool(common) and self._ready(wants, common)
+            if "multi_ack_detailed" in capabilities:
+                for sha1 in common:
+                    yield pkt_line(f"ACK {sha1} common\n")
+                if ready:
+                    yield pkt_line(f"ACK {common[-1]} ready\n")
+            yield pkt_line("NAK\n")
+            if not (ready and "no-done" in capabilities):
+                return  # the client sends more haves in its next request
+            yield pkt_line(f"ACK {common[-1]}\n")
+        elif common:
+            yield pkt_line(f"ACK {common[-1]}\n")
+        else:
+            yield pkt_line("NAK\n")
+        yield from self._send_pack(wants, common, capabilities)
+
+    def _parents(self, sha1: str) -> list[str]:
+        obj = self.store.read(sha1)
+        if obj.type != OBJ_COMMIT:
+            return []
+        return GitClone.parse_commit(obj.data)["parents"]
+
+    def _ready(self, wants: list[str], common: list[str]) -> bool:
+        """Whether every wanted commit descends from a common one, so that a
+        pack without the history they share can be made.
+        """
+        common = set(common)
+        for want in wants:
+            seen = {want}
+            queue = [want]
+            while queue:
+                sha1 = queue.pop()
+                if sha1 in common:
+                    break
+                for parent in self._parents(sha1):
+                    if parent not in seen:
+                        seen.add(parent)
+                        queue.append(parent)
+            else:
+                return False
+        return True
+
+    def _walk(
+        self, starts: Iterable[str], seen: set[str], *, parents: bool = True
+    ) -> Iterator[str]:
+        """Yield the objects reachable from `starts` that are not in `seen`,
+        adding them to it; commits lead to their parents too if `parents`.
+        """
+        queue = list(starts)
+        while queue:
+            sha1 = queue.pop()
+            if sha1 in seen:
+                continue
+            seen.add(sha1)
+            yield sha1
+            obj_type, _ = self.store.read_header(sha1)
+            if obj_type == OBJ_COMMIT:
+                commit = GitClone.parse_commit(self.store.read(sha1).data)
+                if parents:
+                    queue.extend(commit["parents"])
+                queue.append(commit["tree"])
+            elif obj_type == OBJ_TREE:
+                tree = GitClone.parse_tree(self.store.read(sha1).data)
+                queue.extend(entry for mode, _, entry in tree if mode != GITLINK_MODE)
+            elif obj_type == OBJ_TAG:
+                queue.append(self._peel(sha1))
+
+    def _send_pack(
+        self, wants: list[str], common: list[str], capabilities: set[str]
+    ) -> Iterator[bytes]:
+        # The client has every ancestor of the common commits, and the trees
+        # and blobs of those commits: git also stops at these, rather than
+        # walking every tree of the shared history
+        have_commits = set()
+        queue = list(common)
+        while queue:
+            sha1 = queue.pop()
+            if sha1 not in have_commits:
+                have_commits.add(sha1)
+                queue.extend(self._parents(sha1))
+        client_has = set()
+        for _ in self._walk(common, client_has, parents=False):
+            pass
+        sha1s = list(self._walk(wants, client_has | have_commits))
+
+        stats = PackStats()
+        chunks = self.pack_objects(
+            sha1s,
+            ofs_delta="ofs-delta" in capabilities,
+            thin_bases=client_has if "thin-pack" in capabilities else (),
+            stats=stats,
+        )
+        if "side-band-64k" in capabilities:
+            size = LARGE_PACKET_DATA_MAX
+        elif "side-band" in capabilities:
+            size = PACKET_DATA_MAX
+        else:
+            yield from chunks
+            return
+        try:
+            yield from side_band(chunks, size=size)
+        except Exception as e:
+            yield pkt_line(f"\3{type(e).__name__}: {e}\n")
+            raise
+        yield pkt_line(f"\2{stats}\n")
+        yield FLUSH_PKT
+
+    def pack_objects(
+        self,
+        sha1s: list[str],
+        *,
+        ofs_delta: bool = True,
+        thin_bases: Iterable[str] = (),
+        stats: PackStats | None = None,
+    ) -> Iterator[bytes]:
+        """Yield a pack of `sha1s`, entry by entry, as it is written.
+
+        Packed objects come first, in the order of their packs, so that the
+        base of a delta is usually written before it and its entry can be
+        copied without inflating it: as an OFS delta if `ofs_delta`, else a
+        REF one. Deltas against `thin_bases`, objects the client has, are
+        kept as REF deltas too, which makes a thin pack. Other objects are
+        sent whole.
+        """
+        stats = PackStats() if stats is None else stats
+        packed = []
+        loose = []
+        for sha1 in sha1s:
+            found = self.store.find_packed(sha1)
+            if found is None:
+                loose.append(sha1)
+            else:
+                pack, offset = found
+                packed.append((pack.path, offset, pack, sha1))
+        packed.sort(key=lambda item: item[:2])
+
+        checksum = hashlib.sha1()
+        header = struct.pack(">4sII", b"PACK", 2, len(sha1s))
+        checksum.update(header)
+        yield header
+        offset = len(header)
+        written = {}  # SHA-1 -> offset in this pack
+        thin_bases = set(thin_bases)
+        objects = [(pack, entry_offset, sha1) for _, entry_offset, pack, sha1 in packed]
+        objects.extend((None, None, sha1) for sha1 in loose)
+        for pack, entry_offset, sha1 in objects:
+            raw = None
+            if pack is not None:
+                obj_type, size, base, data = pack.read_raw_at(entry_offset)
+                if base is None:
+                    raw = encode_entry_header(obj_type, size) + data
+                elif base in written and ofs_delta:
+                    raw = (
+                        encode_entry_header(OBJ_OFS_DELTA, size)
+                        + encode_ofs_distance(offset - written[base])
+                        + data
+                    )
+                elif base in written or base in thin_bases:
+                    raw = (
+                        encode_entry_header(OBJ_REF_DELTA, size)
+                        + bytes.fromhex(base)
+                        + data
+                    )
+                del data  # a view of the pack's mmap
+                if raw is not None:
+                    stats.reused += 1
+                    stats.deltas += base is not None
+            if raw is None:
+                obj = self.store.read(sha1)
+                raw = encode_entry_header(obj.type, len(obj.data)) + zlib.compress(
+                    obj.data
+                )
+            checksum.update(raw)
+            yield raw
+            written[sha1] = offset
+            offset += len(raw)
+            stats.objects += 1
+        yield checksum.digest()
+
+
+class _UploadPackHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections alive between requests
+
+    def log_message(self, format, *args):
+        if self.server.log is not None:
+            self.server.log.write(f"{self.address_string()} {format % args}\n")
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        git_dir = None
+        if url.path.endswith("/info/refs") and url.query == "service=git-upload-pack":
+            git_dir = self.server.git_dir(url.path.removesuffix("/info/refs"))
+        if git_dir is None:
+            return self._send(b"Not found\n", "text/plain", status=404)
+        with UploadPack(git_dir) as upload_pack:
+            advertisement = upload_pack.advertise_refs()
+        self._send(
+            pkt_line("# service=git-upload-pack\n") + FLUSH_PKT + advertisement,
+            "application/x-git-upload-pack-advertisement",
+        )
+
+    def do_POST(self):
+        body = self._read_body()
+        url = urlsplit(self.path)
+        git_dir = None
+        if url.path.endswith("/git-upload-pack"):
+            git_dir = self.server.git_dir(url.path.removesuffix("/git-upload-pack"))
+        if git_dir is None:
+            return self._send(b"Not found\n", "text/plain", status=404)
+        if self.headers.get("Content-Encoding", "").lower() == "gzip":
+            body = gzip.decompress(body)
+        with UploadPack(git_dir) as upload_pack:
+            self._send_chunked(
+                upload_pack.upload_pack(body), "application/x-git-upload-pack-result"
+            )
+
+    def _read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() != "chunked":
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        # As git sends request bodies larger than http.postBuffer
+        parts = []
+        while size := int(self.rfile.readline().split(b";")[0], 16):
+            parts.append(self.rfile.read(size))
+            self.rfile.readline()
+        while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+            pass  # trailers
+        return b"".join(parts)
+
+    def _send(self, body: bytes, content_type: str, *, status: int = 200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunked(self, chunks: Iterable[bytes], content_type: str):
+        """Send `chunks` as they are produced, in chunked transfer encoding."""
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            for chunk in chunks:
+                if chunk:
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        except Exception:
+            # The response is cut short: the client must not wait for more
+            self.close_connection = True
+            raise
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class GitHttpServer(ThreadingHTTPServer):
+    """Serve the repositories below `root` on `host`:`port` (0: any free port)."""
+
+    daemon_threads = True
+
+    def __init__(
+        self, root: Path, host: str = "127.0.0.1", port: int = 8000, *, log=None
+    ):
+        self.root = Path(root).resolve()
+        self.log = log
+        super().__init__((host, port), _UploadPackHandler)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def git_dir(self, url_path: str) -> Path | None:
+        """The git directory of the repository at `url_path`, if there is one."""
+        relative = unquote(url_path).strip("/")
+        if relative.endswith(".git"):
+            candidates = [relative, relative.removesuffix(".git")]
+        else:
+            candidates = [relative, f"{relative}.git"]
+        for candidate in candidates:
+            path = (self.root / candidate).resolve()
+            if not path.is_relative_to(self.root):
+                continue  # ".." out of the served directory
+            if (path / ".git" / "objects").is_dir():
+                return path / ".git"
+            if (path / "objects").is_dir() and (path / "HEAD").is_file():
+                return path  # a bare repository
+        return None
+
+
+def serve(root: Path = Path("."), *, host: str = "127.0.0.1", port: int = 8000):
+    with GitHttpServer(root, host, port, log=sys.stderr) as server:
+        sys.stderr.write(f"Serving {server.root} on {server.url}/\n")
+        with contextlib.suppress(KeyboardInterrupt):
+            server.serve_forever()
@@ -1,26 +1,67 @@
+import sys
+
 from app.models import Git
 from app.utils import get_parser
 
 
-def main():
-    git = Git()
+def main(argv: list[str] | None = None, *, git: Git | None = None):
+    git = Git() if git is None else git
     parser = get_parser()
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     match args.command:
         case "init":
             return git.init_repo()
+        case "cat-file" if args.batch or args.batch_check:
+            return git.cat_file_batch(
+                sys.stdin.buffer,
+                sys.stdout.buffer,
+                contents=args.batch,
+                buffer=args.buffer,
+            )
         case "cat-file":
+            if args.hash is None:
+                parser.error("cat-file: an object is required without --batch")
             return git.cat_file(args.hash, pretty_print=args.pretty_print)
         case "hash-object":
             return git.hash_object(args.path, write=args.write)
         case "ls-tree":
             return git.ls_tree(args.hash_value, name_only=args.name_only)
         case "write-tree":
-            return git.create_tree()
+            return git.create_tree(jobs=args.jobs)
         case "commit-tree":
             return git.commit_tree(args.tree_hash, args.message, parent=args.parent)
         case "clone":
-            return git.clone(args.url, args.work_dir)
+            return git.clone(
+                args.url,
+                args.work_dir,
+                jobs=args.jobs,
+                depth=args.depth,
+                filter_spec=args.filter_spec,
+            )
+        case "fetch":
+            return git.fetch(args.remote, jobs=args.jobs)
+        case "mirror":
+            from app.mirror import run
+
+            failed = run(
+                args.manifest,
+                args.dest,
+                concurrency=args.concurrency,
+                jobs=args.jobs,
+            )
+            if failed:
+                sys.exit(1)
+            return None
+        case "repack" | "gc":
+            return git.repack(window=args.window, depth=args.depth)
+        case "http-backend":
+            from app.http_backend import serve
+
+            return serve(args.root, host=args.bind, port=args.port)
+        case "daemon":
+            from app.daemon import serve
+
+            return serve(args.socket)
         case _:
             raise RuntimeError(f"Unknown command #{args.command}")
 
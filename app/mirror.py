@@ -0,0 +1,195 @@
+"""Keep local mirrors of many repositories up to date.
+
+Usage: python -m app.main mirror MANIFEST [DEST] [-c CONCURRENCY]
+
+The manifest lists one repository per line, as a URL optionally followed
+by the directory to mirror it to (by default the last component of the
+URL, without ".git"); blank lines and lines starting with "#" are skipped.
+Repositories missing from DEST are cloned, the others fetched.
+"""
+
+import asyncio
+import contextlib
+import http.client
+import io
+import shutil
+import sys
+import time
+import zlib
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from app.models import Git
+
+__all__ = ["MirrorResult", "MirrorSummary", "mirror", "read_manifest", "run"]
+
+# How cloning or fetching a repository fails: network and HTTP errors, error
+# statuses and server errors (RuntimeError), bad protocol or pack data and
+# local I/O. Anything else is a bug, and stops the mirror run.
+MIRROR_ERRORS = (
+    OSError,
+    EOFError,
+    RuntimeError,
+    ValueError,
+    http.client.HTTPException,
+    zlib.error,
+)
+
+
+@dataclass
+class MirrorResult:
+    url: str
+    path: Path
+    action: str  # "cloned", "fetched", "up to date" or "failed"
+    bytes: int  # of packs received
+    seconds: float
+    error: str | None = None
+
+    def __str__(self):
+        if self.error is not None:
+            return f"{self.path}: failed after {self.seconds:.2f}s: {self.error}"
+        return f"{self.path}: {self.action}, {self.bytes} bytes in {self.seconds:.2f}s"
+
+
+@dataclass
+class MirrorSummary:
+    results: list[MirrorResult] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def failed(self) -> list[MirrorResult]:
+        return [result for result in self.results if result.error is not None]
+
+    @property
+    def bytes(self) -> int:
+        return sum(result.bytes for result in self.results)
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.seconds if self.seconds else float(self.bytes)
+
+    def __str__(self):
+        return (
+            f"Mirrored {len(self.results)} repositories ({len(self.failed)} failed), "
+            f"{self.bytes} bytes in {self.seconds:.2f}s, "
+            f"{self.bytes_per_second / 1024 / 1024:.2f} MiB/s"
+        )
+
+
+def read_manifest(path: Path, dest: Path) -> list[tuple[str, Path]]:
+    """Read the (URL, mirror directory) pairs listed in the manifest at `path`."""
+    repositories = []
+    for line in Path(path).read_text().splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        url, _, name = line.partition(" ")
+        name = name.strip() or urlsplit(url).path.rstrip("/").rpartition("/")[2]
+        repositories.append((url, dest / name.removesuffix(".git")))
+
+    paths = [path for _, path in repositories]
+    duplicates = sorted({str(path) for path in paths if paths.count(path) > 1})
+    if duplicates:
+        raise ValueError(f"Repositories mirrored to the same path: {duplicates}")
+    return repositories
+
+
+def _pack_bytes(work_dir: Path) -> int:
+    pack_dir = work_dir / ".git" / "objects" / "pack"
+    return sum(path.stat().st_size for path in pack_dir.glob("*.pack"))
+
+
+def _mirror_repository(url: str, work_dir: Path, jobs: int) -> MirrorResult:
+    """Process pool worker: clone `url` to `work_dir`, or fetch if it is there.
+
+    Runs in its own process as `fetch` works on the current directory,
+    which also lets the CPU-heavy pack parsing of several repositories run
+    in parallel.
+    """
+    start = time.perf_counter()
+    received = _pack_bytes(work_dir)
+    new = not work_dir.exists()
+    try:
+        # Progress lines of many repositories would interleave: report instead
+        with contextlib.redirect_stderr(io.StringIO()):
+            if (work_dir / ".git").exists():
+                with contextlib.chdir(work_dir):
+                    action = "fetched" if Git().fetch(jobs=jobs) else "up to date"
+            else:
+                Git().clone(url, work_dir, jobs=jobs)
+                action = "cloned"
+    except BaseException as e:
+        if new:
+            # Or the next run would take a half-done clone for a mirror
+            shutil.rmtree(work_dir, ignore_errors=True)
+        if not isinstance(e, MIRROR_ERRORS):
+            raise
+        return MirrorResult(
+            url,
+            work_dir,
+            "failed",
+            0,
+            time.perf_counter() - start,
+            error=f"{type(e).__name__}: {e}",
+        )
+    return MirrorResult(
+        url,
+        work_dir,
+        action,
+        _pack_bytes(work_dir) - received,
+        time.perf_counter() - start,
+    )
+
+
+async def mirror(
+    repositories: list[tuple[str, Path]],
+    *,
+    concurrency: int = 4,
+    jobs: int = 1,
+    report: Callable[[MirrorResult], None] | None = None,
+) -> MirrorSummary:
+    """Clone or fetch every (URL, directory) of `repositories`.
+
+    At most `concurrency` repositories are mirrored at a time, each in a
+    worker process, with `jobs` processes of its own to resolve deltas.
+    Every result is passed to `report` as soon as it is known; a failure
+    does not stop the other repositories.
+    """
+    loop = asyncio.get_running_loop()
+    summary = MirrorSummary()
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=concurrency) as executor:
+        tasks = [
+            loop.run_in_executor(
+                executor, _mirror_repository, url, Path(path).absolute(), jobs
+            )
+            for url, path in repositories
+        ]
+        for task in asyncio.as_completed(tasks):
+            result = await task
+            summary.results.append(result)
+            if report is not None:
+                report(result)
+    summary.seconds = time.perf_counter() - start
+    return summary
+
+
+def run(manifest: Path, dest: Path, *, concurrency: int = 4, jobs: int = 1) -> int:
+    """Mirror the repositories of `manifest` below `dest`, printing a report.
+
+    Returns the number of repositories that failed.
+    """
+    dest.mkdir(parents=True, exist_ok=True)
+    summary = asyncio.run(
+        mirror(
+            read_manifest(manifest, dest),
+            concurrency=concurrency,
+            jobs=jobs,
+            report=lambda result: print(result, flush=True),
+        )
+    )
+    sys.stderr.write(f"{summary}\n")
+    return len(summary.failed)
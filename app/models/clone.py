@@ -1,13 +1,69 @@
-import hashlib
+import io
+import itertools
+import os
 import re
-import struct
-import zlib
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
+from functools import partial
 from pathlib import Path
-from urllib.request import Request, urlopen
+from queue import Full, Queue
+from typing import BinaryIO
+
+from app.models.index import CachedTree, GitIndex, IndexEntry
+from app.models.pack import (
+    CHUNK_SIZE,
+    DELTA_BASE_CACHE_SIZE,
+    OBJ_BLOB,
+    OBJ_COMMIT,
+    OBJ_OFS_DELTA,
+    OBJ_REF_DELTA,
+    OBJ_TREE,
+    TYPE_NAMES,
+    PackData,
+    PackEntry,
+    PackHeader,
+    PackObject,
+    PackStream,
+    complete_thin_pack,
+    compute_sha1,
+    resolve_deltas,
+    resolve_deltas_parallel,
+    write_pack_index,
+)
+from app.models.transport import HttpTransport
 
 DEFAULT_URL = "https://github.com/octocat/Hello-World"
 
+# Object filters of partial clones that we know how to fill in
+FILTER_SPEC = re.compile(r"blob:none|blob:limit=\d+[kmg]?")
+
+# Refs listed by a protocol v2 server unless asked for others
+DEFAULT_REF_PREFIXES = ("HEAD", "refs/heads/")
+
+# Haves sent per negotiation round, and how many may go unacknowledged in
+# a row before giving up on finding more common commits, as git does
+HAVE_BATCH_SIZE = 32
+MAX_UNACKED_HAVES = 256
+
+# Response chunks received ahead of the pack parser before the network
+# thread waits for it, so at most this many CHUNK_SIZE chunks are buffered
+RECEIVE_QUEUE_SIZE = 64
+# Files read from the pack but not written yet, per checkout worker
+PENDING_WRITES_PER_WORKER = 4
+
+# Special pkt-lines: end of a message, end of a section (protocol v2 only)
+FLUSH_PKT = b"0000"
+DELIM_PKT = b"0001"
+
+# Tree entry modes
+MODE_TREE = "40000"
+MODE_EXECUTABLE = "100755"
+MODE_SYMLINK = "120000"
+MODE_GITLINK = "160000"
+
 REGEX = re.compile(
     r"""
 (.{4})  # Length
@@ -19,6 +75,50 @@ REGEX = re.compile(
 )
 
 
+def _prefetch(chunks: Iterator[bytes], *, maxsize: int) -> Iterator[bytes]:
+    """Pull `chunks` on a thread of their own, up to `maxsize` ahead of the reader.
+
+    The network keeps receiving while earlier chunks are parsed. When the
+    queue is full the thread waits, and TCP flow control holds the sender
+    back. Errors are raised to the reader; a reader that stops early stops
+    the thread, which closes `chunks`.
+    """
+    queue: Queue = Queue(maxsize)
+    stop = threading.Event()
+    end = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def receive():
+        try:
+            for chunk in chunks:
+                if not put(chunk):
+                    return
+            put(end)
+        except BaseException as e:  # noqa: BLE001 - raised again by the consumer
+            put(e)
+        finally:
+            chunks.close()
+
+    thread = threading.Thread(target=receive, name="pack-receiver", daemon=True)
+    thread.start()
+    try:
+        while (item := queue.get()) is not end:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
 @dataclass
 class GitRef:
     length: int
@@ -34,103 +134,20 @@ class GitRef:
 
 
 @dataclass
-class PackHeader:
-    version: int
-    num_objects: int
-
-    @classmethod
-    def from_bytes(cls, data: bytes):
-        version, num_objects = struct.unpack('>II', data[4:12])
-        return cls(version, num_objects)
-
-@dataclass
-class PackObject:
-    type: int
-    size: int
-    data: bytes
-    pack_offset: int = 0  # offset in pack file where this object starts
-
-
-# Object type constants
-OBJ_COMMIT = 1
-OBJ_TREE = 2
-OBJ_BLOB = 3
-OBJ_TAG = 4
-OBJ_OFS_DELTA = 6
-OBJ_REF_DELTA = 7
-
-TYPE_NAMES = {
-    OBJ_COMMIT: "commit",
-    OBJ_TREE: "tree",
-    OBJ_BLOB: "blob",
-    OBJ_TAG: "tag",
-}
-
-
-def compute_sha1(obj_type: int, data: bytes) -> str:
-    """Compute git object SHA-1."""
-    type_name = TYPE_NAMES[obj_type]
-    header = f"{type_name} {len(data)}\x00".encode()
-    return hashlib.sha1(header + data).hexdigest()
-
-
-def read_delta_size(delta: bytes, offset: int) -> tuple[int, int]:
-    """Read size varint from delta header."""
-    size = 0
-    shift = 0
-    while True:
-        byte = delta[offset]
-        size |= (byte & 0x7F) << shift
-        offset += 1
-        if not (byte & 0x80):
-            break
-        shift += 7
-    return size, offset
-
-
-def apply_delta(base: bytes, delta: bytes) -> bytes:
-    """Apply delta instructions to base object."""
-    offset = 0
-    _base_size, offset = read_delta_size(delta, offset)
-    _result_size, offset = read_delta_size(delta, offset)
-
-    result = bytearray()
-    while offset < len(delta):
-        cmd = delta[offset]
-        offset += 1
-
-        if cmd & 0x80:  # Copy from base
-            copy_offset = 0
-            copy_size = 0
-            if cmd & 0x01:
-                copy_offset |= delta[offset]
-                offset += 1
-            if cmd & 0x02:
-                copy_offset |= delta[offset] << 8
-                offset += 1
-            if cmd & 0x04:
-                copy_offset |= delta[offset] << 16
-                offset += 1
-            if cmd & 0x08:
-                copy_offset |= delta[offset] << 24
-                offset += 1
-            if cmd & 0x10:
-                copy_size |= delta[offset]
-                offset += 1
-            if cmd & 0x20:
-                copy_size |= delta[offset] << 8
-                offset += 1
-            if cmd & 0x40:
-                copy_size |= delta[offset] << 16
-                offset += 1
-            if copy_size == 0:
-                copy_size = 0x10000
-            result.extend(base[copy_offset:copy_offset + copy_size])
-        elif cmd:  # Insert literal (cmd = number of bytes)
-            result.extend(delta[offset:offset + cmd])
-            offset += cmd
-
-    return bytes(result)
+class CheckoutStats:
+    files: int
+    bytes: int
+    seconds: float
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files / self.seconds if self.seconds else float(self.files)
+
+    def __str__(self):
+        return (
+            f"Checked out {self.files} files ({self.bytes} bytes) "
+            f"in {self.seconds:.2f}s, {self.files_per_second:.0f} files/s"
+        )
 
 
 class RefParser:
@@ -153,22 +170,126 @@ class RefParser:
             refs[ref_obj.ref_name] = ref_obj
         return refs, capabilities
 
+    @staticmethod
+    def parse_capabilities_v2(lines: list[bytes]) -> dict[str, list[str]]:
+        """Map each command of a protocol v2 advertisement to its features."""
+        capabilities = {}
+        for line in lines:
+            name, _, value = line.decode().partition("=")
+            capabilities[name] = value.split()
+        return capabilities
+
+    @staticmethod
+    def parse_ls_refs(lines: list[bytes]) -> dict[str, GitRef]:
+        """Parse the "<sha1> <name> [attributes...]" lines of an ls-refs reply."""
+        refs = {}
+        for line in lines:
+            sha1, ref_name, *_ = line.decode().split(" ")
+            refs[ref_name] = GitRef(len(line) + 4, sha1, ref_name)
+        return refs
+
 
 class GitClone:
-    def __init__(self, repo_url: str):
+    def __init__(
+        self,
+        repo_url: str,
+        *,
+        delta_cache_size: int = DELTA_BASE_CACHE_SIZE,
+        jobs: int = 1,
+        checkout_workers: int | None = None,
+        depth: int | None = None,
+        filter_spec: str | None = None,
+        ref_prefixes: Iterable[str] = DEFAULT_REF_PREFIXES,
+        transport: HttpTransport | None = None,
+    ):
+        if filter_spec is not None and not FILTER_SPEC.fullmatch(filter_spec):
+            raise ValueError(f"Unsupported filter: {filter_spec}")
         self.repo_url = str(repo_url)
+        self.delta_cache_size = delta_cache_size
+        self.jobs = jobs
+        self.checkout_workers = checkout_workers  # None: ThreadPoolExecutor default
+        self.depth = depth  # None: full history
+        self.filter_spec = filter_spec  # None: every object
+        # Refs a protocol v2 server is asked to list
+        self.ref_prefixes = tuple(ref_prefixes)
+        # Commits whose parents were cut off by `depth`, once the pack arrives
+        self.shallow: set[str] = set()
+        self.protocol_version = 0
+        # Every request of the session shares its connection to the remote
+        self._owns_transport = transport is None
+        self.transport = HttpTransport() if transport is None else transport
 
     def __enter__(self):
-        self.refs, self.capabilities = RefParser.parse_refs(self._fetch_refs())
+        advertisement = self._fetch_refs()
+        stream = io.BytesIO(advertisement)
+        line = self._read_pkt_line(stream)
+        if line is not None and line.startswith(b"# service="):
+            self._read_pkt_line(stream)  # flush after the service line
+            line = self._read_pkt_line(stream)
+
+        if line == b"version 2":
+            # Only the capabilities were advertised, refs are listed on request
+            self.protocol_version = 2
+            lines = []
+            while (line := self._read_pkt_line(stream)) is not None:
+                lines.append(line)
+            commands = RefParser.parse_capabilities_v2(lines)
+            if "ls-refs" not in commands or "fetch" not in commands:
+                raise RuntimeError("Server does not support ls-refs and fetch")
+            # Features of the fetch command, checked like v0 capabilities
+            self.capabilities = commands["fetch"]
+            self.refs = self._list_refs()
+        else:
+            self.refs, self.capabilities = RefParser.parse_refs(
+                advertisement.decode().splitlines()
+            )
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        pass
+        if self._owns_transport:
+            self.transport.close()
+
+    def _fetch_refs(self) -> bytes:
+        """Fetch the ref advertisement, in protocol v2 if the server speaks it.
 
-    def _fetch_refs(self):
+        Servers that do not know v2 ignore the Git-Protocol header and
+        advertise every ref in v0.
+        """
         discover_url = f"{self.repo_url}/info/refs?service=git-upload-pack"
-        with urlopen(discover_url) as response:
-            return response.read().decode().splitlines()
+        headers = {"Git-Protocol": "version=2"}
+        with self.transport.request(discover_url, headers=headers) as response:
+            return response.read()
+
+    def _list_refs(self) -> dict[str, GitRef]:
+        """List the refs under `ref_prefixes` with the v2 ls-refs command."""
+        body_parts = [
+            self.format_pkt_line("command=ls-refs\n"),
+            DELIM_PKT,
+            *(
+                self.format_pkt_line(f"ref-prefix {prefix}\n")
+                for prefix in self.ref_prefixes
+            ),
+            FLUSH_PKT,
+        ]
+        with self._upload_pack(b"".join(body_parts)) as response:
+            lines = []
+            while (line := self._read_pkt_line(response)) is not None:
+                lines.append(line)
+        return RefParser.parse_ls_refs(lines)
+
+    @staticmethod
+    def _read_pkt_line(stream: BinaryIO) -> bytes | None:
+        """Read one pkt-line without its trailing newline.
+
+        Returns None for a flush or delimiter packet.
+        """
+        pkt_len = int(stream.read(4), 16)
+        if pkt_len < 4:
+            return None
+        line = stream.read(pkt_len - 4)
+        if line.startswith(b"ERR "):
+            raise RuntimeError(f"Server error: {line[4:].decode().strip()}")
+        return line.removesuffix(b"\n")
 
     @staticmethod
     def format_pkt_line(payload: str | bytes) -> bytes:
@@ -181,58 +302,298 @@ class GitClone:
         hex_length = f"{length:04x}"
         return hex_length.encode() + payload
 
-    def send_want_request(self):
-        body_parts = [
-            self.format_pkt_line(f"want {self.refs['HEAD'].sha1}"),
-            b"0000",
-            self.format_pkt_line("done\n"),
-        ]
+    def send_want_request(self, *, sink: BinaryIO | None = None) -> PackStream:
+        """Request the pack of HEAD, limited by `depth` and `filter_spec`."""
+        capabilities = []
+        arguments = []
+        if self.depth is not None:
+            if "shallow" not in self.capabilities:
+                raise RuntimeError("Server does not support shallow clones")
+            arguments.append(f"deepen {self.depth}")
+        self._add_filter(capabilities, arguments)
+        return self._request_pack(
+            [self.refs["HEAD"].sha1],
+            arguments,
+            capabilities=capabilities,
+            sink=sink,
+            shallow=self.depth is not None,
+        )
 
-        # Combine all parts
-        request_body = b"".join(body_parts)
+    def send_objects_request(
+        self, sha1s: Iterable[str], *, sink: BinaryIO | None = None
+    ) -> PackStream:
+        """Request a pack of exactly `sha1s`, e.g. blobs a partial clone left out.
+
+        The server must be willing to serve objects that are not ref tips,
+        as smart-HTTP servers are for reachable objects.
+        """
+        return self._request_pack(list(sha1s), [], sink=sink, shallow=False)
+
+    def send_fetch_request(
+        self,
+        wants: list[str],
+        haves: Iterable[str],
+        *,
+        on_common: Callable[[str], None] | None = None,
+        shallow: Iterable[str] = (),
+        sink: BinaryIO | None = None,
+    ) -> PackStream:
+        """Request a thin pack of `wants`, leaving out what we share with the remote.
+
+        `haves` are local commits, newest first, and `shallow` the commits
+        whose parents we lack. The commits in common are negotiated as the
+        pack is first read (see `_negotiate_pack`), and deltas in the pack
+        may use them as bases.
+        """
+        # Strict v0 servers reject capabilities they did not offer
+        ack_modes = ["multi_ack_detailed", "multi_ack"]
+        capabilities = [mode for mode in ack_modes if mode in self.capabilities][:1]
+        if capabilities == ["multi_ack_detailed"] and "no-done" in self.capabilities:
+            capabilities.append("no-done")
+        arguments = [f"shallow {sha1}" for sha1 in shallow]
+        self._add_filter(capabilities, arguments)
+        fetch_body = partial(
+            self._fetch_body,
+            wants,
+            arguments,
+            capabilities=capabilities,
+            thin_pack=True,
+        )
+        chunks = self._negotiate_pack(fetch_body, haves, on_common=on_common)
+        return PackStream(_prefetch(chunks, maxsize=RECEIVE_QUEUE_SIZE), sink=sink)
+
+    def _negotiate_pack(
+        self,
+        fetch_body: Callable[..., bytes],
+        haves: Iterable[str],
+        *,
+        on_common: Callable[[str], None] | None,
+    ) -> Iterator[bytes]:
+        """Find the commits of `haves` that the remote has too, then yield the pack.
+
+        Haves go out HAVE_BATCH_SIZE per round, each round repeating the
+        commits acknowledged so far as the stateless HTTP transport
+        requires, until the remote is ready to send the pack, `haves` run
+        out or MAX_UNACKED_HAVES in a row found nothing in common. Every new
+        common commit is passed to `on_common`, so that `haves` can skip
+        its ancestors. A ready v2 remote (or v0 one allowed "no-done") sends
+        the pack in reply to the last round, anyone else once we are done.
+        """
+        haves = iter(haves)
+        if self.protocol_version == 0 and "multi_ack_detailed" not in self.capabilities:
+            # The remote only acknowledges haves once we are done: send some
+            common = list(itertools.islice(haves, MAX_UNACKED_HAVES))
+            haves = iter(())
+        else:
+            common = []
+
+        pack_follows_ready = (
+            self.protocol_version == 2 or "no-done" in self.capabilities
+        )
+        unacked = 0
+        while unacked < MAX_UNACKED_HAVES:
+            batch = list(itertools.islice(haves, HAVE_BATCH_SIZE))
+            if not batch:
+                break
+            body = fetch_body(haves=common + batch, done=False)
+            with self._upload_pack(body) as response:
+                acknowledged, ready = self._read_acknowledgments(response)
+                new = [sha1 for sha1 in acknowledged if sha1 not in common]
+                for sha1 in new:
+                    common.append(sha1)
+                    if on_common is not None:
+                        on_common(sha1)
+                if ready and pack_follows_ready:
+                    if self.protocol_version == 2:
+                        self._read_sections(response)
+                    yield from self._demux_pack_data(response)
+                    return
+            unacked = 0 if new else unacked + len(batch)
+            if ready:
+                break
 
-        # Send POST request
-        upload_pack_url = f"{self.repo_url}/git-upload-pack"
-        request = Request(
-            upload_pack_url,
+        yield from self._stream_pack_data(fetch_body(haves=common), shallow=False)
+
+    def _read_acknowledgments(self, stream: BinaryIO) -> tuple[list[str], bool]:
+        """Read the reply to a negotiation round: (acknowledged SHA-1s, ready)."""
+        if (
+            self.protocol_version == 2
+            and (header := self._read_pkt_line(stream)) != b"acknowledgments"
+        ):
+            raise ValueError(f"Unexpected fetch response section: {header!r}")
+        acknowledged = []
+        ready = False
+        while (line := self._read_pkt_line(stream)) is not None:
+            if line == b"NAK" and self.protocol_version == 0:
+                break  # ends every v0 round
+            words = line.decode().split()
+            if words[0] == "ACK":
+                acknowledged.append(words[1])
+                ready = ready or words[2:] == ["ready"]
+            elif words == ["ready"]:
+                ready = True
+        return acknowledged, ready
+
+    def _add_filter(self, capabilities: list[str], arguments: list[str]) -> None:
+        if self.filter_spec is None:
+            return
+        if "filter" not in self.capabilities:
+            raise RuntimeError("Server does not support partial clones")
+        capabilities.append("filter")
+        arguments.append(f"filter {self.filter_spec}")
+
+    def _request_pack(
+        self,
+        wants: list[str],
+        arguments: list[str],
+        *,
+        capabilities: Iterable[str] = (),
+        haves: Iterable[str] = (),
+        thin_pack: bool = False,
+        sink: BinaryIO | None,
+        shallow: bool,
+    ) -> PackStream:
+        """POST a fetch of `wants` with the deepen/filter `arguments`."""
+        body = self._fetch_body(
+            wants,
+            arguments,
+            capabilities=capabilities,
+            haves=haves,
+            thin_pack=thin_pack,
+        )
+        chunks = self._stream_pack_data(body, shallow=shallow)
+        return PackStream(_prefetch(chunks, maxsize=RECEIVE_QUEUE_SIZE), sink=sink)
+
+    def _fetch_body(
+        self,
+        wants: list[str],
+        arguments: list[str],
+        *,
+        capabilities: Iterable[str] = (),
+        haves: Iterable[str] = (),
+        thin_pack: bool = False,
+        done: bool = True,
+    ) -> bytes:
+        """Build an upload-pack request; without `done` it is a negotiation round.
+
+        `capabilities` are only sent in protocol v0, on the first want line;
+        v2 servers infer them from the arguments.
+        """
+        have_lines = [self.format_pkt_line(f"have {sha1}\n") for sha1 in haves]
+        if self.protocol_version == 2:
+            options = ["ofs-delta", "no-progress"]
+            if thin_pack:
+                options.append("thin-pack")
+            body_parts = [
+                self.format_pkt_line("command=fetch\n"),
+                DELIM_PKT,
+                *(self.format_pkt_line(f"want {sha1}\n") for sha1 in wants),
+                *(self.format_pkt_line(f"{option}\n") for option in options),
+                *(self.format_pkt_line(f"{argument}\n") for argument in arguments),
+                *have_lines,
+                *([self.format_pkt_line("done\n")] if done else []),
+                FLUSH_PKT,
+            ]
+        else:
+            capabilities = list(capabilities)
+            # Deltas against what we have, pack data framed apart from progress
+            # and the smaller OFS deltas, where the remote offers them
+            wanted = ["thin-pack"] if thin_pack else []
+            for capability in (*wanted, "side-band-64k", "ofs-delta"):
+                if capability in self.capabilities and capability not in capabilities:
+                    capabilities.append(capability)
+            want_lines = [f"want {sha1}\n" for sha1 in wants]
+            if capabilities:
+                want_lines[0] = f"want {wants[0]} {' '.join(capabilities)}\n"
+            body_parts = [
+                *(self.format_pkt_line(line) for line in want_lines),
+                *(self.format_pkt_line(f"{argument}\n") for argument in arguments),
+                FLUSH_PKT,
+                *have_lines,
+                self.format_pkt_line("done\n") if done else FLUSH_PKT,
+            ]
+        return b"".join(body_parts)
+
+    def _upload_pack(self, request_body: bytes):
+        """POST `request_body` to the remote's upload-pack and return the response."""
+        headers = {
+            "Content-Type": "application/x-git-upload-pack-request",
+            "Accept": "application/x-git-upload-pack-result",
+        }
+        if self.protocol_version == 2:
+            headers["Git-Protocol"] = "version=2"
+        # upload-pack only reads the remote, so a failed request can be resent
+        return self.transport.request(
+            f"{self.repo_url}/git-upload-pack",
             data=request_body,
-            headers={"Content-Type": "application/x-git-upload-pack-request"},
-            method="POST",
+            headers=headers,
+            idempotent=True,
         )
 
-        with urlopen(request) as response:
-            data = response.read()
+    def _stream_pack_data(
+        self, request_body: bytes, *, shallow: bool
+    ) -> Iterator[bytes]:
+        """Keep the upload-pack response open while the pack is consumed."""
+        with self._upload_pack(request_body) as response:
+            if self.protocol_version == 2:
+                self._read_sections(response)
+            elif shallow:
+                self.shallow = self._read_shallow_info(response)
+            yield from self._demux_pack_data(response)
+
+    def _read_sections(self, stream: BinaryIO) -> None:
+        """Read the sections of a v2 fetch response up to its packfile."""
+        while (header := self._read_pkt_line(stream)) != b"packfile":
+            if header == b"shallow-info":
+                self.shallow = self._read_shallow_info(stream)
+            elif header is None:
+                raise ValueError("Fetch response ended before the packfile")
+            else:
+                # acknowledgments, wanted-refs, packfile-uris: nothing we need
+                while self._read_pkt_line(stream) is not None:
+                    pass
 
-        return self._extract_pack_data(data)
+    @classmethod
+    def _read_shallow_info(cls, stream: BinaryIO) -> set[str]:
+        """Read the shallow/unshallow lines sent ahead of a deepened pack."""
+        shallow = set()
+        while (line := cls._read_pkt_line(stream)) is not None:
+            command, _, sha1 = line.decode().strip().partition(" ")
+            if command == "shallow":
+                shallow.add(sha1)
+            elif command == "unshallow":
+                shallow.discard(sha1)
+            else:
+                raise ValueError(f"Unexpected line in shallow info: {line!r}")
+        return shallow
 
     @staticmethod
-    def _extract_pack_data(data: bytes) -> bytes:
-        """Extract pack data from sideband-encoded response."""
-        offset = 0
-        pack_data = b""
-
-        while offset < len(data):
+    def _demux_pack_data(
+        stream: BinaryIO, *, chunk_size: int = CHUNK_SIZE
+    ) -> Iterator[bytes]:
+        """Yield pack data from a (possibly sideband-encoded) response as it arrives."""
+        while True:
             # Read 4-byte hex length
-            pkt_len_hex = data[offset:offset + 4]
+            pkt_len_hex = stream.read(4)
             if len(pkt_len_hex) < 4:
-                break
+                return
 
             # Check if this looks like a hex length or raw PACK data
             try:
                 pkt_len = int(pkt_len_hex, 16)
             except ValueError:
                 # Not hex - might be raw PACK data (no sideband)
-                if data[offset:offset + 4] == b"PACK":
-                    return data[offset:]
-                break
+                if pkt_len_hex == b"PACK":
+                    yield pkt_len_hex
+                    while chunk := stream.read(chunk_size):
+                        yield chunk
+                return
 
             if pkt_len == 0:  # flush packet
-                offset += 4
-                break  # end of response
+                return  # end of response
 
             # Get packet content (excluding length prefix)
-            pkt_content = data[offset + 4:offset + pkt_len]
-            offset += pkt_len
+            pkt_content = stream.read(pkt_len - 4)
 
             # Check for NAK/ACK lines
             if pkt_content.startswith(b"NAK"):
@@ -244,126 +605,139 @@ class GitClone:
             if len(pkt_content) > 0:
                 channel = pkt_content[0]
                 if channel == 1:  # pack data channel
-                    pack_data += pkt_content[1:]
+                    yield pkt_content[1:]
                 elif channel == 2:  # progress channel
                     continue
                 elif channel == 3:  # error channel
                     raise RuntimeError(f"Server error: {pkt_content[1:].decode()}")
                 elif pkt_content.startswith(b"PACK"):
                     # No sideband, raw pack data starting in this packet
-                    return pkt_content
-
-        return pack_data
+                    yield pkt_content
+                    while chunk := stream.read(chunk_size):
+                        yield chunk
+                    return
 
-    def parse_pack_header(self, data: bytes) -> PackHeader:
+    def parse_pack_header(self, pack: PackStream) -> PackHeader:
         """Parse pack file header, return (version, num_objects)."""
-        return PackHeader.from_bytes(data)
-
-    def parse_pack_objects(self, data: bytes, num_objects: int) -> list[PackObject]:
-        offset = 12  # skip header
-        objects = []
-        objects_by_offset = {}  # for ofs_delta lookup
-        objects_by_sha1 = {}    # for ref_delta lookup
-
-        # First pass: parse all objects
+        return PackHeader.from_bytes(pack.read(12))
+
+    def parse_pack_objects(
+        self,
+        pack: PackStream,
+        num_objects: int,
+        *,
+        on_object: Callable[[PackEntry, bytes], None] | None = None,
+    ) -> list[PackEntry]:
+        """Index objects as the pack streams in, inflating each entry in turn.
+
+        Only non-delta objects can be hashed at this point; their content is
+        passed to `on_object`, if given, then dropped, and deltas are
+        resolved afterwards from the stored pack by `resolve_deltas`.
+        """
+        entries = []
         for _ in range(num_objects):
-            obj_start = offset
+            obj_start = pack.offset
+            pack.crc32 = 0
 
             # Read variable-length header
-            byte = data[offset]
+            byte = pack.read_byte()
             obj_type = (byte >> 4) & 0x07
             size = byte & 0x0F
             shift = 4
-            offset += 1
 
             while byte & 0x80:  # continue bit set
-                byte = data[offset]
+                byte = pack.read_byte()
                 size |= (byte & 0x7F) << shift
                 shift += 7
-                offset += 1
 
             # Handle delta base references
-            delta_base_offset = None
-            delta_base_sha1 = None
+            delta_base = None
 
             if obj_type == OBJ_OFS_DELTA:
                 # Read negative offset (variable-length encoding)
-                byte = data[offset]
+                byte = pack.read_byte()
                 delta_base_offset = byte & 0x7F
-                offset += 1
                 while byte & 0x80:
-                    byte = data[offset]
+                    byte = pack.read_byte()
                     delta_base_offset = ((delta_base_offset + 1) << 7) | (byte & 0x7F)
-                    offset += 1
-                delta_base_offset = obj_start - delta_base_offset
+                delta_base = obj_start - delta_base_offset
 
             elif obj_type == OBJ_REF_DELTA:
                 # Read 20-byte base SHA-1
-                delta_base_sha1 = data[offset:offset + 20].hex()
-                offset += 20
+                delta_base = pack.read(20).hex()
 
             # Decompress zlib data
-            decompressor = zlib.decompressobj()
-            decompressed = decompressor.decompress(data[offset:])
-            offset += len(data[offset:]) - len(decompressor.unused_data)
-
-            obj = PackObject(obj_type, size, decompressed, obj_start)
-            obj._delta_base_offset = delta_base_offset
-            obj._delta_base_sha1 = delta_base_sha1
-
-            objects.append(obj)
-            objects_by_offset[obj_start] = obj
+            data_offset = pack.offset
+            decompressed = pack.inflate(size)
 
+            entry = PackEntry(
+                obj_start, obj_type, size, data_offset, pack.crc32, delta_base
+            )
             # Index non-delta objects by SHA-1
             if obj_type in TYPE_NAMES:
-                sha1 = compute_sha1(obj_type, decompressed)
-                objects_by_sha1[sha1] = obj
-
-        # Second pass: resolve deltas
-        def resolve(obj: PackObject) -> PackObject:
-            if obj.type == OBJ_OFS_DELTA:
-                base_obj = resolve(objects_by_offset[obj._delta_base_offset])
-                resolved_data = apply_delta(base_obj.data, obj.data)
-                obj.data = resolved_data
-                obj.type = base_obj.type
-                obj.size = len(resolved_data)
-            elif obj.type == OBJ_REF_DELTA:
-                base_obj = resolve(objects_by_sha1[obj._delta_base_sha1])
-                resolved_data = apply_delta(base_obj.data, obj.data)
-                obj.data = resolved_data
-                obj.type = base_obj.type
-                obj.size = len(resolved_data)
-            return obj
-
-        for obj in objects:
-            resolve(obj)
-
-        return objects
-
-    @staticmethod
-    def store_object(obj: PackObject, git_dir: Path) -> str:
-        """Store a single object to .git/objects as loose object. Returns SHA-1."""
-        type_name = TYPE_NAMES[obj.type]
-        header = f"{type_name} {len(obj.data)}\x00".encode()
-        store_data = header + obj.data
+                entry.sha1 = compute_sha1(obj_type, decompressed)
+                if on_object is not None:
+                    on_object(entry, decompressed)
+            entries.append(entry)
 
-        sha1 = hashlib.sha1(store_data).hexdigest()
-        obj_dir = git_dir / "objects" / sha1[:2]
-        obj_path = obj_dir / sha1[2:]
+        return entries
 
-        if not obj_path.exists():
-            obj_dir.mkdir(parents=True, exist_ok=True)
-            compressed = zlib.compress(store_data)
-            obj_path.write_bytes(compressed)
+    def resolve_deltas(
+        self,
+        entries: list[PackEntry],
+        pack_path: Path,
+        *,
+        resolve_ref: Callable[[str], PackObject] | None = None,
+    ) -> str | None:
+        """Resolve the type and SHA-1 of every delta entry from the stored pack.
+
+        A thin pack's deltas against objects it does not contain are
+        resolved through `resolve_ref`, and those bases appended to the
+        pack; the completed pack's SHA-1 is returned then, None otherwise.
+        """
+        if self.jobs > 1:
+            resolve_deltas_parallel(
+                pack_path,
+                entries,
+                jobs=self.jobs,
+                cache_size=self.delta_cache_size,
+                resolve_ref=resolve_ref,
+            )
+        else:
+            pack = PackData(pack_path)
+            try:
+                resolve_deltas(
+                    pack,
+                    entries,
+                    cache_size=self.delta_cache_size,
+                    resolve_ref=resolve_ref,
+                )
+            finally:
+                pack.close()
+        if resolve_ref is None:
+            return None
+        return complete_thin_pack(pack_path, entries, resolve_ref)
 
-        return sha1
+    @staticmethod
+    def store_pack(
+        entries: list[PackEntry], pack_sha1: str, pack_path: Path, git_dir: Path
+    ) -> dict[str, PackEntry]:
+        """Move a received pack into .git/objects/pack and write its .idx.
 
-    def store_objects(self, objects: list[PackObject], git_dir: Path) -> dict[str, PackObject]:
-        """Store all objects to .git/objects. Returns dict of sha1 -> object."""
+        Returns dict of sha1 -> entry.
+        """
         stored = {}
-        for obj in objects:
-            sha1 = self.store_object(obj, git_dir)
-            stored[sha1] = obj
+        for entry in entries:
+            stored.setdefault(entry.sha1, entry)
+
+        pack_dir = git_dir / "objects" / "pack"
+        pack_dir.mkdir(parents=True, exist_ok=True)
+        pack_path.replace(pack_dir / f"pack-{pack_sha1}.pack")
+        write_pack_index(
+            pack_dir / f"pack-{pack_sha1}.idx",
+            ((sha1, entry.crc32, entry.offset) for sha1, entry in stored.items()),
+            pack_sha1,
+        )
         return stored
 
     @staticmethod
@@ -397,29 +771,183 @@ class GitClone:
 
             # Find null after name
             null_idx = data.index(b"\x00", space_idx)
-            name = data[space_idx + 1:null_idx].decode()
+            name = data[space_idx + 1 : null_idx].decode()
 
             # Read 20-byte SHA
-            sha1 = data[null_idx + 1:null_idx + 21].hex()
+            sha1 = data[null_idx + 1 : null_idx + 21].hex()
             offset = null_idx + 21
 
             entries.append((mode, name, sha1))
         return entries
 
-    def checkout(self, tree_sha: str, objects: dict[str, PackObject], dest: Path):
-        """Checkout tree to destination directory."""
-        tree_obj = objects[tree_sha]
-        entries = self.parse_tree(tree_obj.data)
-
-        for mode, name, sha1 in entries:
-            obj = objects[sha1]
-            path = dest / name
-
-            if obj.type == OBJ_BLOB:
-                path.write_bytes(obj.data)
-                # Set executable if mode is 100755
-                if mode == "100755":
-                    path.chmod(0o755)
-            elif obj.type == OBJ_TREE:
-                path.mkdir(exist_ok=True)
-                self.checkout(sha1, objects, path)
+    @classmethod
+    def flatten_tree(
+        cls, tree_sha: str, objects: Mapping[str, PackObject]
+    ) -> list[tuple[Path, str, str]]:
+        """List every entry below a tree as (path, mode, sha1), trees included."""
+        entries = []
+        stack = [(Path(), tree_sha)]
+        while stack:
+            prefix, sha1 = stack.pop()
+            for mode, name, entry_sha1 in cls.parse_tree(objects[sha1].data):
+                path = prefix / name
+                entries.append((path, mode, entry_sha1))
+                if mode == MODE_TREE:
+                    stack.append((path, entry_sha1))
+        return entries
+
+    def checkout(
+        self,
+        tree_sha: str,
+        objects: Mapping[str, PackObject],
+        dest: Path,
+        *,
+        index_path: Path | None = None,
+        fetch_missing: Callable[[list[str]], None] | None = None,
+        written: Mapping[str, tuple[IndexEntry, int]] | None = None,
+    ) -> CheckoutStats:
+        """Checkout tree to destination directory.
+
+        `objects` is anything that maps a SHA-1 to its object, such as an
+        ObjectStore. The tree is flattened first and every directory created
+        up front, then files are written concurrently by
+        `self.checkout_workers` threads. When `index_path` is given, an index
+        recording the stat data of every written file, and the SHA-1 of every
+        tree, is saved there. Blobs missing from `objects`, as in a partial
+        clone, are passed to `fetch_missing` before any file is written.
+        Files already written by a `StreamingCheckout` are given in `written`
+        and only recorded in the index.
+        """
+        written = {} if written is None else written
+        start = time.perf_counter()
+        entries = self.flatten_tree(tree_sha, objects)
+        if fetch_missing is not None:
+            missing = {
+                sha1
+                for _, mode, sha1 in entries
+                if mode not in (MODE_TREE, MODE_GITLINK) and sha1 not in objects
+            }
+            if missing:
+                fetch_missing(sorted(missing))
+
+        dest.mkdir(parents=True, exist_ok=True)
+        index = GitIndex()
+        index.add_tree("", CachedTree(tree_sha, 0, 0))
+        files = []
+        for path, mode, sha1 in entries:
+            if mode == MODE_TREE:
+                index.add_tree(path.as_posix(), CachedTree(sha1, 0, 0))
+        for path, mode, sha1 in entries:
+            parents = [
+                "" if parent == Path() else parent.as_posix() for parent in path.parents
+            ]
+            if mode == MODE_TREE:
+                index.trees[parents[0]].subtree_count += 1
+            else:
+                for parent in parents:
+                    index.trees[parent].entry_count += 1
+
+            if mode in (MODE_TREE, MODE_GITLINK):
+                # Submodules are checked out as empty directories
+                (dest / path).mkdir(exist_ok=True)
+            else:
+                files.append((path, mode, sha1))
+            if mode == MODE_GITLINK:
+                index.add(IndexEntry(path.as_posix(), int(mode, 8), sha1))
+
+        def write(entry: tuple[Path, str, str]) -> tuple[IndexEntry, int]:
+            path, mode, sha1 = entry
+            if (done := written.get(path.as_posix())) is not None:
+                return done
+            return self.write_file(dest, path, mode, sha1, objects[sha1].data)
+
+        total_bytes = 0
+        with ThreadPoolExecutor(max_workers=self.checkout_workers) as executor:
+            for entry, size in executor.map(write, files):
+                index.add(entry)
+                total_bytes += size
+
+        if index_path is not None:
+            index.write(index_path)
+        return CheckoutStats(len(files), total_bytes, time.perf_counter() - start)
+
+    @staticmethod
+    def write_file(
+        dest: Path, path: Path, mode: str, sha1: str, data: bytes
+    ) -> tuple[IndexEntry, int]:
+        """Write a blob to `dest / path`; return its index entry and size."""
+        target = dest / path
+        if mode == MODE_SYMLINK:
+            target.unlink(missing_ok=True)
+            os.symlink(data, target)
+        else:
+            target.write_bytes(data)
+            # Set executable if mode is 100755
+            if mode == MODE_EXECUTABLE:
+                target.chmod(0o755)
+        st = target.lstat()
+        return IndexEntry.from_stat(path.as_posix(), int(mode, 8), sha1, st), len(data)
+
+
+class StreamingCheckout:
+    """Write the files of a commit while its pack is still being received.
+
+    Fed every whole object as the pack is parsed (see `add`). Once the
+    commit and its trees have gone by, blobs at those paths are written by
+    `workers` threads as they arrive, at most PENDING_WRITES_PER_WORKER
+    each ahead of the parser, which waits otherwise. Git packs the newest
+    version of a file whole and trees ahead of blobs, so this covers most
+    of a fresh clone's checkout. Files whose tree or blob only arrives as
+    a delta are left to `GitClone.checkout`, given `written`.
+    """
+
+    def __init__(self, commit_sha1: str, dest: Path, *, workers: int | None = None):
+        self.dest = dest
+        self.written: dict[str, tuple[IndexEntry, int]] = {}
+        self._commit = commit_sha1
+        self._trees: dict[str, list[Path]] = {}  # SHA-1 -> paths of trees wanted
+        self._blobs: dict[str, list[tuple[Path, str]]] = {}  # -> (path, mode)
+        # ThreadPoolExecutor's default number of workers
+        workers = workers or min(32, (os.cpu_count() or 1) + 4)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._pending = threading.BoundedSemaphore(workers * PENDING_WRITES_PER_WORKER)
+        self._futures: list[Future] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add(self, entry: PackEntry, data: bytes) -> None:
+        """Take in a whole object just parsed from the pack."""
+        if entry.type == OBJ_COMMIT and entry.sha1 == self._commit:
+            tree_sha1 = GitClone.parse_commit(data)["tree"]
+            self._trees.setdefault(tree_sha1, []).append(Path())
+        elif entry.type == OBJ_TREE and entry.sha1 in self._trees:
+            for prefix in self._trees.pop(entry.sha1):
+                (self.dest / prefix).mkdir(parents=True, exist_ok=True)
+                for mode, name, sha1 in GitClone.parse_tree(data):
+                    if mode == MODE_TREE:
+                        self._trees.setdefault(sha1, []).append(prefix / name)
+                    elif mode != MODE_GITLINK:
+                        self._blobs.setdefault(sha1, []).append((prefix / name, mode))
+        elif entry.type == OBJ_BLOB and entry.sha1 in self._blobs:
+            for path, mode in self._blobs.pop(entry.sha1):
+                self._pending.acquire()
+                future = self._executor.submit(
+                    GitClone.write_file, self.dest, path, mode, entry.sha1, data
+                )
+                future.add_done_callback(lambda _: self._pending.release())
+                self._futures.append(future)
+
+    def close(self) -> dict[str, tuple[IndexEntry, int]]:
+        """Wait for the pending writes; return the files written by path."""
+        try:
+            for future in self._futures:
+                entry, size = future.result()
+                self.written[entry.path] = (entry, size)
+        finally:
+            self._futures.clear()
+            self._executor.shutdown()
+        return self.written
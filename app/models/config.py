@@ -0,0 +1,78 @@
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+
+__all__ = ["GitConfig"]
+
+SECTION = re.compile(r'\[\s*([\w.-]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\]')
+
+
+@dataclass
+class GitConfig:
+    """A repository's .git/config, limited to sections of plain key/value pairs.
+
+    Section and key names are case-insensitive, subsection names are not.
+    Comments are dropped on write.
+    """
+
+    # (section, subsection) -> {key: value}
+    sections: dict[tuple[str, str | None], dict[str, str]] = field(default_factory=dict)
+
+    @classmethod
+    def read(cls, path: Path) -> "GitConfig":
+        """Read `path`, returning an empty config if it does not exist."""
+        try:
+            lines = Path(path).read_text().splitlines()
+        except FileNotFoundError:
+            return cls()
+
+        config = cls()
+        values = None
+        for line in lines:
+            line = line.strip()
+            if not line or line[0] in "#;":
+                continue
+            if match := SECTION.fullmatch(line):
+                section, subsection = match.groups()
+                if subsection is not None:
+                    subsection = re.sub(r"\\(.)", r"\1", subsection)
+                values = config.sections.setdefault((section.lower(), subsection), {})
+            elif values is None:
+                raise ValueError(f"Config entry outside of a section in {path}: {line}")
+            else:
+                key, equals, value = line.partition("=")
+                value = value.strip()
+                if len(value) > 1 and value[0] == value[-1] == '"':
+                    value = re.sub(r"\\(.)", r"\1", value[1:-1])
+                # A key without a value is a boolean set to true
+                values[key.strip().lower()] = value if equals else "true"
+        return config
+
+    def get(
+        self, section: str, key: str, *, subsection: str | None = None, default=None
+    ) -> str | None:
+        values = self.sections.get((section.lower(), subsection), {})
+        return values.get(key.lower(), default)
+
+    def set(self, section: str, key: str, value, *, subsection: str | None = None):
+        values = self.sections.setdefault((section.lower(), subsection), {})
+        if isinstance(value, bool):
+            value = str(value).lower()
+        values[key.lower()] = str(value)
+
+    def write(self, path: Path) -> None:
+        parts = []
+        for (section, subsection), values in self.sections.items():
+            if subsection is None:
+                parts.append(f"[{section}]\n")
+            else:
+                escaped = subsection.replace("\\", "\\\\").replace('"', '\\"')
+                parts.append(f'[{section} "{escaped}"]\n')
+            for key, value in values.items():
+                if any(char in value for char in '#;"\\') or value != value.strip():
+                    value = '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+                parts.append(f"\t{key} = {value}\n")
+        path = Path(path)
+        tmp_path = path.with_name(f"{path.name}.lock")
+        tmp_path.write_text("".join(parts))
+        tmp_path.replace(path)
@@ -0,0 +1,301 @@
+"""Git delta format: copy/insert instruction streams against a base object."""
+
+import sys
+
+try:
+    # Compiled delta engine shipped with dulwich, used when it is installed
+    from dulwich._pack import apply_delta as _compiled_apply_delta
+except ImportError:
+    _compiled_apply_delta = None
+
+__all__ = [
+    "DeltaError",
+    "DeltaIndex",
+    "apply_delta",
+    "create_delta",
+    "read_delta_size",
+]
+
+# Copy size 0 means 64KiB
+DEFAULT_COPY_SIZE = 0x10000
+# Longest copy emitted by create_delta, as git does for older readers
+MAX_COPY_SIZE = 0x10000
+# Longest literal a single insert instruction can carry
+MAX_INSERT_SIZE = 0x7F
+# Bytes of the base indexed together: shorter matches are inserted instead
+DELTA_BLOCK_SIZE = 16
+# Offsets kept for a block repeated in the base, as git's HASH_LIMIT
+MAX_BLOCK_OFFSETS = 64
+
+
+class DeltaError(ValueError):
+    """A delta that does not apply to the given base."""
+
+
+def read_delta_size(delta: bytes, offset: int) -> tuple[int, int]:
+    """Read size varint from delta header."""
+    size = 0
+    shift = 0
+    while True:
+        byte = delta[offset]
+        size |= (byte & 0x7F) << shift
+        offset += 1
+        if not (byte & 0x80):
+            break
+        shift += 7
+    return size, offset
+
+
+def encode_delta_size(size: int) -> bytes:
+    """Encode a size varint of the delta header."""
+    encoded = bytearray()
+    while size >= 0x80:
+        encoded.append(0x80 | (size & 0x7F))
+        size >>= 7
+    encoded.append(size)
+    return bytes(encoded)
+
+
+def _copy_instruction(offset: int, size: int) -> bytes:
+    """Encode a copy from the base, leaving out the zero bytes of both fields."""
+    cmd = 0x80
+    arguments = bytearray()
+    for i in range(4):
+        byte = (offset >> (8 * i)) & 0xFF
+        if byte:
+            cmd |= 1 << i
+            arguments.append(byte)
+    for i in range(3):
+        byte = (size >> (8 * i)) & 0xFF
+        if byte:
+            cmd |= 0x10 << i
+            arguments.append(byte)
+    return bytes([cmd]) + arguments
+
+
+def _match_length(base: bytes, base_offset: int, target: bytes, offset: int) -> int:
+    """Length of the common prefix of base[base_offset:] and target[offset:]."""
+    limit = min(len(base) - base_offset, len(target) - offset)
+    # Gallop with slice comparisons, done in C, then bisect the mismatch
+    low, step = 0, 64
+    while low < limit:
+        high = min(low + step, limit)
+        if (
+            base[base_offset + low : base_offset + high]
+            != target[offset + low : offset + high]
+        ):
+            break
+        low = high
+        step *= 2
+    else:
+        return limit
+    while high - low > 1:
+        middle = (low + high) // 2
+        if (
+            base[base_offset + low : base_offset + middle]
+            == target[offset + low : offset + middle]
+        ):
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+class DeltaIndex:
+    """The aligned DELTA_BLOCK_SIZE blocks of a base, to encode targets against.
+
+    Building the index is the costly part of a delta, so one base tried
+    against several targets is indexed once. A block that repeats in the
+    base keeps up to MAX_BLOCK_OFFSETS offsets, the longest match of which
+    is copied.
+    """
+
+    def __init__(self, base: bytes):
+        self.base = base
+        size = DELTA_BLOCK_SIZE
+        offsets = range(0, len(base) - size + 1, size)
+        # Blocks are hashed whole by the dict, in C, which beats rolling a
+        # fingerprint over the target one byte at a time in Python
+        self._blocks: dict[bytes, int | list[int]] = {}
+        first_of = self._blocks.setdefault
+        repeated = []
+        for block in offsets:
+            if first_of(base[block : block + size], block) != block:
+                repeated.append(block)
+        for block in repeated:
+            key = base[block : block + size]
+            candidates = self._blocks[key]
+            if isinstance(candidates, int):
+                self._blocks[key] = candidates = [candidates]
+            if len(candidates) < MAX_BLOCK_OFFSETS:
+                candidates.append(block)
+
+    def create_delta(
+        self, target: bytes, *, max_size: int | None = None
+    ) -> bytes | None:
+        """Encode `target` as copy/insert instructions against the base.
+
+        Blocks of the base are looked up at every offset of the target,
+        extended forward as far as both agree and backward over the bytes
+        scanned past before the block was found. Returns None as soon as
+        the delta would be larger than `max_size`.
+        """
+        base = self.base
+        find = self._blocks.get
+        size = DELTA_BLOCK_SIZE
+        delta = bytearray(encode_delta_size(len(base)) + encode_delta_size(len(target)))
+        if max_size is None:
+            max_size = sys.maxsize
+
+        def flush_insert(start: int, end: int):
+            for chunk in range(start, end, MAX_INSERT_SIZE):
+                literal = target[chunk : min(chunk + MAX_INSERT_SIZE, end)]
+                delta.append(len(literal))
+                delta.extend(literal)
+
+        insert_start = 0
+        offset = 0
+        last_block = len(target) - size
+        while True:
+            # Past this offset, the pending literal alone would overflow
+            give_up = insert_start + max_size - len(delta)
+            scan_end = min(last_block, give_up)
+            for offset in range(offset, scan_end + 1):  # noqa: B020
+                found = find(target[offset : offset + size])
+                if found is not None:
+                    break
+            else:
+                if scan_end == last_block:
+                    break
+                return None
+
+            if isinstance(found, int):
+                base_offset = found
+                length = size + _match_length(base, found + size, target, offset + size)
+            else:
+                base_offset, length = -1, 0
+                for candidate in found:
+                    match = size + _match_length(
+                        base, candidate + size, target, offset + size
+                    )
+                    if match > length:
+                        base_offset, length = candidate, match
+            while (
+                offset > insert_start
+                and base_offset
+                and target[offset - 1] == base[base_offset - 1]
+            ):
+                offset -= 1
+                base_offset -= 1
+                length += 1
+
+            flush_insert(insert_start, offset)
+            for copied in range(0, length, MAX_COPY_SIZE):
+                copy_size = min(MAX_COPY_SIZE, length - copied)
+                delta += _copy_instruction(base_offset + copied, copy_size)
+            offset += length
+            insert_start = offset
+            if len(delta) > max_size:
+                return None
+
+        flush_insert(insert_start, len(target))
+        if len(delta) > max_size:
+            return None
+        return bytes(delta)
+
+
+def create_delta(
+    base: bytes, target: bytes, *, max_size: int | None = None
+) -> bytes | None:
+    """Encode `target` as a delta against `base`, see DeltaIndex.create_delta."""
+    return DeltaIndex(base).create_delta(target, max_size=max_size)
+
+
+def _apply_delta_python(
+    base: bytes, delta: bytes, offset: int, result_size: int
+) -> bytes:
+    """Run the instruction stream into a buffer preallocated from the header."""
+    base_view = memoryview(base)
+    delta_view = memoryview(delta)
+    delta_size = len(delta)
+    result = bytearray(result_size)
+    out = memoryview(result)
+    pos = 0
+
+    try:
+        while offset < delta_size:
+            cmd = delta[offset]
+            offset += 1
+
+            if cmd & 0x80:  # Copy from base
+                copy_offset = 0
+                copy_size = 0
+                if cmd & 0x01:
+                    copy_offset = delta[offset]
+                    offset += 1
+                if cmd & 0x02:
+                    copy_offset |= delta[offset] << 8
+                    offset += 1
+                if cmd & 0x04:
+                    copy_offset |= delta[offset] << 16
+                    offset += 1
+                if cmd & 0x08:
+                    copy_offset |= delta[offset] << 24
+                    offset += 1
+                if cmd & 0x10:
+                    copy_size = delta[offset]
+                    offset += 1
+                if cmd & 0x20:
+                    copy_size |= delta[offset] << 8
+                    offset += 1
+                if cmd & 0x40:
+                    copy_size |= delta[offset] << 16
+                    offset += 1
+                if copy_size == 0:
+                    copy_size = DEFAULT_COPY_SIZE
+                end = pos + copy_size
+                # Slice assignment fails on a short slice of either side, which
+                # bounds-checks the copy against both the base and the result
+                out[pos:end] = base_view[copy_offset : copy_offset + copy_size]
+                pos = end
+            elif cmd:  # Insert literal (cmd = number of bytes)
+                end = pos + cmd
+                out[pos:end] = delta_view[offset : offset + cmd]
+                offset += cmd
+                pos = end
+            else:
+                raise DeltaError("Invalid delta opcode 0")
+    except DeltaError:
+        raise
+    except (ValueError, IndexError) as e:
+        raise DeltaError(f"Corrupt delta at offset {offset}") from e
+    finally:
+        out.release()
+
+    if pos != result_size:
+        raise DeltaError(f"Delta produced {pos} bytes, expected {result_size}")
+    return bytes(result)
+
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    """Apply delta instructions to base object.
+
+    The base and result sizes declared in the delta header are checked, and
+    a compiled engine is used when one is available.
+    """
+    base_size, offset = read_delta_size(delta, 0)
+    result_size, offset = read_delta_size(delta, offset)
+    if base_size != len(base):
+        raise DeltaError(f"Delta expects a {base_size} byte base, got {len(base)}")
+
+    if _compiled_apply_delta is not None:
+        try:
+            result = b"".join(_compiled_apply_delta(base, delta))
+        except Exception as e:
+            raise DeltaError(str(e)) from e
+        if len(result) != result_size:
+            raise DeltaError(
+                f"Delta produced {len(result)} bytes, expected {result_size}"
+            )
+        return result
+    return _apply_delta_python(base, delta, offset, result_size)
@@ -1,22 +1,48 @@
 import binascii
 import hashlib
+import heapq
+import os
 import pathlib
 import re
+import stat
 import sys
 import zlib
-from dataclasses import dataclass
+from contextlib import nullcontext, suppress
+from dataclasses import dataclass, field
 from enum import StrEnum, auto
+from functools import partial
 
 __all__ = ["Git"]
 
+from collections.abc import Callable, Iterable, Iterator
 from operator import attrgetter
-
 from os import PathLike
-from typing import Iterator
+from typing import TYPE_CHECKING, BinaryIO
+
+from app.models.config import GitConfig
+from app.models.index import CachedTree, GitIndex, IndexEntry
+from app.models.pack import (
+    DELTA_DEPTH,
+    DELTA_WINDOW,
+    OBJ_COMMIT,
+    OBJ_TREE,
+    TYPE_NAMES,
+)
+from app.models.store import ObjectStore
 
-from app.models.clone import GitClone
+if TYPE_CHECKING:
+    from concurrent.futures import ThreadPoolExecutor
+
+    from app.models.clone import GitClone
+    from app.models.pack import PackEntry, PackObject, PackStream
 
 NULL_BYTE = b"\x00"
+EXECUTABLE_MODE = "100755"
+SHA1_PATTERN = re.compile(r"[0-9a-f]{40}")
+# Objects a partial clone fetches per request
+FETCH_BATCH_SIZE = 1000
+# Files are hashed and compressed in chunks of this size, whatever their size
+BLOB_CHUNK_SIZE = 1024 * 1024
 
 
 class GitObject(StrEnum):
@@ -35,6 +61,72 @@ class GitObject(StrEnum):
                 raise ValueError(f"Invalid GitObject: {self}")
 
 
+@dataclass
+class _ScannedTree:
+    """A work tree directory listed for write-tree, in git's entry order."""
+
+    key: str  # path relative to the work tree, "" for its root
+    # (name, mode, SHA-1, future SHA-1 or subtree, (path, stat) of files)
+    entries: list[tuple] = field(default_factory=list)
+    clean: bool = True  # every file directly inside it is stat-clean
+
+
+class _HaveWalker:
+    """Local commits, newest first, to offer as haves when fetching.
+
+    Once the remote acknowledges a commit (`mark_common`), its ancestors
+    are known to be common as well and are walked past without being
+    offered. The walk ends when only common commits are left.
+    """
+
+    def __init__(self, store: ObjectStore, tips: Iterable[str]):
+        self.store = store
+        self.common: set[str] = set()
+        self._parents: dict[str, list[str]] = {}
+        self._tips = tips
+
+    def mark_common(self, sha1: str) -> None:
+        self.common.add(sha1)
+        self.common.update(self._parents.get(sha1, ()))
+
+    def _commit_time(self, sha1: str) -> int:
+        obj = self.store[sha1]
+        timestamp = 0
+        parents = []
+        for line in obj.data.split(b"\n"):
+            if not line:
+                break
+            if line.startswith(b"parent "):
+                parents.append(line[7:].decode())
+            elif line.startswith(b"committer "):
+                timestamp = int(line.rsplit(b" ", 2)[1])
+        self._parents[sha1] = parents
+        return timestamp
+
+    def __iter__(self) -> Iterator[str]:
+        seen = set()
+        queue = []  # (-commit time, SHA-1), a max-heap on time
+        for sha1 in self._tips:
+            if sha1 in seen or sha1 not in self.store:
+                continue
+            # Tags may point at anything, only commits are negotiated
+            if self.store.read_header(sha1)[0] == OBJ_COMMIT:
+                seen.add(sha1)
+                heapq.heappush(queue, (-self._commit_time(sha1), sha1))
+        while queue and not all(sha1 in self.common for _, sha1 in queue):
+            _, sha1 = heapq.heappop(queue)
+            parents = self._parents[sha1]
+            if sha1 in self.common:
+                self.common.update(parents)
+            else:
+                yield sha1
+            for parent in parents:
+                # Parents cut off by a shallow clone are not here
+                if parent not in seen and parent in self.store:
+                    seen.add(parent)
+                    heapq.heappush(queue, (-self._commit_time(parent), parent))
+
+
 @dataclass(frozen=True, kw_only=True)
 class TreeEntry:
     mode: bytes
@@ -49,9 +141,14 @@ class TreeEntry:
 class Git:
     ignore_patterns = {".git", "__pycache__", ".pytest_cache", ".venv", "HEAD"}
 
-    def __init__(self):
-        self.git_folder = pathlib.Path(".git")
+    def __init__(self, git_folder: PathLike = ".git"):
+        self.git_folder = pathlib.Path(git_folder)
         self.objects_folder = self.git_folder / "objects"
+        self.index_path = self.git_folder / "index"
+        # The stat data and trees of the last write-tree, in the index format:
+        # .git/index itself is the staging area, not ours to rewrite
+        self.tree_cache_path = self.git_folder / "python-git-cache"
+        self.store = ObjectStore(self.objects_folder)
 
     @staticmethod
     def init_repo():
@@ -62,18 +159,57 @@ class Git:
             new_path.mkdir(exist_ok=False, parents=True)
         with pathlib.Path(".git/HEAD").open("w") as f:
             f.write("ref: refs/heads/main\n")
-        return
 
     def cat_file(self, hash_: str, *, pretty_print: bool = False):
         from app.models import Blob
 
-        path = self.objects_folder / hash_[:2] / hash_[2:]
-        with path.open("rb") as f:
-            data = zlib.decompress(f.read())
-        header, _, body = data.partition(NULL_BYTE)
+        try:
+            obj = self.store.read(hash_)
+        except KeyError:
+            # Left out by a partial clone?
+            if not self.fetch_promised([hash_]):
+                raise
+            obj = self.store.read(hash_)
+        header = f"{TYPE_NAMES[obj.type]} {len(obj.data)}".encode()
         if pretty_print:
-            sys.stdout.write(body.decode())
-        return Blob(header=header, body=body)
+            sys.stdout.write(obj.data.decode())
+        return Blob(header=header, body=obj.data)
+
+    def cat_file_batch(
+        self,
+        stdin: BinaryIO,
+        stdout: BinaryIO,
+        *,
+        contents: bool = True,
+        buffer: bool = False,
+    ) -> None:
+        """Describe every object named on `stdin`, one SHA-1 per line.
+
+        Writes a "<sha1> <type> <size>" line, followed by the content and a
+        newline when `contents` is set, or a "<name> missing" line. Output is
+        flushed after every object unless `buffer` is set, so that a caller
+        can wait for each answer before asking the next question.
+        """
+        for line in stdin:
+            name = line.strip().decode(errors="replace")
+            try:
+                if not SHA1_PATTERN.fullmatch(name):
+                    raise KeyError(name)
+                if contents:
+                    obj = self.store.read(name)
+                    obj_type, size = obj.type, obj.size
+                else:
+                    obj_type, size = self.store.read_header(name)
+            except KeyError:
+                stdout.write(f"{name} missing\n".encode())
+            else:
+                stdout.write(f"{name} {TYPE_NAMES[obj_type]} {size}\n".encode())
+                if contents:
+                    stdout.write(obj.data)
+                    stdout.write(b"\n")
+            if not buffer:
+                stdout.flush()
+        stdout.flush()
 
     @staticmethod
     def compress(data: bytes, *, compressor=zlib.compress) -> bytes:
@@ -88,21 +224,77 @@ class Git:
         return hash_value
 
     def save_file(self, hash_value, data: bytes):
+        return self._write_object([self.compress(data)], lambda: hash_value)
+
+    def _write_object(
+        self, compressed: Iterable[bytes], get_hash: Callable[[], str]
+    ) -> str:
+        """Write a loose object through a temporary file renamed into place.
+
+        `get_hash` is called once `compressed` is exhausted, so the name of
+        the object may depend on the content that was streamed.
+        """
+        import tempfile
+
+        with tempfile.NamedTemporaryFile(
+            dir=self.objects_folder, prefix="tmp_obj_", delete=False
+        ) as f:
+            try:
+                for chunk in compressed:
+                    f.write(chunk)
+            except BaseException:
+                f.close()
+                os.unlink(f.name)
+                raise
+        hash_value = get_hash()
         path = self.objects_folder / hash_value[:2]
         path.mkdir(exist_ok=True)
-
-        compressed_data = self.compress(data)
-        with (path / hash_value[2:]).open("wb") as f:
-            f.write(compressed_data)
+        os.replace(f.name, path / hash_value[2:])
         return hash_value
 
-    def create_blob(self, content: str, *, write: bool = True) -> str:
-        blob = f"blob {len(content)}\0{content}"
+    def create_blob(self, content: str | bytes, *, write: bool = True) -> str:
+        if isinstance(content, str):
+            content = content.encode()
+        blob = f"blob {len(content)}".encode() + NULL_BYTE + content
         hash_value = self.create_hash(blob)
         if write:
-            self.save_file(hash_value, blob.encode())
+            self.save_file(hash_value, blob)
         return hash_value
 
+    def hash_file(self, path: pathlib.Path, *, write: bool = False) -> str:
+        """Hash `path` as a blob in constant memory, whatever its size.
+
+        The file is read in binary chunks feeding SHA-1 and, when writing, a
+        zlib stream into a temporary file; it is never held in memory whole.
+        """
+        size = path.stat().st_size
+        header = f"blob {size}".encode() + NULL_BYTE
+        hasher = hashlib.sha1(header)
+
+        def read_chunks() -> Iterator[bytes]:
+            read = 0
+            with path.open("rb") as f:
+                while chunk := f.read(BLOB_CHUNK_SIZE):
+                    read += len(chunk)
+                    hasher.update(chunk)
+                    yield chunk
+            if read != size:
+                raise ValueError(f"File changed while being hashed: {path}")
+
+        if not write:
+            for _ in read_chunks():
+                pass
+            return hasher.hexdigest()
+
+        def compressed_chunks() -> Iterator[bytes]:
+            compressor = zlib.compressobj()
+            yield compressor.compress(header)
+            for chunk in read_chunks():
+                yield compressor.compress(chunk)
+            yield compressor.flush()
+
+        return self._write_object(compressed_chunks(), hasher.hexdigest)
+
     def hash_object(
         self,
         path: pathlib.Path,
@@ -111,12 +303,11 @@ class Git:
         write: bool = False,
         pretty_print: bool = True,
     ):
-        with path.open("r") as f:
-            match git_object:
-                case GitObject.BLOB:
-                    hash_value = self.create_blob(f.read(), write=write)
-                case GitObject.TREE:
-                    hash_value = self.create_tree(path, write=write)
+        match git_object:
+            case GitObject.BLOB:
+                hash_value = self.hash_file(path, write=write)
+            case GitObject.TREE:
+                hash_value = self.create_tree(path, write=write)
         if pretty_print:
             sys.stdout.write(hash_value)
         return hash_value
@@ -127,29 +318,150 @@ class Git:
         *,
         write: bool = True,
         pretty_print: bool = True,
+        jobs: int = 1,
     ) -> str:
-        entries = []
+        """Write the tree of `working_directory`.
+
+        Files whose stat data matches their entry in the tree cache (or in
+        .git/index, before the first run) are not re-read; their recorded
+        SHA-1 is used instead, and a directory whose files are all unchanged
+        reuses the tree cached there. Writing the tree of the whole work tree
+        refreshes the tree cache for the next run; .git/index is left as it is.
+
+        With `jobs` > 1 the files to hash are handed to that many threads as
+        the work tree is scanned; trees are assembled once all are hashed.
+        """
         dir_path = pathlib.Path(working_directory)
+        cache_path = self.tree_cache_path
+        if not cache_path.exists():
+            cache_path = self.index_path
+        try:
+            previous = GitIndex.read(cache_path)
+        except ValueError:
+            # A version or extension we do not read: only a cache here
+            previous = GitIndex()
+        index = GitIndex()
+        if jobs > 1:
+            from concurrent.futures import ThreadPoolExecutor
+
+            pool = ThreadPoolExecutor(max_workers=jobs)
+        else:
+            pool = nullcontext()
+        with pool as executor:
+            scan = self._scan_tree(dir_path, previous=previous, executor=executor)
+            tree, _ = self._create_tree(
+                scan, write=write, previous=previous, index=index
+            )
+        # Like git, directories without files are left out, except the root
+        tree_hash = tree.sha1 if tree else self._write_tree_object([], write=write)
+
+        at_root = dir_path.resolve() == pathlib.Path.cwd()
+        if write and self.git_folder.is_dir() and at_root:
+            index.write(self.tree_cache_path)
+        if pretty_print:
+            sys.stdout.write(tree_hash)
+        return tree_hash
 
-        for entry in sorted(dir_path.iterdir()):
+    def _scan_tree(
+        self,
+        dir_path: pathlib.Path,
+        *,
+        previous: GitIndex,
+        executor: "ThreadPoolExecutor | None",
+    ) -> "_ScannedTree":
+        """List `dir_path` recursively, hashing the files that are not clean.
+
+        Hashes are computed by `executor` when there is one, in which case the
+        scanned files hold futures rather than SHA-1s.
+        """
+        key = pathlib.Path(os.path.relpath(dir_path)).as_posix()
+        scan = _ScannedTree("" if key == "." else key)
+
+        # Git orders tree entries as if directory names ended with "/"
+        for entry in sorted(
+            dir_path.iterdir(), key=lambda p: p.name + "/" if p.is_dir() else p.name
+        ):
             if entry.name.startswith(".git"):
                 continue
 
             if entry.is_file():
-                mode = GitObject.BLOB.mode  # Regular file mode
-                hash_value = self.hash_object(
-                    entry, git_object=GitObject.BLOB, write=True, pretty_print=False
-                )
-                # Convert hex string to binary
-                hash_binary = binascii.unhexlify(hash_value)
-                entries.append(f"{mode} {entry.name}".encode() + b"\0" + hash_binary)
+                path = pathlib.Path(os.path.relpath(entry)).as_posix()
+                st = entry.stat()
+                executable = st.st_mode & stat.S_IXUSR
+                mode = EXECUTABLE_MODE if executable else GitObject.BLOB.mode
+                cached = previous.lookup_clean(path, st)
+                if cached and cached.mode == int(mode, 8):
+                    hash_value = cached.sha1
+                else:
+                    scan.clean = False
+                    hash_kwargs = {
+                        "git_object": GitObject.BLOB,
+                        "write": True,
+                        "pretty_print": False,
+                    }
+                    if executor is None:
+                        hash_value = self.hash_object(entry, **hash_kwargs)
+                    else:
+                        hash_value = executor.submit(
+                            self.hash_object, entry, **hash_kwargs
+                        )
+                scan.entries.append((entry.name, mode, hash_value, (path, st)))
             elif entry.is_dir():
-                mode = GitObject.TREE.mode  # Directory mode
-                hash_value = self.create_tree(entry, write=write, pretty_print=False)
-                # Convert hex string to binary
-                hash_binary = binascii.unhexlify(hash_value)
-                entries.append(f"{mode} {entry.name}".encode() + b"\0" + hash_binary)
-
+                subtree = self._scan_tree(entry, previous=previous, executor=executor)
+                scan.entries.append((entry.name, GitObject.TREE.mode, subtree, None))
+        return scan
+
+    def _create_tree(
+        self, scan: "_ScannedTree", *, write: bool, previous: GitIndex, index: GitIndex
+    ) -> tuple[CachedTree | None, bool]:
+        """Build a scanned directory's tree; return it and whether it was reused.
+
+        The tree cached for the directory in `previous` is reused when every
+        file below it is stat-clean and no file was added or removed.
+        """
+        entries = []
+        entry_count = 0
+        subtree_count = 0
+        clean = scan.clean
+
+        for name, mode, value, file_stat in scan.entries:
+            if isinstance(value, _ScannedTree):
+                subtree, reused = self._create_tree(
+                    value, write=write, previous=previous, index=index
+                )
+                if subtree is None:
+                    continue
+                clean = clean and reused
+                hash_value = subtree.sha1
+                entry_count += subtree.entry_count
+                subtree_count += 1
+            else:
+                hash_value = value if isinstance(value, str) else value.result()
+                path, st = file_stat
+                index.add(IndexEntry.from_stat(path, int(mode, 8), hash_value, st))
+                entry_count += 1
+            # Convert hex string to binary
+            hash_binary = binascii.unhexlify(hash_value)
+            entries.append(f"{mode} {name}".encode() + b"\0" + hash_binary)
+
+        if not entry_count:
+            return None, False
+        cached = previous.trees.get(scan.key)
+        if (
+            clean
+            and cached is not None
+            and cached.entry_count == entry_count
+            and cached.subtree_count == subtree_count
+        ):
+            index.add_tree(scan.key, cached)
+            return cached, True
+
+        tree_hash = self._write_tree_object(entries, write=write)
+        tree = CachedTree(tree_hash, entry_count, subtree_count)
+        index.add_tree(scan.key, tree)
+        return tree, False
+
+    def _write_tree_object(self, entries: list[bytes], *, write: bool) -> str:
         # Combine all entries into a single tree object
         tree_content = b"".join(entries)
         tree_header = f"tree {len(tree_content)}".encode()
@@ -159,8 +471,6 @@ class Git:
         tree_hash = self.create_hash(tree_store)
         if write:
             self.save_file(tree_hash, tree_store)
-        if pretty_print:
-            sys.stdout.write(tree_hash)
         return tree_hash
 
     @staticmethod
@@ -173,20 +483,16 @@ class Git:
                     \x00
                     (?P<raw_hash>.{20})
                     """,
-            re.VERBOSE,
+            re.VERBOSE | re.DOTALL,
         )
         for match in pattern.finditer(content):
             yield TreeEntry(**match.groupdict())
 
     def ls_tree(self, hash_value: str, *, name_only: bool = False):
-        object_path = self.objects_folder / hash_value[:2] / hash_value[2:]
-        with object_path.open("rb") as f:
-            data = zlib.decompress(f.read())
-
-        # Split header from content
-        header, _, content = data.partition(b"\0")
-        if not header.startswith(b"tree "):
-            raise ValueError(f"Not a tree object: {header}")
+        obj = self.store.read(hash_value)
+        if obj.type != OBJ_TREE:
+            raise ValueError(f"Not a tree object: {TYPE_NAMES[obj.type]}")
+        content = obj.data
 
         # Parse entries
         entries = list(self._parse_tree_content(content))
@@ -240,7 +546,19 @@ class Git:
             sys.stdout.write(hash_value)
         return hash_value
 
-    def clone(self, url: str, working_directory: PathLike = "."):
+    def clone(
+        self,
+        url: str,
+        working_directory: PathLike = ".",
+        *,
+        jobs: int = 1,
+        checkout_workers: int | None = None,
+        depth: int | None = None,
+        filter_spec: str | None = None,
+    ):
+        # The network stack is only needed here
+        from app.models.clone import GitClone, StreamingCheckout
+
         work_dir = pathlib.Path(working_directory)
         git_dir = work_dir / ".git"
 
@@ -249,21 +567,323 @@ class Git:
         (git_dir / "objects").mkdir(exist_ok=True)
         (git_dir / "refs").mkdir(exist_ok=True)
         (git_dir / "refs" / "heads").mkdir(exist_ok=True)
-
-        with GitClone(url) as clone:
-            pack_data = clone.send_want_request()
-            pack_header = clone.parse_pack_header(pack_data)
-            objects = clone.parse_pack_objects(pack_data, pack_header.num_objects)
-            stored = clone.store_objects(objects, git_dir)
-
-            # Find HEAD commit and checkout
+        (git_dir / "objects" / "pack").mkdir(exist_ok=True)
+
+        with GitClone(
+            url,
+            jobs=jobs,
+            checkout_workers=checkout_workers,
+            depth=depth,
+            filter_spec=filter_spec,
+        ) as clone:
+            if "HEAD" not in clone.refs:
+                raise RuntimeError("remote has no HEAD")
             head_sha = clone.refs["HEAD"].sha1
-            commit_obj = stored[head_sha]
-            commit_info = clone.parse_commit(commit_obj.data)
-            tree_sha = commit_info["tree"]
+            # Files whose objects arrive whole are written as the pack streams in
+            with StreamingCheckout(
+                head_sha, work_dir, workers=checkout_workers
+            ) as streaming:
+                self._receive_pack(
+                    clone,
+                    lambda sink: clone.send_want_request(sink=sink),
+                    git_dir,
+                    promisor=filter_spec is not None,
+                    on_object=streaming.add,
+                )
+            self._write_remote_config(git_dir, url, filter_spec=filter_spec)
+
+            with ObjectStore(git_dir / "objects") as store:
+                # Check out the rest of HEAD
+                commit_info = clone.parse_commit(store[head_sha].data)
+                tree_sha = commit_info["tree"]
+
+                # Blobs a partial clone left out are fetched for the checkout
+                fetch_missing = None
+                if filter_spec is not None:
+                    fetch_missing = partial(self._fetch_objects, clone, git_dir)
+                stats = clone.checkout(
+                    tree_sha,
+                    store,
+                    work_dir,
+                    index_path=git_dir / "index",
+                    fetch_missing=fetch_missing,
+                    written=streaming.written,
+                )
+                sys.stderr.write(f"{stats}\n")
 
-            clone.checkout(tree_sha, stored, work_dir)
+            if clone.shallow:
+                # Commits whose parents git must not look for
+                shallow = "".join(f"{sha1}\n" for sha1 in sorted(clone.shallow))
+                (git_dir / "shallow").write_text(shallow)
 
             # Write refs/heads/main and HEAD
             (git_dir / "refs" / "heads" / "main").write_text(f"{head_sha}\n")
             (git_dir / "HEAD").write_text("ref: refs/heads/main\n")
+
+    def fetch(self, remote: str = "origin", *, jobs: int = 1) -> dict[str, str]:
+        """Fetch the branches of `remote` and update its remote-tracking refs.
+
+        Local commits are offered as haves, so the remote only sends the
+        objects we lack, as a thin pack completed with delta bases from the
+        local store. Returns the refs that changed, name -> SHA-1.
+        """
+        config = GitConfig.read(self.git_folder / "config")
+        url = config.get("remote", "url", subsection=remote)
+        if url is None:
+            raise ValueError(f"No such remote: {remote}")
+        refspec = config.get(
+            "remote",
+            "fetch",
+            subsection=remote,
+            default=f"+refs/heads/*:refs/remotes/{remote}/*",
+        )
+        source, _, destination = refspec.removeprefix("+").partition(":")
+        filter_spec = config.get("remote", "partialclonefilter", subsection=remote)
+
+        from app.models.clone import GitClone
+
+        local_refs = self.read_refs()
+        with GitClone(
+            url,
+            jobs=jobs,
+            filter_spec=filter_spec,
+            ref_prefixes=[source.removesuffix("*")],
+        ) as clone:
+            updates = {}
+            for name, ref in clone.refs.items():
+                local_name = self._map_ref(name, source, destination)
+                if local_name is not None and local_refs.get(local_name) != ref.sha1:
+                    updates[local_name] = ref.sha1
+            wants = sorted(
+                {sha1 for sha1 in updates.values() if sha1 not in self.store}
+            )
+            if wants:
+                shallow_path = self.git_folder / "shallow"
+                shallow = []
+                if shallow_path.exists():
+                    shallow = shallow_path.read_text().split()
+                haves = _HaveWalker(self.store, local_refs.values())
+                self._receive_pack(
+                    clone,
+                    lambda sink: clone.send_fetch_request(
+                        wants,
+                        haves,
+                        on_common=haves.mark_common,
+                        shallow=shallow,
+                        sink=sink,
+                    ),
+                    self.git_folder,
+                    promisor=filter_spec is not None,
+                    resolve_ref=self.store.read,
+                )
+
+        for local_name, sha1 in sorted(updates.items()):
+            ref_path = self.git_folder / local_name
+            ref_path.parent.mkdir(parents=True, exist_ok=True)
+            ref_path.write_text(f"{sha1}\n")
+            old = local_refs.get(local_name)
+            change = f"{old[:7]}..{sha1[:7]}" if old else "* [new ref]"
+            sys.stderr.write(f" {change:<17} {local_name}\n")
+        return updates
+
+    @staticmethod
+    def _map_ref(name: str, source: str, destination: str) -> str | None:
+        """Map a remote ref through a refspec like refs/heads/*:refs/remotes/o/*."""
+        if not source.endswith("*"):
+            return destination if name == source else None
+        prefix = source.removesuffix("*")
+        if not name.startswith(prefix):
+            return None
+        return destination.removesuffix("*") + name.removeprefix(prefix)
+
+    def read_refs(self) -> dict[str, str]:
+        """Every ref of the repository, loose or packed, name -> SHA-1."""
+        refs = {}
+        packed_refs = self.git_folder / "packed-refs"
+        if packed_refs.exists():
+            for line in packed_refs.read_text().splitlines():
+                # Skip the header and the peeled "^<sha1>" lines of tags
+                if line and line[0] not in "#^":
+                    sha1, _, name = line.partition(" ")
+                    refs[name] = sha1
+        for path in (self.git_folder / "refs").rglob("*"):
+            if path.is_file():
+                value = path.read_text().strip()
+                if SHA1_PATTERN.fullmatch(value):
+                    refs[path.relative_to(self.git_folder).as_posix()] = value
+        return refs
+
+    @staticmethod
+    def _receive_pack(
+        clone: "GitClone",
+        request_pack: Callable[[BinaryIO], "PackStream"],
+        git_dir: pathlib.Path,
+        *,
+        promisor: bool,
+        resolve_ref: Callable[[str], "PackObject"] | None = None,
+        on_object: Callable[["PackEntry", bytes], None] | None = None,
+    ) -> str:
+        """Store the pack returned by `request_pack` in `git_dir`; return its SHA-1.
+
+        A promisor pack comes from a partial clone's remote: objects it
+        refers to may be missing, to be fetched from there when needed. A
+        thin pack, with deltas against objects we already have, is completed
+        with bases read through `resolve_ref`. Whole objects are passed to
+        `on_object` as they are parsed.
+        """
+        import tempfile
+
+        pack_dir = git_dir / "objects" / "pack"
+        # Keep the pack as received, next to the objects parsed from it
+        with tempfile.NamedTemporaryFile(
+            dir=pack_dir, prefix="tmp_pack_", delete=False
+        ) as sink:
+            pack_path = pathlib.Path(sink.name)
+            try:
+                pack = request_pack(sink)
+                pack_header = clone.parse_pack_header(pack)
+                entries = clone.parse_pack_objects(
+                    pack, pack_header.num_objects, on_object=on_object
+                )
+                pack_sha1 = pack.read_trailer()
+                sink.flush()
+                pack_sha1 = (
+                    clone.resolve_deltas(entries, pack_path, resolve_ref=resolve_ref)
+                    or pack_sha1
+                )
+            except BaseException:
+                pack_path.unlink()
+                raise
+        clone.store_pack(entries, pack_sha1, pack_path, git_dir)
+        if promisor:
+            (pack_dir / f"pack-{pack_sha1}.promisor").touch()
+        return pack_sha1
+
+    def _loose_objects(self) -> list[str]:
+        """SHA-1s of the loose objects, left-over temporary files aside."""
+        return [
+            path.parent.name + path.name
+            for path in self.objects_folder.glob("[0-9a-f][0-9a-f]/*")
+            if SHA1_PATTERN.fullmatch(path.parent.name + path.name)
+        ]
+
+    def repack(
+        self, *, window: int = DELTA_WINDOW, depth: int = DELTA_DEPTH
+    ) -> str | None:
+        """Pack the loose objects into a new pack, then delete them.
+
+        Each object is stored as a delta against one of the `window` most
+        similar objects before it, if that makes it small enough, in chains
+        of at most `depth` deltas; blobs and trees are matched by the names
+        the loose trees give them. Loose copies of objects already packed
+        are deleted without being packed again. Returns the SHA-1 of the new
+        pack, or None if there was nothing to pack.
+        """
+        import tempfile
+
+        from app.models.pack import write_pack, write_pack_index
+
+        loose = self._loose_objects()
+        objects = []
+        names = {}
+        for sha1 in loose:
+            if self.store.is_packed(sha1):
+                continue
+            obj_type, size = self.store.read_header(sha1)
+            objects.append((sha1, obj_type, size))
+            if obj_type == OBJ_TREE:
+                for entry in self._parse_tree_content(self.store.read(sha1).data):
+                    names.setdefault(entry.hash, entry.file_name)
+
+        pack_sha1 = None
+        if objects:
+            pack_dir = self.objects_folder / "pack"
+            pack_dir.mkdir(exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                dir=pack_dir, prefix="tmp_pack_", delete=False
+            ) as f:
+                pack_path = pathlib.Path(f.name)
+            try:
+                pack_sha1, entries = write_pack(
+                    pack_path,
+                    (
+                        (sha1, obj_type, size, names.get(sha1, b""))
+                        for sha1, obj_type, size in objects
+                    ),
+                    self.store.read,
+                    window=window,
+                    depth=depth,
+                )
+            except BaseException:
+                pack_path.unlink()
+                raise
+            pack_path.replace(pack_dir / f"pack-{pack_sha1}.pack")
+            # The index last: packs are only looked at once it exists
+            write_pack_index(
+                pack_dir / f"pack-{pack_sha1}.idx",
+                ((entry.sha1, entry.crc32, entry.offset) for entry in entries),
+                pack_sha1,
+            )
+            deltas = sum(entry.is_delta for entry in entries)
+            sys.stderr.write(
+                f"Packed {len(entries)} objects ({deltas} deltas)"
+                f" into pack-{pack_sha1}.pack\n"
+            )
+
+        for sha1 in loose:
+            path = self.objects_folder / sha1[:2] / sha1[2:]
+            path.unlink(missing_ok=True)
+            with suppress(OSError):
+                path.parent.rmdir()  # once empty
+        if loose:
+            sys.stderr.write(f"Pruned {len(loose)} loose objects\n")
+        return pack_sha1
+
+    @staticmethod
+    def _write_remote_config(
+        git_dir: pathlib.Path, url: str, *, filter_spec: str | None = None
+    ):
+        config = GitConfig.read(git_dir / "config")
+        # Version 1 makes older git refuse a partial clone it cannot handle
+        config.set("core", "repositoryformatversion", int(filter_spec is not None))
+        config.set("core", "bare", False)
+        config.set("remote", "url", url, subsection="origin")
+        fetch = "+refs/heads/*:refs/remotes/origin/*"
+        config.set("remote", "fetch", fetch, subsection="origin")
+        if filter_spec is not None:
+            config.set("remote", "promisor", True, subsection="origin")
+            config.set("remote", "partialclonefilter", filter_spec, subsection="origin")
+            config.set("extensions", "partialclone", "origin")
+        config.write(git_dir / "config")
+
+    def _fetch_objects(
+        self, clone: "GitClone", git_dir: pathlib.Path, sha1s: list[str]
+    ) -> None:
+        """Fetch `sha1s` from the remote of `clone`, a batch of wants at a time."""
+        for start in range(0, len(sha1s), FETCH_BATCH_SIZE):
+            batch = sha1s[start : start + FETCH_BATCH_SIZE]
+            self._receive_pack(
+                clone,
+                # Called before the next batch is taken
+                lambda sink: clone.send_objects_request(batch, sink=sink),  # noqa: B023
+                git_dir,
+                promisor=True,
+            )
+
+    def fetch_promised(self, sha1s: Iterable[str]) -> bool:
+        """Fetch objects that a partial clone left out from its promisor remote.
+
+        Returns False, fetching nothing, if the repository is not a partial
+        clone.
+        """
+        config = GitConfig.read(self.git_folder / "config")
+        remote = config.get("extensions", "partialclone")
+        url = remote and config.get("remote", "url", subsection=remote)
+        if not url:
+            return False
+
+        from app.models.clone import GitClone
+
+        with GitClone(url) as clone:
+            self._fetch_objects(clone, self.git_folder, sorted(set(sha1s)))
+        return True
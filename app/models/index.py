@@ -0,0 +1,249 @@
+import hashlib
+import os
+import struct
+from dataclasses import dataclass, field
+from pathlib import Path
+
+__all__ = ["CachedTree", "GitIndex", "IndexEntry"]
+
+INDEX_SIGNATURE = b"DIRC"
+INDEX_VERSION = 2
+TREE_EXTENSION = b"TREE"
+
+# ctime, mtime (seconds + nanoseconds), dev, ino, mode, uid, gid, size, sha1, flags
+ENTRY_FORMAT = struct.Struct(">10I20sH")
+NAME_MASK = 0xFFF
+
+
+def _u32(value: int) -> int:
+    return value & 0xFFFFFFFF
+
+
+@dataclass
+class IndexEntry:
+    path: str  # posix path relative to the work tree
+    mode: int
+    sha1: str
+    ctime: int = 0  # nanoseconds
+    mtime: int = 0  # nanoseconds
+    dev: int = 0
+    ino: int = 0
+    uid: int = 0
+    gid: int = 0
+    size: int = 0
+
+    @classmethod
+    def from_stat(cls, path: str, mode: int, sha1: str, st: os.stat_result):
+        return cls(
+            path,
+            mode,
+            sha1,
+            ctime=st.st_ctime_ns,
+            mtime=st.st_mtime_ns,
+            dev=_u32(st.st_dev),
+            ino=_u32(st.st_ino),
+            uid=_u32(st.st_uid),
+            gid=_u32(st.st_gid),
+            size=_u32(st.st_size),
+        )
+
+    def stat_matches(self, st: os.stat_result) -> bool:
+        """Whether `st` still describes the file this entry was recorded from."""
+        return (
+            self.mtime == st.st_mtime_ns
+            and self.ctime == st.st_ctime_ns
+            and self.size == _u32(st.st_size)
+            and self.ino == _u32(st.st_ino)
+        )
+
+    def pack(self) -> bytes:
+        name = self.path.encode()
+        data = ENTRY_FORMAT.pack(
+            _u32(self.ctime // 1_000_000_000),
+            self.ctime % 1_000_000_000,
+            _u32(self.mtime // 1_000_000_000),
+            self.mtime % 1_000_000_000,
+            self.dev,
+            self.ino,
+            self.mode,
+            self.uid,
+            self.gid,
+            self.size,
+            bytes.fromhex(self.sha1),
+            min(len(name), NAME_MASK),
+        )
+        entry = data + name
+        # NUL-terminated, padded to a multiple of 8 bytes
+        return entry + b"\0" * (8 - len(entry) % 8)
+
+    @classmethod
+    def unpack_from(cls, data: bytes, offset: int) -> tuple["IndexEntry", int]:
+        (
+            ctime_s,
+            ctime_ns,
+            mtime_s,
+            mtime_ns,
+            dev,
+            ino,
+            mode,
+            uid,
+            gid,
+            size,
+            sha1,
+            _flags,  # the name length, which the NUL terminator gives too
+        ) = ENTRY_FORMAT.unpack_from(data, offset)
+        name_start = offset + ENTRY_FORMAT.size
+        name_end = data.index(b"\0", name_start)
+        entry = cls(
+            data[name_start:name_end].decode(),
+            mode,
+            sha1.hex(),
+            ctime=ctime_s * 1_000_000_000 + ctime_ns,
+            mtime=mtime_s * 1_000_000_000 + mtime_ns,
+            dev=dev,
+            ino=ino,
+            uid=uid,
+            gid=gid,
+            size=size,
+        )
+        length = name_end - offset
+        return entry, offset + length + (8 - length % 8)
+
+
+@dataclass
+class CachedTree:
+    """Tree SHA-1 of a directory, valid for the index entries it covers."""
+
+    sha1: str
+    entry_count: int  # index entries below the directory, recursively
+    subtree_count: int
+
+
+def _parent(path: str) -> str:
+    return path.rpartition("/")[0]
+
+
+@dataclass
+class GitIndex:
+    """The staging area file (.git/index), version 2.
+
+    The cached-tree (TREE) extension is kept in `trees`, keyed by directory
+    path ("" is the root); other optional extensions are dropped on write.
+    """
+
+    entries: dict[str, IndexEntry] = field(default_factory=dict)
+    # mtime of the index file when it was read; entries modified at or after it
+    # may have changed without their stat data changing ("racy git")
+    timestamp: int = 0
+    trees: dict[str, CachedTree] = field(default_factory=dict)
+
+    @classmethod
+    def read(cls, path: Path) -> "GitIndex":
+        """Read `path`, returning an empty index if it does not exist."""
+        try:
+            data = Path(path).read_bytes()
+            timestamp = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return cls()
+
+        content, checksum = data[:-20], data[-20:]
+        if hashlib.sha1(content).digest() != checksum:
+            raise ValueError(f"Index checksum mismatch: {path}")
+        signature, version, count = struct.unpack_from(">4sII", content)
+        if signature != INDEX_SIGNATURE:
+            raise ValueError(f"Invalid index signature: {path}")
+        if version != INDEX_VERSION:
+            raise ValueError(f"Unsupported index version {version}: {path}")
+
+        entries = {}
+        offset = 12
+        for _ in range(count):
+            entry, offset = IndexEntry.unpack_from(content, offset)
+            entries[entry.path] = entry
+
+        trees = {}
+        while offset < len(content):
+            signature, size = struct.unpack_from(">4sI", content, offset)
+            extension = content[offset + 8 : offset + 8 + size]
+            offset += 8 + size
+            if signature == TREE_EXTENSION:
+                trees = cls._unpack_trees(extension)
+            elif not signature[:1].isupper():
+                raise ValueError(f"Unsupported index extension {signature!r}: {path}")
+        return cls(entries, timestamp, trees)
+
+    @staticmethod
+    def _unpack_trees(data: bytes) -> dict[str, CachedTree]:
+        trees = {}
+        # (parent path, subtrees of the parent still to read)
+        stack = [("", 1)]
+        offset = 0
+        while offset < len(data):
+            parent, remaining = stack.pop()
+            if remaining > 1:
+                stack.append((parent, remaining - 1))
+            name_end = data.index(b"\0", offset)
+            line_end = data.index(b"\n", name_end)
+            name = data[offset:name_end].decode()
+            entry_count, subtree_count = map(int, data[name_end + 1 : line_end].split())
+            offset = line_end + 1
+            path = f"{parent}/{name}" if parent else name
+            if entry_count >= 0:
+                trees[path] = CachedTree(
+                    data[offset : offset + 20].hex(), entry_count, subtree_count
+                )
+                offset += 20
+            if subtree_count:
+                stack.append((path, subtree_count))
+        return trees
+
+    def _pack_trees(self) -> bytes:
+        children: dict[str, list[str]] = {}
+        for path in self.trees:
+            if path:
+                children.setdefault(_parent(path), []).append(path)
+        parts = []
+        stack = [""]
+        while stack:
+            path = stack.pop()
+            tree = self.trees[path]
+            name = path.rpartition("/")[2]
+            # Same order as git: shorter names first, then bytewise
+            subtrees = sorted(
+                children.get(path, []),
+                key=lambda child: (len(child.encode()), child.encode()),
+            )
+            parts.append(f"{name}\0{tree.entry_count} {len(subtrees)}\n".encode())
+            parts.append(bytes.fromhex(tree.sha1))
+            stack.extend(reversed(subtrees))
+        return b"".join(parts)
+
+    def write(self, path: Path) -> None:
+        entries = sorted(self.entries.values(), key=lambda entry: entry.path.encode())
+        parts = [struct.pack(">4sII", INDEX_SIGNATURE, INDEX_VERSION, len(entries))]
+        parts.extend(entry.pack() for entry in entries)
+        if "" in self.trees:
+            extension = self._pack_trees()
+            parts.append(struct.pack(">4sI", TREE_EXTENSION, len(extension)))
+            parts.append(extension)
+        content = b"".join(parts)
+        path = Path(path)
+        tmp_path = path.with_name(f"{path.name}.lock")
+        tmp_path.write_bytes(content + hashlib.sha1(content).digest())
+        tmp_path.replace(path)
+
+    def add(self, entry: IndexEntry) -> None:
+        self.entries[entry.path] = entry
+
+    def add_tree(self, path: str, tree: CachedTree) -> None:
+        """Cache the tree of directory `path`; its ancestors must be cached too."""
+        self.trees[path] = tree
+
+    def lookup_clean(self, path: str, st: os.stat_result) -> IndexEntry | None:
+        """Return the entry for `path` if its stat data proves it is unchanged."""
+        entry = self.entries.get(path)
+        if entry is None or not entry.stat_matches(st):
+            return None
+        if entry.mtime >= self.timestamp:
+            return None  # racily clean: modified in the same tick the index was written
+        return entry
@@ -0,0 +1,871 @@
+import bisect
+import hashlib
+import mmap
+import os
+import struct
+import zlib
+from collections import OrderedDict, deque
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+
+from app.models.delta import DeltaError, DeltaIndex, apply_delta, read_delta_size
+
+# Size of the chunks pulled from the transport / fed to the inflater
+CHUNK_SIZE = 64 * 1024
+
+# Deflate rarely grows data by more than this; bounds the first inflate window
+ZLIB_SLACK = 64
+
+# Bytes of reconstructed delta bases kept around while resolving a pack
+DELTA_BASE_CACHE_SIZE = 96 * 1024 * 1024
+
+PACK_INDEX_SIGNATURE = b"\xfftOc"
+PACK_INDEX_VERSION = 2
+
+# Objects tried as delta bases for each object written, and the longest
+# chain of deltas allowed, as git repack's --window and --depth
+DELTA_WINDOW = 10
+DELTA_DEPTH = 50
+# Objects this small are stored whole: a delta would hardly be smaller
+MIN_DELTA_SIZE = 50
+
+
+@dataclass
+class PackHeader:
+    version: int
+    num_objects: int
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        if data[:4] != b"PACK":
+            raise ValueError(f"Invalid pack signature: {bytes(data[:4])!r}")
+        version, num_objects = struct.unpack(">II", data[4:12])
+        return cls(version, num_objects)
+
+
+@dataclass
+class PackObject:
+    type: int
+    size: int
+    data: bytes
+    pack_offset: int = 0  # offset in pack file where this object starts
+    crc32: int = 0  # CRC32 of the raw entry (header + compressed data)
+
+
+@dataclass
+class PackEntry:
+    """Where an object lives inside a pack, without its content."""
+
+    offset: int
+    type: int  # the base's type once a delta is resolved
+    size: int  # inflated size of the entry data (the delta itself for deltas)
+    data_offset: int  # start of the zlib stream
+    crc32: int = 0
+    delta_base: int | str | None = None  # base offset (OFS) or SHA-1 (REF)
+    sha1: str | None = None  # known for bases while parsing, for deltas once resolved
+
+    @property
+    def is_delta(self) -> bool:
+        return self.delta_base is not None
+
+
+# Object type constants
+OBJ_COMMIT = 1
+OBJ_TREE = 2
+OBJ_BLOB = 3
+OBJ_TAG = 4
+OBJ_OFS_DELTA = 6
+OBJ_REF_DELTA = 7
+
+TYPE_NAMES = {
+    OBJ_COMMIT: "commit",
+    OBJ_TREE: "tree",
+    OBJ_BLOB: "blob",
+    OBJ_TAG: "tag",
+}
+
+
+def encode_entry_header(obj_type: int, size: int) -> bytes:
+    """Encode the type and inflated size that start every pack entry."""
+    header = bytearray()
+    byte = (obj_type << 4) | (size & 0x0F)
+    size >>= 4
+    while size:
+        header.append(byte | 0x80)
+        byte = size & 0x7F
+        size >>= 7
+    header.append(byte)
+    return bytes(header)
+
+
+def encode_ofs_distance(distance: int) -> bytes:
+    """Encode how far back the base of an OFS delta starts."""
+    encoded = [distance & 0x7F]
+    distance >>= 7
+    while distance:
+        # Every continuation byte counts one extra, so no value has two forms
+        distance -= 1
+        encoded.insert(0, 0x80 | (distance & 0x7F))
+        distance >>= 7
+    return bytes(encoded)
+
+
+def name_hash(name: bytes) -> int:
+    """Git's pack name hash: files ending alike, as by extension, sort together."""
+    value = 0
+    for byte in name:
+        if not chr(byte).isspace():
+            value = ((value >> 2) + (byte << 24)) & 0xFFFFFFFF
+    return value
+
+
+def compute_sha1(obj_type: int, data: bytes) -> str:
+    """Compute git object SHA-1."""
+    type_name = TYPE_NAMES[obj_type]
+    header = f"{type_name} {len(data)}\x00".encode()
+    return hashlib.sha1(header + data).hexdigest()
+
+
+class PackStream:
+    """Incremental reader over pack data arriving as a sequence of chunks.
+
+    Only the chunk currently being parsed is kept in memory, so a pack can be
+    consumed straight from the network without ever being fully buffered.
+    Every consumed byte is checksummed and, when a sink is given, copied to it
+    verbatim so the pack can be kept on disk as received.
+    """
+
+    def __init__(self, chunks: Iterable[bytes], *, sink: BinaryIO | None = None):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+        self._pos = 0
+        self._sink = sink
+        self._digest = hashlib.sha1()
+        self.offset = 0  # absolute offset of the next unread byte
+        self.crc32 = 0  # running CRC32, reset by the caller at each entry
+
+    @classmethod
+    def from_bytes(
+        cls, data: bytes, *, chunk_size: int = CHUNK_SIZE, sink: BinaryIO | None = None
+    ):
+        view = memoryview(data)
+        chunks = (view[i : i + chunk_size] for i in range(0, len(view), chunk_size))
+        return cls(chunks, sink=sink)
+
+    def _consume(self, data: bytes) -> None:
+        self.offset += len(data)
+        self.crc32 = zlib.crc32(data, self.crc32)
+        self._digest.update(data)
+        if self._sink is not None:
+            self._sink.write(data)
+
+    def _fill(self) -> bool:
+        """Append the next non-empty chunk to the buffer, dropping consumed bytes."""
+        for chunk in self._chunks:
+            if chunk:
+                if self._pos < len(self._buffer):
+                    self._buffer = bytes(self._buffer[self._pos :]) + chunk
+                else:
+                    # Nothing left over: adopt the chunk without copying it
+                    self._buffer = chunk
+                self._pos = 0
+                return True
+        return False
+
+    def read(self, size: int) -> bytes:
+        while len(self._buffer) - self._pos < size:
+            if not self._fill():
+                raise EOFError("Unexpected end of pack data")
+        data = bytes(self._buffer[self._pos : self._pos + size])
+        self._pos += size
+        self._consume(data)
+        return data
+
+    def read_byte(self) -> int:
+        return self.read(1)[0]
+
+    def inflate(self, size: int) -> bytes:
+        """Inflate the zlib stream of a `size` byte entry at the current position.
+
+        The inflater is fed bounded windows of the buffer, the first one sized
+        from the declared entry size, so neither the input nor the leftover
+        `unused_data` ever spans the rest of a large buffer.
+        """
+        decompressor = zlib.decompressobj()
+        parts = []
+        window = min(size + ZLIB_SLACK, CHUNK_SIZE)
+        while not decompressor.eof:
+            if self._pos == len(self._buffer) and not self._fill():
+                raise EOFError("Unexpected end of pack data")
+            with memoryview(self._buffer) as view:
+                available = view[self._pos : self._pos + window]
+                parts.append(decompressor.decompress(available))
+                consumed = len(available) - len(decompressor.unused_data)
+                self._pos += consumed
+                self._consume(available[:consumed])
+                available.release()
+            window = CHUNK_SIZE
+        data = b"".join(parts)
+        if len(data) != size:
+            raise ValueError(
+                f"Pack entry inflated to {len(data)} bytes, expected {size}"
+            )
+        return data
+
+    def read_trailer(self) -> str:
+        """Read and verify the trailing pack checksum, returning it as hex."""
+        expected = self._digest.digest()
+        trailer = self.read(20)
+        if trailer != expected:
+            raise ValueError("Pack checksum mismatch")
+        return trailer.hex()
+
+
+def write_pack_index(
+    path: Path, entries: Iterable[tuple[str, int, int]], pack_sha1: str
+) -> None:
+    """Write a version 2 pack index for `(sha1, crc32, offset)` entries."""
+    entries = sorted(entries)
+    fanout = [0] * 256
+    for sha1, _crc32, _offset in entries:
+        fanout[int(sha1[:2], 16)] += 1
+    for i in range(1, 256):
+        fanout[i] += fanout[i - 1]
+
+    offsets = []
+    large_offsets = []
+    for _sha1, _crc32, offset in entries:
+        if offset < 0x80000000:
+            offsets.append(offset)
+        else:
+            offsets.append(0x80000000 | len(large_offsets))
+            large_offsets.append(offset)
+
+    parts = [
+        PACK_INDEX_SIGNATURE,
+        struct.pack(">I", PACK_INDEX_VERSION),
+        struct.pack(">256I", *fanout),
+        b"".join(bytes.fromhex(sha1) for sha1, _crc32, _offset in entries),
+        b"".join(struct.pack(">I", crc32) for _sha1, crc32, _offset in entries),
+        struct.pack(f">{len(offsets)}I", *offsets),
+        struct.pack(f">{len(large_offsets)}Q", *large_offsets),
+        bytes.fromhex(pack_sha1),
+    ]
+    content = b"".join(parts)
+    path.write_bytes(content + hashlib.sha1(content).digest())
+
+
+def complete_thin_pack(
+    pack_path: Path,
+    entries: list[PackEntry],
+    resolve_ref: Callable[[str], PackObject],
+) -> str | None:
+    """Append the REF delta bases a thin pack left out, as `index-pack --fix-thin`.
+
+    The bases are read through `resolve_ref` and stored whole at the end of
+    the pack, so that it stands on its own like any other pack; their
+    entries are added to `entries`. Returns the SHA-1 of the completed pack,
+    or None if nothing was missing.
+    """
+    present = {entry.sha1 for entry in entries}
+    missing = sorted(
+        {
+            entry.delta_base
+            for entry in entries
+            if isinstance(entry.delta_base, str) and entry.delta_base not in present
+        }
+    )
+    if not missing:
+        return None
+
+    with open(pack_path, "r+b") as f:
+        header = PackHeader.from_bytes(f.read(12))
+        offset = f.seek(-20, os.SEEK_END)
+        f.truncate()
+        for sha1 in missing:
+            base = resolve_ref(sha1)
+            entry_header = encode_entry_header(base.type, len(base.data))
+            raw = entry_header + zlib.compress(base.data)
+            f.write(raw)
+            entries.append(
+                PackEntry(
+                    offset,
+                    base.type,
+                    len(base.data),
+                    offset + len(entry_header),
+                    zlib.crc32(raw),
+                    sha1=sha1,
+                )
+            )
+            offset += len(raw)
+
+        f.seek(8)
+        f.write(struct.pack(">I", header.num_objects + len(missing)))
+        f.seek(0)
+        checksum = hashlib.sha1()
+        while chunk := f.read(CHUNK_SIZE):
+            checksum.update(chunk)
+        f.write(checksum.digest())
+    return checksum.hexdigest()
+
+
+@dataclass
+class _DeltaCandidate:
+    """An object just written, kept in the window as a possible delta base."""
+
+    entry: PackEntry
+    data: bytes
+    depth: int  # deltas between it and a whole object
+    index: DeltaIndex | None = None  # built once it is first tried as a base
+
+
+def write_pack(
+    path: Path,
+    objects: Iterable[tuple[str, int, int, bytes]],
+    read: Callable[[str], PackObject],
+    *,
+    window: int = DELTA_WINDOW,
+    depth: int = DELTA_DEPTH,
+) -> tuple[str, list[PackEntry]]:
+    """Write a pack of `(sha1, type, size, path name)` objects read through `read`.
+
+    As in git, objects are sorted by type, then by the hash of their name
+    (files of the same name or extension side by side), then largest first,
+    and each one is stored as an OFS delta against the best of the previous
+    `window` objects, if any is small enough, in chains of at most `depth`
+    deltas. Only the window's objects are held in memory. Returns the pack
+    SHA-1 and its entries.
+    """
+    objects = sorted(
+        objects, key=lambda obj: (obj[1], name_hash(obj[3]), -obj[2], obj[0])
+    )
+    candidates: deque[_DeltaCandidate] = deque(maxlen=window)
+    entries = []
+    checksum = hashlib.sha1()
+    with open(path, "wb") as f:
+        header = struct.pack(">4sII", b"PACK", 2, len(objects))
+        f.write(header)
+        checksum.update(header)
+        offset = len(header)
+        for sha1, obj_type, _size, _name in objects:
+            data = read(sha1).data
+            best = None
+            # A delta must at least halve the object to be worth a lookup
+            max_size = len(data) // 2 - 20
+            if len(data) >= MIN_DELTA_SIZE and window:
+                # Nearest first: the likeliest to be similar
+                for candidate in reversed(candidates):
+                    base = candidate.data
+                    if (
+                        candidate.entry.type != obj_type
+                        or candidate.depth >= depth
+                        or len(data) < len(base) // 32
+                        or len(data) - len(base) >= max_size
+                    ):
+                        continue
+                    # Long chains are slow to read back: ask more of them
+                    limit = max_size * (depth - candidate.depth) // depth
+                    if candidate.index is None:
+                        candidate.index = DeltaIndex(base)
+                    delta = candidate.index.create_delta(data, max_size=limit)
+                    if delta is not None:
+                        best = delta, candidate
+                        max_size = len(delta)
+
+            if best is None:
+                entry_header = encode_entry_header(obj_type, len(data))
+                body, base_offset, chain = data, None, 0
+            else:
+                body, base = best
+                base_offset, chain = base.entry.offset, base.depth + 1
+                entry_header = encode_entry_header(
+                    OBJ_OFS_DELTA, len(body)
+                ) + encode_ofs_distance(offset - base_offset)
+            raw = entry_header + zlib.compress(body)
+            f.write(raw)
+            checksum.update(raw)
+            entry = PackEntry(
+                offset,
+                obj_type,
+                len(body),
+                offset + len(entry_header),
+                zlib.crc32(raw),
+                delta_base=base_offset,
+                sha1=sha1,
+            )
+            entries.append(entry)
+            candidates.append(_DeltaCandidate(entry, data, chain))
+            offset += len(raw)
+        f.write(checksum.digest())
+    return checksum.hexdigest(), entries
+
+
+def _map_file(path: Path) -> mmap.mmap:
+    with path.open("rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class PackIndex:
+    """Memory-mapped version 2 pack index."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._map = _map_file(self.path)
+        if self._map[:4] != PACK_INDEX_SIGNATURE:
+            raise ValueError(f"Invalid pack index signature: {self.path}")
+        (version,) = struct.unpack_from(">I", self._map, 4)
+        if version != PACK_INDEX_VERSION:
+            raise ValueError(f"Unsupported pack index version {version}: {self.path}")
+
+        self._fanout = struct.unpack_from(">256I", self._map, 8)
+        self.num_objects = self._fanout[255]
+        self._sha1_table = 8 + 256 * 4
+        self._crc32_table = self._sha1_table + 20 * self.num_objects
+        self._offset_table = self._crc32_table + 4 * self.num_objects
+        self._large_offset_table = self._offset_table + 4 * self.num_objects
+
+    def __len__(self):
+        return self.num_objects
+
+    def close(self):
+        self._map.close()
+
+    def _sha1_at(self, position: int) -> bytes:
+        start = self._sha1_table + 20 * position
+        return self._map[start : start + 20]
+
+    def _offset_at(self, position: int) -> int:
+        (offset,) = struct.unpack_from(
+            ">I", self._map, self._offset_table + 4 * position
+        )
+        if offset & 0x80000000:
+            large = self._large_offset_table + 8 * (offset & 0x7FFFFFFF)
+            (offset,) = struct.unpack_from(">Q", self._map, large)
+        return offset
+
+    def find(self, sha1: str) -> int | None:
+        """Return the pack offset of `sha1`, or None if it is not in this pack."""
+        raw = bytes.fromhex(sha1)
+        low = self._fanout[raw[0] - 1] if raw[0] else 0
+        high = self._fanout[raw[0]]
+        while low < high:
+            middle = (low + high) // 2
+            current = self._sha1_at(middle)
+            if current == raw:
+                return self._offset_at(middle)
+            if current < raw:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def __iter__(self) -> Iterator[tuple[str, int]]:
+        """Yield `(sha1, offset)` for every object, in SHA-1 order."""
+        for position in range(self.num_objects):
+            yield self._sha1_at(position).hex(), self._offset_at(position)
+
+
+class PackData:
+    """Memory-mapped pack file, read entry by entry."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._map = _map_file(self.path)
+        self._view = memoryview(self._map)
+        self.header = PackHeader.from_bytes(self._view[:12])
+        self.size = len(self._map)
+
+    def close(self):
+        self._view.release()
+        self._map.close()
+
+    def read_entry_header(self, offset: int) -> tuple[int, int, int, int | str | None]:
+        """Parse the entry at `offset`.
+
+        Returns (type, size, data_offset, delta_base) where delta_base is the
+        base offset for OFS deltas, the base SHA-1 for REF deltas, else None.
+        """
+        view = self._view
+        byte = view[offset]
+        obj_type = (byte >> 4) & 0x07
+        size = byte & 0x0F
+        shift = 4
+        position = offset + 1
+        while byte & 0x80:
+            byte = view[position]
+            size |= (byte & 0x7F) << shift
+            shift += 7
+            position += 1
+
+        delta_base = None
+        if obj_type == OBJ_OFS_DELTA:
+            byte = view[position]
+            base_distance = byte & 0x7F
+            position += 1
+            while byte & 0x80:
+                byte = view[position]
+                base_distance = ((base_distance + 1) << 7) | (byte & 0x7F)
+                position += 1
+            delta_base = offset - base_distance
+        elif obj_type == OBJ_REF_DELTA:
+            delta_base = view[position : position + 20].hex()
+            position += 20
+        return obj_type, size, position, delta_base
+
+    def raw(self, start: int, end: int) -> memoryview:
+        """The bytes of the pack from `start` to `end`, as stored."""
+        return self._view[start:end]
+
+    def inflate(self, offset: int, size: int) -> bytes:
+        """Inflate the zlib stream at `offset`, reading the mmap in small windows."""
+        decompressor = zlib.decompressobj()
+        parts = []
+        window = min(size + ZLIB_SLACK, CHUNK_SIZE)
+        while not decompressor.eof:
+            data = self._view[offset : offset + window]
+            if not data:
+                raise EOFError(f"Truncated pack entry in {self.path}")
+            parts.append(decompressor.decompress(data))
+            offset += len(data)
+            window = CHUNK_SIZE
+        data = b"".join(parts)
+        if len(data) != size:
+            raise ValueError(
+                f"Pack entry inflated to {len(data)} bytes, expected {size}"
+            )
+        return data
+
+    def inflate_prefix(self, offset: int, length: int) -> bytes:
+        """Inflate at most `length` bytes of the zlib stream at `offset`."""
+        decompressor = zlib.decompressobj()
+        data = b""
+        while len(data) < length and not decompressor.eof:
+            window = self._view[offset : offset + ZLIB_SLACK]
+            if not window:
+                raise EOFError(f"Truncated pack entry in {self.path}")
+            data += decompressor.decompress(window, length - len(data))
+            offset += len(window) - len(decompressor.unconsumed_tail)
+        return data
+
+
+class Pack:
+    """Random access to the objects of a memory-mapped pack through its index."""
+
+    def __init__(self, index_path: Path):
+        self.index = PackIndex(index_path)
+        self.data = PackData(self.index.path.with_suffix(".pack"))
+        self.path = self.data.path
+        # Entry offsets in pack order with the end of the last entry, and the
+        # SHA-1 at each offset: built on the first raw read
+        self._entry_offsets: list[int] | None = None
+        self._sha1_at: dict[int, str] = {}
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+    def read_raw_at(self, offset: int) -> tuple[int, int, str | None, memoryview]:
+        """Return the entry at `offset` as stored, to copy into another pack.
+
+        Returns (type, size, delta_base, data) where data is the zlib stream,
+        not inflated, and delta_base the SHA-1 of the base of a delta, OFS
+        or REF, else None.
+        """
+        if self._entry_offsets is None:
+            self._sha1_at = {offset: sha1 for sha1, offset in self.index}
+            self._entry_offsets = sorted(self._sha1_at)
+            self._entry_offsets.append(self.data.size - 20)
+        end = self._entry_offsets[bisect.bisect_right(self._entry_offsets, offset)]
+        obj_type, size, data_offset, delta_base = self.data.read_entry_header(offset)
+        if obj_type == OBJ_OFS_DELTA:
+            delta_base = self._sha1_at[delta_base]
+        return obj_type, size, delta_base, self.data.raw(data_offset, end)
+
+    def read_at(
+        self, offset: int, *, resolve_ref: Callable[[str], PackObject] | None = None
+    ) -> PackObject:
+        """Read and fully resolve the object stored at `offset`.
+
+        REF deltas whose base lives outside this pack are resolved through
+        `resolve_ref`.
+        """
+        start = offset
+        deltas = []
+        while True:
+            obj_type, size, data_offset, delta_base = self.data.read_entry_header(
+                offset
+            )
+            if obj_type == OBJ_OFS_DELTA:
+                deltas.append((data_offset, size))
+                offset = delta_base
+            elif obj_type == OBJ_REF_DELTA:
+                deltas.append((data_offset, size))
+                base_offset = self.index.find(delta_base)
+                if base_offset is not None:
+                    offset = base_offset
+                    continue
+                if resolve_ref is None:
+                    raise DeltaError(f"Missing delta base {delta_base}")
+                base = resolve_ref(delta_base)
+                obj_type, data = base.type, base.data
+                break
+            else:
+                data = self.data.inflate(data_offset, size)
+                break
+
+        for data_offset, size in reversed(deltas):
+            data = apply_delta(data, self.data.inflate(data_offset, size))
+        return PackObject(obj_type, len(data), data, start)
+
+    def read_header_at(
+        self,
+        offset: int,
+        *,
+        resolve_ref: Callable[[str], tuple[int, int]] | None = None,
+    ) -> tuple[int, int]:
+        """Return the (type, size) of the object at `offset` without resolving it.
+
+        The size of a delta is read from its header, and the type from the
+        base at the end of its chain; `resolve_ref` gives the (type, size) of
+        REF delta bases that live outside this pack.
+        """
+        obj_type, size, data_offset, delta_base = self.data.read_entry_header(offset)
+        if obj_type in (OBJ_OFS_DELTA, OBJ_REF_DELTA):
+            # Two size varints of at most 10 bytes each
+            header = self.data.inflate_prefix(data_offset, 20)
+            _, position = read_delta_size(header, 0)
+            size, _ = read_delta_size(header, position)
+        while obj_type in (OBJ_OFS_DELTA, OBJ_REF_DELTA):
+            if obj_type == OBJ_REF_DELTA:
+                base_offset = self.index.find(delta_base)
+                if base_offset is None:
+                    if resolve_ref is None:
+                        raise DeltaError(f"Missing delta base {delta_base}")
+                    return resolve_ref(delta_base)[0], size
+                delta_base = base_offset
+            obj_type, _, _, delta_base = self.data.read_entry_header(delta_base)
+        return obj_type, size
+
+    def get(self, sha1: str, **kwargs) -> PackObject | None:
+        offset = self.index.find(sha1)
+        if offset is None:
+            return None
+        return self.read_at(offset, **kwargs)
+
+    def get_header(self, sha1: str, **kwargs) -> tuple[int, int] | None:
+        offset = self.index.find(sha1)
+        if offset is None:
+            return None
+        return self.read_header_at(offset, **kwargs)
+
+
+class DeltaBaseCache:
+    """LRU of reconstructed delta bases, bounded by their total size in bytes."""
+
+    def __init__(self, max_size: int = DELTA_BASE_CACHE_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self._entries: OrderedDict[int, bytes] = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, offset: int) -> bytes | None:
+        data = self._entries.get(offset)
+        if data is not None:
+            self._entries.move_to_end(offset)
+        return data
+
+    def put(self, offset: int, data: bytes) -> None:
+        if len(data) > self.max_size or offset in self._entries:
+            return
+        self._entries[offset] = data
+        self.size += len(data)
+        while self.size > self.max_size:
+            _offset, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+def resolve_deltas(
+    pack: PackData,
+    entries: list[PackEntry],
+    *,
+    cache_size: int = DELTA_BASE_CACHE_SIZE,
+    resolve_ref: Callable[[str], PackObject] | None = None,
+) -> None:
+    """Fill in the type and SHA-1 of every unresolved delta entry, in place.
+
+    Delta trees are walked iteratively from their hashed roots, so chain
+    depth is unbounded and each object is resolved exactly once. Only
+    objects that are themselves delta bases are kept, in a size-bounded LRU;
+    a base that was evicted is rebuilt from the pack when it is needed again.
+    REF deltas against objects missing from the pack (thin packs) are rooted
+    at `resolve_ref`.
+    """
+    by_offset = {entry.offset: entry for entry in entries}
+    children: dict[int | str, list[PackEntry]] = {}
+    for entry in entries:
+        if entry.is_delta:
+            children.setdefault(entry.delta_base, []).append(entry)
+    if not children:
+        return
+
+    cache = DeltaBaseCache(cache_size)
+    offset_by_sha1 = {entry.sha1: entry.offset for entry in entries if entry.sha1}
+    external: dict[str, PackObject] = {}
+
+    def children_of(entry: PackEntry) -> list[PackEntry]:
+        return children.get(entry.offset, []) + children.get(entry.sha1, [])
+
+    def base_of(entry: PackEntry) -> PackEntry | None:
+        if isinstance(entry.delta_base, int):
+            return by_offset[entry.delta_base]
+        offset = offset_by_sha1.get(entry.delta_base)
+        return None if offset is None else by_offset[offset]
+
+    def data_of(entry: PackEntry) -> bytes:
+        # Walk up to the closest cached (or non-delta) ancestor, then back down
+        chain = []
+        data = None
+        while data is None:
+            data = cache.get(entry.offset)
+            if data is not None:
+                break
+            if not entry.is_delta:
+                data = pack.inflate(entry.data_offset, entry.size)
+                break
+            chain.append(entry)
+            base = base_of(entry)
+            if base is None:
+                data = external[entry.delta_base].data
+                break
+            entry = base
+        for entry in reversed(chain):
+            data = apply_delta(data, pack.inflate(entry.data_offset, entry.size))
+            cache.put(entry.offset, data)
+        return data
+
+    def walk(root: PackEntry) -> None:
+        stack = [root]
+        while stack:
+            entry = stack.pop()
+            entry_children = [
+                child for child in children_of(entry) if child.sha1 is None
+            ]
+            if not entry_children:
+                continue
+            if entry.offset < 0:
+                base_data = external[entry.sha1].data
+            else:
+                base_data = data_of(entry)
+                cache.put(entry.offset, base_data)
+            for child in entry_children:
+                data = apply_delta(
+                    base_data, pack.inflate(child.data_offset, child.size)
+                )
+                child.type = entry.type
+                child.sha1 = compute_sha1(child.type, data)
+                offset_by_sha1.setdefault(child.sha1, child.offset)
+                if children_of(child):
+                    cache.put(child.offset, data)
+                stack.append(child)
+
+    # Roots are the objects already hashed, normally the non-delta ones
+    for entry in entries:
+        if entry.sha1 is not None and any(
+            child.sha1 is None for child in children_of(entry)
+        ):
+            walk(entry)
+
+    # Whatever is left hangs off objects that are not in this pack
+    for sha1 in [key for key in children if isinstance(key, str)]:
+        if sha1 in offset_by_sha1:
+            continue
+        try:
+            if resolve_ref is None:
+                raise KeyError(sha1)
+            external[sha1] = base = resolve_ref(sha1)
+        except KeyError:
+            raise DeltaError(f"Missing delta base {sha1}") from None
+        walk(PackEntry(-1, base.type, base.size, 0, sha1=sha1))
+
+
+def _resolve_delta_trees(
+    pack_path: Path, entries: list[PackEntry], cache_size: int
+) -> list[tuple[int, int, str]]:
+    """Process pool worker: resolve a batch of delta trees from a mapped pack."""
+    pack = PackData(pack_path)
+    try:
+        resolve_deltas(pack, entries, cache_size=cache_size)
+    finally:
+        pack.close()
+    return [
+        (entry.offset, entry.type, entry.sha1) for entry in entries if entry.is_delta
+    ]
+
+
+def resolve_deltas_parallel(
+    pack_path: Path,
+    entries: list[PackEntry],
+    *,
+    jobs: int,
+    cache_size: int = DELTA_BASE_CACHE_SIZE,
+    resolve_ref: Callable[[str], PackObject] | None = None,
+) -> None:
+    """Resolve delta entries in place using a pool of `jobs` processes.
+
+    Entries are grouped into delta trees rooted at non-delta objects and the
+    trees are spread over the workers in batches. Every worker maps the pack
+    file itself, so the pack is shared through the page cache rather than
+    copied to each process; only entry metadata and the resulting SHA-1s
+    cross process boundaries. REF deltas whose base is itself a delta (or
+    lives outside the pack) are resolved serially afterwards.
+    """
+    by_offset = {entry.offset: entry for entry in entries}
+    children: dict[int | str, list[PackEntry]] = {}
+    for entry in entries:
+        if entry.is_delta:
+            children.setdefault(entry.delta_base, []).append(entry)
+
+    trees = []
+    for root in entries:
+        if root.is_delta:
+            continue
+        tree = [root]
+        stack = children.get(root.offset, []) + children.get(root.sha1, [])
+        while stack:
+            entry = stack.pop()
+            tree.append(entry)
+            stack.extend(children.get(entry.offset, []))
+        if len(tree) > 1:
+            trees.append(tree)
+
+    # A handful of batches per worker keeps them busy without per-tree overhead
+    batch_count = min(len(trees), jobs * 4)
+    batches = [[] for _ in range(batch_count)]
+    for tree in sorted(trees, key=len, reverse=True):
+        min(batches, key=len).extend(tree)
+
+    if batches:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                executor.submit(_resolve_delta_trees, pack_path, batch, cache_size)
+                for batch in batches
+            ]
+            for future in futures:
+                for offset, obj_type, sha1 in future.result():
+                    by_offset[offset].type = obj_type
+                    by_offset[offset].sha1 = sha1
+
+    if any(entry.sha1 is None for entry in entries):
+        pack = PackData(pack_path)
+        try:
+            resolve_deltas(
+                pack, entries, cache_size=cache_size, resolve_ref=resolve_ref
+            )
+        finally:
+            pack.close()
@@ -0,0 +1,140 @@
+import zlib
+from pathlib import Path
+
+from app.models.pack import TYPE_NAMES, Pack, PackObject
+
+__all__ = ["ObjectStore"]
+
+TYPE_IDS = {type_name: obj_type for obj_type, type_name in TYPE_NAMES.items()}
+# Compressed bytes read at a time when only the header of an object is needed
+LOOSE_HEADER_WINDOW = 64
+
+
+class ObjectStore:
+    """Read access to the loose and packed objects of a repository.
+
+    Pack indexes are memory-mapped on first use and searched with a binary
+    search, and only the requested entry (plus its delta chain) is inflated.
+    """
+
+    def __init__(self, objects_folder: Path):
+        self.objects_folder = Path(objects_folder)
+        self._packs: dict[Path, Pack] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        for pack in self._packs.values():
+            pack.close()
+        self._packs.clear()
+
+    def _refresh_packs(self):
+        """Open the pack indexes that appeared since the last scan."""
+        for index_path in sorted((self.objects_folder / "pack").glob("pack-*.idx")):
+            if (
+                index_path not in self._packs
+                and index_path.with_suffix(".pack").exists()
+            ):
+                self._packs[index_path] = Pack(index_path)
+
+    def _loose_path(self, sha1: str) -> Path:
+        return self.objects_folder / sha1[:2] / sha1[2:]
+
+    def _read_loose(self, sha1: str) -> PackObject | None:
+        try:
+            data = zlib.decompress(self._loose_path(sha1).read_bytes())
+        except FileNotFoundError:
+            return None
+        header, _, body = data.partition(b"\0")
+        type_name, _, _size = header.partition(b" ")
+        return PackObject(TYPE_IDS[type_name.decode()], len(body), body)
+
+    def _read_loose_header(self, sha1: str) -> tuple[int, int] | None:
+        try:
+            f = self._loose_path(sha1).open("rb")
+        except FileNotFoundError:
+            return None
+        decompressor = zlib.decompressobj()
+        header = b""
+        with f:
+            # Inflate only as far as the "<type> <size>\0" header
+            while b"\0" not in header and not decompressor.eof:
+                chunk = decompressor.unconsumed_tail or f.read(LOOSE_HEADER_WINDOW)
+                if not chunk:
+                    break
+                header += decompressor.decompress(chunk, LOOSE_HEADER_WINDOW)
+        header, found, _ = header.partition(b"\0")
+        if not found:
+            raise ValueError(f"Corrupt loose object {sha1}")
+        type_name, _, size = header.partition(b" ")
+        return TYPE_IDS[type_name.decode()], int(size)
+
+    def _read_packed(self, sha1: str) -> PackObject | None:
+        for pack in self._packs.values():
+            obj = pack.get(sha1, resolve_ref=self.read)
+            if obj is not None:
+                return obj
+        return None
+
+    def _read_packed_header(self, sha1: str) -> tuple[int, int] | None:
+        for pack in self._packs.values():
+            header = pack.get_header(sha1, resolve_ref=self.read_header)
+            if header is not None:
+                return header
+        return None
+
+    def read(self, sha1: str) -> PackObject:
+        """Return the object named `sha1`, raising KeyError if it is missing."""
+        obj = self._read_loose(sha1) or self._read_packed(sha1)
+        if obj is None:
+            self._refresh_packs()
+            obj = self._read_packed(sha1)
+        if obj is None:
+            raise KeyError(sha1)
+        return obj
+
+    def read_header(self, sha1: str) -> tuple[int, int]:
+        """Return the (type, size) of `sha1` without reading its content.
+
+        Raises KeyError if it is missing.
+        """
+        header = self._read_loose_header(sha1) or self._read_packed_header(sha1)
+        if header is None:
+            self._refresh_packs()
+            header = self._read_packed_header(sha1)
+        if header is None:
+            raise KeyError(sha1)
+        return header
+
+    def __getitem__(self, sha1: str) -> PackObject:
+        return self.read(sha1)
+
+    def __contains__(self, sha1: str) -> bool:
+        if self._loose_path(sha1).exists() or self._in_packs(sha1):
+            return True
+        self._refresh_packs()
+        return self._in_packs(sha1)
+
+    def find_packed(self, sha1: str) -> tuple[Pack, int] | None:
+        """The pack holding `sha1` and the offset of its entry, if it is packed."""
+        for _ in range(2):
+            for pack in self._packs.values():
+                offset = pack.index.find(sha1)
+                if offset is not None:
+                    return pack, offset
+            self._refresh_packs()
+        return None
+
+    def is_packed(self, sha1: str) -> bool:
+        """Whether `sha1` is in a pack, loose or not as well."""
+        if self._in_packs(sha1):
+            return True
+        self._refresh_packs()
+        return self._in_packs(sha1)
+
+    def _in_packs(self, sha1: str) -> bool:
+        return any(pack.index.find(sha1) is not None for pack in self._packs.values())
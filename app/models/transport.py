@@ -0,0 +1,179 @@
+import http.client
+import time
+from typing import BinaryIO
+from urllib.parse import urlsplit
+
+__all__ = ["HttpTransport"]
+
+# Statuses worth another try: the server is busy or a proxy lost it
+RETRY_STATUSES = {429, 502, 503, 504}
+# Request bodies at least this large are sent gzip-encoded, as git does
+GZIP_MIN_SIZE = 1024
+# Bytes read to finish a response before reusing its connection
+DRAIN_LIMIT = 64 * 1024
+# Failures to connect, send or read a response
+CONNECTION_ERRORS = (OSError, http.client.HTTPException)
+
+
+class _Response:
+    """A response body that returns its connection to the pool once closed.
+
+    The connection is only reused if the body was read to its end; one
+    given up halfway is closed instead of downloading the rest.
+    """
+
+    def __init__(
+        self,
+        transport: "HttpTransport",
+        key: tuple[str, str],
+        connection: http.client.HTTPConnection,
+        response: http.client.HTTPResponse,
+    ):
+        self._transport = transport
+        self._key = key
+        self._connection = connection
+        self._response = response
+        self.status = response.status
+        self.headers = response.headers
+        self._body: BinaryIO = response
+        if response.getheader("Content-Encoding", "").lower() == "gzip":
+            import gzip
+
+            self._body = gzip.GzipFile(fileobj=response, mode="rb")
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            # read(-1) would wait for the end of a kept-alive connection
+            return self._body.read()
+        return self._body.read(size)
+
+    def close(self):
+        if self._connection is None:
+            return
+        response, connection, self._connection = self._response, self._connection, None
+        if not response.isclosed():
+            # A chunked body still has its last, empty chunk to read
+            response.read(DRAIN_LIMIT)
+        if response.isclosed() and not response.will_close:
+            self._transport._release(self._key, connection)
+        else:
+            connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class HttpTransport:
+    """HTTP(S) requests over persistent connections, one kept per host.
+
+    Idempotent requests that fail to connect, lose their connection or get
+    a busy status (RETRY_STATUSES) are retried up to `retries` times, after
+    `backoff`, then twice as long, and so on. A kept connection that the
+    server has closed in the meantime is replaced without counting as a
+    retry. Responses may be gzip-encoded, and so are large request bodies.
+    """
+
+    def __init__(
+        self,
+        *,
+        timeout: float = 60.0,
+        retries: int = 3,
+        backoff: float = 0.5,
+        gzip_requests: bool = True,
+    ):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.gzip_requests = gzip_requests
+        self._idle: dict[tuple[str, str], http.client.HTTPConnection] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        for connection in self._idle.values():
+            connection.close()
+        self._idle.clear()
+
+    def _connect(self, scheme: str, netloc: str) -> http.client.HTTPConnection:
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        if scheme == "http":
+            return http.client.HTTPConnection(netloc, timeout=self.timeout)
+        raise ValueError(f"Unsupported URL scheme: {scheme}")
+
+    def _release(self, key: tuple[str, str], connection: http.client.HTTPConnection):
+        previous = self._idle.pop(key, None)
+        if previous is not None:
+            previous.close()
+        self._idle[key] = connection
+
+    def request(
+        self,
+        url: str,
+        *,
+        data: bytes | None = None,
+        headers: dict[str, str] | None = None,
+        idempotent: bool | None = None,
+    ) -> _Response:
+        """Send a GET, or a POST of `data`, and return the response once it starts.
+
+        Requests are idempotent unless they have a body, or `idempotent`
+        says otherwise. Raises RuntimeError for an error status.
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        method = "GET" if data is None else "POST"
+        if idempotent is None:
+            idempotent = data is None
+
+        headers = {"Accept-Encoding": "gzip", **(headers or {})}
+        if data is not None and self.gzip_requests and len(data) >= GZIP_MIN_SIZE:
+            import gzip
+
+            data = gzip.compress(data)
+            headers["Content-Encoding"] = "gzip"
+
+        attempt = 0
+        while True:
+            connection = self._idle.pop(key, None)
+            reused = connection is not None
+            if connection is None:
+                connection = self._connect(*key)
+            delay = self.backoff * 2**attempt
+            try:
+                connection.request(method, path, body=data, headers=headers)
+                response = connection.getresponse()
+            except CONNECTION_ERRORS:
+                connection.close()
+                if reused and not attempt:
+                    continue  # the server dropped the kept connection
+                if not idempotent or attempt >= self.retries:
+                    raise
+            else:
+                if response.status < 400:
+                    return _Response(self, key, connection, response)
+                reason = response.reason
+                retry_after = response.getheader("Retry-After", "")
+                response.read()
+                if response.will_close:
+                    connection.close()
+                else:
+                    self._release(key, connection)
+                if (
+                    not idempotent
+                    or attempt >= self.retries
+                    or response.status not in RETRY_STATUSES
+                ):
+                    raise RuntimeError(f"HTTP {response.status} {reason} from {url}")
+                if retry_after.isdigit():
+                    delay = max(delay, int(retry_after))
+            time.sleep(delay)
+            attempt += 1
@@ -3,6 +3,8 @@ import os
 import pathlib
 from argparse import ArgumentParser
 
+from app.client import DEFAULT_SOCKET
+
 
 def get_parser():
     parser = ArgumentParser()
@@ -16,8 +18,18 @@ def get_parser():
     cat_file_parser.add_argument(
         "-p", "--pretty-print", action="store_true", help="pretty print"
     )
+    cat_file_parser.add_argument("hash", nargs="?")
+    batch_group = cat_file_parser.add_mutually_exclusive_group()
+    batch_group.add_argument(
+        "--batch", action="store_true", help="print objects named on stdin"
+    )
+    batch_group.add_argument(
+        "--batch-check",
+        action="store_true",
+        help="print the type and size of objects named on stdin",
+    )
     cat_file_parser.add_argument(
-        "hash",
+        "--buffer", action="store_true", help="flush batch output only at the end"
     )
 
     # hash_object
@@ -31,7 +43,10 @@ def get_parser():
     ls_tree_parser.add_argument("hash_value")
 
     # write-tree
-    _write_tree_parser = subparsers.add_parser("write-tree")
+    write_tree_parser = subparsers.add_parser("write-tree")
+    write_tree_parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="threads used to hash files"
+    )
 
     # commit_tree
     commit_tree_parser = subparsers.add_parser("commit-tree")
@@ -43,6 +58,72 @@ def get_parser():
     clone_parser = subparsers.add_parser("clone")
     clone_parser.add_argument("url")
     clone_parser.add_argument("work_dir", type=pathlib.Path)
+    clone_parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="processes used to resolve deltas"
+    )
+    clone_parser.add_argument(
+        "--depth", type=int, help="only fetch this many commits of history"
+    )
+    clone_parser.add_argument(
+        "--filter",
+        dest="filter_spec",
+        help="leave out blobs (blob:none, blob:limit=<n>) until they are needed",
+    )
+
+    # fetch
+    fetch_parser = subparsers.add_parser("fetch")
+    fetch_parser.add_argument("remote", nargs="?", default="origin")
+    fetch_parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="processes used to resolve deltas"
+    )
+
+    # mirror
+    mirror_parser = subparsers.add_parser("mirror")
+    mirror_parser.add_argument("manifest", type=pathlib.Path)
+    mirror_parser.add_argument(
+        "dest", type=pathlib.Path, nargs="?", default=pathlib.Path(".")
+    )
+    mirror_parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=4,
+        help="repositories mirrored at the same time",
+    )
+    mirror_parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="processes used to resolve deltas"
+    )
+
+    # repack: the defaults of app.models.pack, which is not imported here
+    # as every command builds this parser
+    repack_parser = subparsers.add_parser("repack", aliases=["gc"])
+    repack_parser.add_argument(
+        "--window",
+        type=int,
+        default=10,
+        help="objects tried as delta bases for each object",
+    )
+    repack_parser.add_argument(
+        "--depth", type=int, default=50, help="longest chain of deltas"
+    )
+
+    # http-backend
+    http_backend_parser = subparsers.add_parser("http-backend")
+    http_backend_parser.add_argument(
+        "root",
+        type=pathlib.Path,
+        nargs="?",
+        default=pathlib.Path("."),
+        help="directory of the repositories served",
+    )
+    http_backend_parser.add_argument("--bind", default="127.0.0.1")
+    http_backend_parser.add_argument("--port", type=int, default=8000)
+
+    # daemon
+    daemon_parser = subparsers.add_parser("daemon")
+    daemon_parser.add_argument(
+        "--socket", default=DEFAULT_SOCKET, help="Unix socket to listen on"
+    )
 
     return parser
 
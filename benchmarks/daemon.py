@@ -0,0 +1,84 @@
+"""Per-command latency with and without the object server, in milliseconds.
+
+Usage: python -m benchmarks.daemon [REPOSITORY]
+
+Runs `cat-file -p` on blobs of REPOSITORY (default: the current directory)
+three ways: a new `app.main` process per command, a new `app.client`
+process per command forwarding to a daemon, and requests sent straight to
+the daemon socket, as a long-running tool would.
+"""
+
+import contextlib
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from app import client
+from app.daemon import GitDaemon
+
+COMMANDS = 20
+
+
+def blobs(repo: Path) -> list[str]:
+    listing = subprocess.run(
+        ["git", "cat-file", "--batch-all-objects", "--batch-check"],
+        cwd=repo,
+        capture_output=True,
+        check=True,
+    ).stdout.decode()
+    names = [line.split()[0] for line in listing.splitlines() if " blob " in line]
+    return names[:COMMANDS]
+
+
+def measure(label: str, run, names: list[str]):
+    latencies = []
+    for name in names:
+        start = time.perf_counter()
+        run(name)
+        latencies.append((time.perf_counter() - start) * 1000)
+    print(
+        f"{label:<24} median {statistics.median(latencies):8.2f}ms"
+        f"  max {max(latencies):8.2f}ms"
+    )
+
+
+def main():
+    repo = Path(sys.argv[1] if len(sys.argv) > 1 else ".").resolve()
+    env = dict(os.environ, PYTHONPATH=str(Path(__file__).parent.parent))
+    names = blobs(repo)
+
+    def spawn(module: str):
+        def run(name: str):
+            subprocess.run(
+                [sys.executable, "-m", module, "cat-file", "-p", name],
+                cwd=repo,
+                env=env,
+                capture_output=True,
+                check=True,
+            )
+
+        return run
+
+    with contextlib.chdir(repo):
+        measure("process per command", spawn("app.main"), names)
+        with GitDaemon() as server:
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            try:
+                measure("client process", spawn("app.client"), names)
+                measure(
+                    "socket request",
+                    lambda name: client.request(["cat-file", "-p", name]),
+                    names,
+                )
+            finally:
+                server.shutdown()
+                thread.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Delta application and encoding throughput, in MB of target per second.
+
+Usage: python -m benchmarks.delta [REPOSITORY]
+
+Synthetic streams cover the two extremes (long copy runs vs. many tiny
+instructions); real streams are every OFS delta of a pack built from
+REPOSITORY (default: the current directory) with git pack-objects.
+
+Encoding is measured on the same real (base, target) pairs, and on a
+synthetic base with scattered edits; the size of the deltas produced is
+compared with the targets and, for real pairs, with git's own deltas.
+"""
+
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from app.models import delta as delta_module
+from app.models.delta import apply_delta, create_delta, encode_delta_size
+from app.models.pack import OBJ_OFS_DELTA, Pack
+
+REPEAT = 5
+
+
+def synthetic_delta(base_size: int, copy_size: int, insert_size: int):
+    """Alternate `copy_size` copies from the base with `insert_size` literals."""
+    rng = random.Random(0)
+    base = rng.randbytes(base_size)
+    instructions = bytearray()
+    result_size = 0
+    offset = 0
+    while offset + copy_size <= base_size:
+        instructions += b"\xff" + offset.to_bytes(4, "little")
+        instructions += copy_size.to_bytes(3, "little")
+        instructions += bytes([insert_size]) + rng.randbytes(insert_size)
+        result_size += copy_size + insert_size
+        offset += copy_size + insert_size
+    delta = (
+        encode_delta_size(base_size)
+        + encode_delta_size(result_size)
+        + bytes(instructions)
+    )
+    return [(base, delta)]
+
+
+def real_deltas(repository: Path, limit: int = 5000):
+    """(base, delta) pairs for the OFS deltas of a fresh pack of `repository`."""
+    with tempfile.TemporaryDirectory() as tmp:
+        pack_path = Path(tmp) / "bench.pack"
+        pack_path.write_bytes(
+            subprocess.run(
+                [
+                    "git",
+                    "pack-objects",
+                    "--stdout",
+                    "--revs",
+                    "--all",
+                    "--delta-base-offset",
+                ],
+                cwd=repository,
+                input=b"",
+                capture_output=True,
+                check=True,
+            ).stdout
+        )
+        subprocess.run(
+            ["git", "index-pack", str(pack_path)], check=True, capture_output=True
+        )
+        pack = Pack(pack_path.with_suffix(".idx"))
+        pairs = []
+        for _sha1, offset in pack.index:
+            obj_type, size, data_offset, base_offset = pack.data.read_entry_header(
+                offset
+            )
+            if obj_type == OBJ_OFS_DELTA:
+                base = pack.read_at(base_offset).data
+                pairs.append((base, pack.data.inflate(data_offset, size)))
+            if len(pairs) == limit:
+                break
+        pack.close()
+    return pairs
+
+
+def edited_pair(size: int, edits: int):
+    """A random base and a copy with `edits` small replacements and insertions."""
+    rng = random.Random(0)
+    base = rng.randbytes(size)
+    target = bytearray(base)
+    for _ in range(edits):
+        offset = rng.randrange(len(target))
+        target[offset : offset + rng.randrange(32)] = rng.randbytes(rng.randrange(64))
+    return base, bytes(target)
+
+
+def throughput(pairs) -> float:
+    produced = 0
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        produced = sum(len(apply_delta(base, delta)) for base, delta in pairs)
+        best = min(best, time.perf_counter() - start)
+    return produced / best / 1e6
+
+
+def encode_throughput(pairs) -> tuple[float, list[bytes]]:
+    """MB of target encoded per second, and the deltas of the last run."""
+    encoded = sum(len(target) for _, target in pairs)
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        deltas = [create_delta(base, target) for base, target in pairs]
+        best = min(best, time.perf_counter() - start)
+    return encoded / best / 1e6, deltas
+
+
+def main():
+    repository = Path(sys.argv[1] if len(sys.argv) > 1 else ".")
+    workloads = {
+        "synthetic, 4KiB copies": synthetic_delta(8 << 20, 4096, 16),
+        "synthetic, 16B copies": synthetic_delta(1 << 20, 16, 4),
+        f"real, {repository.resolve().name}": real_deltas(repository),
+    }
+    engines = {"python": None}
+    if delta_module._compiled_apply_delta is not None:
+        engines["compiled"] = delta_module._compiled_apply_delta
+
+    compiled = delta_module._compiled_apply_delta
+    for name, pairs in workloads.items():
+        if not pairs:
+            print(f"{name:<32} no deltas")
+            continue
+        for engine, implementation in engines.items():
+            delta_module._compiled_apply_delta = implementation
+            print(f"{name:<32} {engine:<9} {throughput(pairs):10.1f} MB/s")
+    delta_module._compiled_apply_delta = compiled
+
+    real = workloads[f"real, {repository.resolve().name}"]
+    encodings = {
+        "encode, 1MiB with 100 edits": [(*edited_pair(1 << 20, 100), None)],
+        f"encode, real {repository.resolve().name}": [
+            (base, apply_delta(base, delta), delta) for base, delta in real
+        ],
+    }
+    for name, triples in encodings.items():
+        if not triples:
+            continue
+        pairs = [(base, target) for base, target, _ in triples]
+        speed, deltas = encode_throughput(pairs)
+        size = sum(len(delta) for delta in deltas)
+        targets = sum(len(target) for _, target, _ in triples)
+        line = f"{name:<32} {speed:10.1f} MB/s  {size / targets:7.2%} of target"
+        if triples[0][2] is not None:
+            git_size = sum(len(delta) for _, _, delta in triples)
+            line += f", {size / git_size:7.2%} of git's"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
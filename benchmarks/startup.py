@@ -0,0 +1,123 @@
+"""Import time of each subcommand, from `python -X importtime`.
+
+Usage: python -m benchmarks.startup [REPOSITORY]
+
+Runs the local subcommands in a copy of REPOSITORY (default: the current
+directory) and reports how long the imports done by `app.main` took, in
+milliseconds, and which heavy modules they pulled in.
+"""
+
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+# Modules only `clone` and the parallel modes should need
+HEAVY_MODULES = {
+    "app.models.clone",
+    "concurrent.futures",
+    "email.parser",
+    "http.client",
+    "multiprocessing",
+    "socket",
+    "ssl",
+    "urllib.request",
+}
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def import_profile(
+    argv: list[str], cwd: Path, *, stdin: bytes = b""
+) -> tuple[float, set[str]]:
+    """Run `app.main` with `argv` in `cwd`.
+
+    Returns the milliseconds spent importing `app.main` and whatever it
+    imported lazily while the command ran, and the names of every module
+    imported by the process.
+    """
+    result = subprocess.run(
+        # -I keeps the current directory off sys.path, so the repository's
+        # own files cannot shadow modules
+        [sys.executable, "-I", "-X", "importtime", "-c", _RUN_MAIN, *argv],
+        cwd=cwd,
+        input=stdin,
+        capture_output=True,
+        check=False,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{argv} failed:\n{result.stderr.decode()}")
+
+    modules = set()
+    top_level = []  # (name, cumulative µs) of imports not nested in another
+    for line in result.stderr.decode().splitlines():
+        if match := LINE.match(line):
+            _, cumulative, indent, name = match.groups()
+            modules.add(name)
+            if not indent:
+                top_level.append((name, int(cumulative)))
+    # Each import is reported once its own imports are done, so app.main
+    # comes after everything it pulled in and before any lazy import
+    names = [name for name, _ in top_level]
+    start = names.index("app.main")
+    return sum(cumulative for _, cumulative in top_level[start:]) / 1000, modules
+
+
+# Runs app.main from the repository root despite -I, passing argv through
+_RUN_MAIN = f"""
+import sys
+sys.path.insert(0, {str(ROOT)!r})
+from app.main import main
+main(sys.argv[1:])
+"""
+
+
+def local_commands(repo: Path) -> list[tuple[list[str], bytes]]:
+    """(argv, stdin) of a run of every local subcommand in `repo`."""
+
+    def rev_parse(name: str) -> str:
+        return (
+            subprocess.run(
+                ["git", "rev-parse", name], cwd=repo, capture_output=True, check=True
+            )
+            .stdout.decode()
+            .strip()
+        )
+
+    tree = rev_parse("HEAD^{tree}")
+    blob = (
+        subprocess.run(
+            ["git", "ls-tree", "-r", "HEAD"], cwd=repo, capture_output=True, check=True
+        )
+        .stdout.split()[2]
+        .decode()
+    )
+    return [
+        (["cat-file", "-p", blob], b""),
+        (["cat-file", "--batch-check"], f"{blob}\n{tree}\n".encode()),
+        (["ls-tree", "--name-only", tree], b""),
+        (["hash-object", "-w", ".git/HEAD"], b""),
+        (["write-tree"], b""),
+        (["commit-tree", tree, "-m", "Startup"], b""),
+    ]
+
+
+def main():
+    source = Path(sys.argv[1] if len(sys.argv) > 1 else ".").resolve()
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Path(tmp) / "repo"
+        shutil.copytree(source, repo, symlinks=True)
+        for argv, stdin in local_commands(repo):
+            milliseconds, modules = import_profile(argv, repo, stdin=stdin)
+            heavy = sorted(HEAVY_MODULES & modules)
+            print(
+                f"{' '.join(argv[:2])[:24]:<24} {milliseconds:7.1f}ms"
+                f"  heavy: {', '.join(heavy) or '-'}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import gzip
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "Author Name",
+    "GIT_AUTHOR_EMAIL": "author@email.com",
+    "GIT_COMMITTER_NAME": "Committer Name",
+    "GIT_COMMITTER_EMAIL": "committer@email.com",
+    "GIT_CONFIG_NOSYSTEM": "1",
+    "HOME": "/nonexistent",
+}
+
+
+def run_git(cwd, *args, input: bytes | None = None, env: dict | None = None) -> bytes:
+    result = subprocess.run(
+        ["git", *args],
+        cwd=cwd,
+        input=input,
+        capture_output=True,
+        check=False,
+        env={**GIT_ENV, **(env or {})},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to run git command: {args}\n{result.stderr}")
+    return result.stdout
+
+
+@pytest.fixture
+def source_repo(tmp_path):
+    """Create a repository with a few commits so its pack contains deltas.
+
+    Creates:
+        source/
+            ├── README.md (rewritten by every commit)
+            ├── run.sh (executable)
+            └── src/
+                └── lib/
+                    └── module.py (grows by every commit)
+    """
+    repo = tmp_path / "source"
+    (repo / "src" / "lib").mkdir(parents=True)
+    run_git(repo, "init", "-q", "-b", "main", ".")
+
+    script = repo / "run.sh"
+    script.write_text("#!/bin/sh\necho hello\n")
+    script.chmod(0o755)
+    lines = [f"def function_{i}():\n    return {i}\n" for i in range(200)]
+    for commit in range(5):
+        (repo / "README.md").write_text(f"# Project\n\nRevision {commit}\n" * 20)
+        (repo / "src" / "lib" / "module.py").write_text(
+            "".join(lines[: 100 + commit * 25])
+        )
+        run_git(repo, "add", ".")
+        run_git(repo, "commit", "-q", "-m", f"Commit {commit}")
+    return repo
+
+
+@pytest.fixture
+def source_pack(source_repo) -> bytes:
+    """Pack file (with OFS deltas) holding the full history of `source_repo`."""
+    return run_git(source_repo, "pack-objects", "--stdout", "--revs", input=b"HEAD\n")
+
+
+def all_objects(repo) -> set[str]:
+    output = run_git(repo, "rev-list", "--objects", "--all").decode()
+    return {line.split()[0] for line in output.splitlines()}
+
+
+def add_commits(repo, count: int, *, start: int = 5):
+    """Commit `count` more revisions of the files made by `source_repo`."""
+    for commit in range(start, start + count):
+        with (repo / "src" / "lib" / "module.py").open("a") as f:
+            f.write(f"def later_{commit}():\n    return {commit}\n")
+        (repo / "NEWS.md").write_text(f"Release {commit}\n")
+        run_git(repo, "add", ".")
+        run_git(repo, "commit", "-q", "-m", f"Commit {commit}")
+    return run_git(repo, "rev-parse", "HEAD").decode().strip()
+
+
+UPLOAD_PACK = ["-c", "uploadpack.allowFilter=true", "upload-pack", "--stateless-rpc"]
+
+
+class _UploadPackHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections alive
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path != "/source.git/info/refs?service=git-upload-pack":
+            return self._respond(b"", status=404)
+        advertisement = run_git(
+            self.server.repo, *UPLOAD_PACK, "--advertise-refs", ".", env=self._env()
+        )
+        self._respond(b"001e# service=git-upload-pack\n0000" + advertisement)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path != "/source.git/git-upload-pack":
+            return self._respond(b"", status=404)
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+            self.server.gzipped_requests += 1
+        self.server.requests.append(body)
+        self._respond(
+            run_git(self.server.repo, *UPLOAD_PACK, ".", input=body, env=self._env())
+        )
+
+    def _env(self) -> dict:
+        protocol = self.headers.get("Git-Protocol")
+        if protocol is None or not self.server.protocol_v2:
+            return {}
+        return {"GIT_PROTOCOL": protocol}
+
+    def _respond(self, body: bytes, *, status: int = 200):
+        if self.server.failures:
+            self.server.failures -= 1
+            body, status = b"busy", 503
+        self.send_response(status)
+        if self.server.gzip_responses and "gzip" in self.headers.get(
+            "Accept-Encoding", ""
+        ):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        # Without telling the client, as servers timing out idle connections do
+        self.close_connection = self.server.drop_connections
+
+
+class FakeRemote(ThreadingHTTPServer):
+    """A smart-HTTP remote serving `repo` on localhost, backed by git itself.
+
+    It speaks protocol v2 to clients asking for it unless `protocol_v2` is
+    False, gzips responses when `gzip_responses` is set, closes connections
+    after each response when `drop_connections` is set and answers the next
+    `failures` requests with 503. Upload-pack request bodies are
+    recorded in `requests`, and accepted TCP connections counted.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, repo):
+        super().__init__(("127.0.0.1", 0), _UploadPackHandler)
+        self.repo = repo
+        self.url = f"http://127.0.0.1:{self.server_port}/source.git"
+        self.protocol_v2 = True
+        self.gzip_responses = False
+        self.drop_connections = False
+        self.failures = 0
+        self.requests: list[bytes] = []
+        self.gzipped_requests = 0
+        self.connections = 0
+
+
+@pytest.fixture
+def remote_server(source_repo):
+    """Serve `source_repo` over smart HTTP on a local port."""
+    server = FakeRemote(source_repo)
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+    )
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@pytest.fixture
+def fake_remote(remote_server) -> str:
+    """URL of `source_repo` served by `remote_server`."""
+    return remote_server.url
+
+
+@pytest.fixture
+def backend(tmp_path, source_repo):
+    """Serve the repositories of `tmp_path`, `source_repo` among them."""
+    from app.http_backend import GitHttpServer
+
+    server = GitHttpServer(tmp_path, port=0)
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+    )
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
@@ -0,0 +1,426 @@
+import contextlib
+import io
+import os
+import time
+
+import pytest
+from conftest import add_commits, all_objects, run_git
+
+from app.main import Git
+from app.models.clone import GitClone, StreamingCheckout, _prefetch
+from app.models.git import _HaveWalker
+from app.models.index import GitIndex
+from app.models.pack import PackStream
+from app.models.store import ObjectStore
+
+
+def fetch_requests(remote) -> list[bytes]:
+    """Pack requests sent to `remote` so far, ref listings left out."""
+    return [body for body in remote.requests if b"command=ls-refs" not in body]
+
+
+def sideband_response(pack: bytes, *, size: int = 1000) -> bytes:
+    """Frame `pack` the way upload-pack does with side-band-64k."""
+    parts = [GitClone.format_pkt_line("NAK\n")]
+    parts.append(GitClone.format_pkt_line(b"\x02Counting objects: done\n"))
+    for i in range(0, len(pack), size):
+        parts.append(GitClone.format_pkt_line(b"\x01" + pack[i : i + size]))
+    parts.append(b"0000")
+    return b"".join(parts)
+
+
+class TestPackStreaming:
+    def test_demux_sideband(self, source_pack):
+        response = io.BytesIO(sideband_response(source_pack))
+        chunks = list(GitClone._demux_pack_data(response))
+        assert len(chunks) > 1
+        assert b"".join(chunks) == source_pack
+
+    def test_demux_raw_pack(self, source_pack):
+        response = io.BytesIO(GitClone.format_pkt_line("NAK\n") + source_pack)
+        chunks = GitClone._demux_pack_data(response, chunk_size=512)
+        assert b"".join(chunks) == source_pack
+
+    def test_demux_error_channel(self):
+        response = io.BytesIO(GitClone.format_pkt_line(b"\x03access denied"))
+        with pytest.raises(RuntimeError, match="access denied"):
+            list(GitClone._demux_pack_data(response))
+
+    @pytest.mark.parametrize("jobs", [1, 2])
+    @pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+    def test_parse_pack_objects(
+        self, tmp_path, source_repo, source_pack, chunk_size, jobs
+    ):
+        clone = GitClone("unused", jobs=jobs)
+        pack_path = tmp_path / "received.pack"
+        with pack_path.open("wb") as sink:
+            pack = PackStream.from_bytes(source_pack, chunk_size=chunk_size, sink=sink)
+            header = clone.parse_pack_header(pack)
+            assert header.version == 2
+            entries = clone.parse_pack_objects(pack, header.num_objects)
+            assert len(entries) == header.num_objects
+            # Only the 20-byte trailer is left unread
+            assert pack.read_trailer() == source_pack[-20:].hex()
+
+        assert any(entry.is_delta and entry.sha1 is None for entry in entries)
+        clone.resolve_deltas(entries, pack_path)
+        assert {entry.sha1 for entry in entries} == all_objects(source_repo)
+
+    def test_prefetch(self):
+        produced = []
+
+        def chunks():
+            for i in range(100):
+                produced.append(i)
+                yield bytes([i])
+
+        received = _prefetch(chunks(), maxsize=4)
+        assert next(received) == b"\x00"
+        time.sleep(0.05)
+        # The receiver ran ahead of the reader, but no further than the queue
+        assert 1 < len(produced) <= 1 + 4 + 1
+        assert b"".join(received) == bytes(range(1, 100))
+
+    def test_prefetch_errors_and_early_stop(self):
+        closed = []
+
+        def chunks():
+            try:
+                yield b"PACK"
+                raise ConnectionResetError("lost")
+            finally:
+                closed.append(True)
+
+        received = _prefetch(chunks(), maxsize=4)
+        assert next(received) == b"PACK"
+        with pytest.raises(ConnectionResetError, match="lost"):
+            next(received)
+
+        received = _prefetch(chunks(), maxsize=1)
+        next(received)
+        received.close()
+        assert closed == [True, True]
+
+
+class TestPackStorage:
+    def test_store_pack_matches_index_pack(self, tmp_path, source_repo, source_pack):
+        clone = GitClone("unused")
+        git_dir = tmp_path / "clone" / ".git"
+        tmp_pack = tmp_path / "received.pack"
+        with tmp_pack.open("wb") as sink:
+            pack = PackStream.from_bytes(source_pack, chunk_size=100, sink=sink)
+            header = clone.parse_pack_header(pack)
+            entries = clone.parse_pack_objects(pack, header.num_objects)
+            pack_sha1 = pack.read_trailer()
+
+        clone.resolve_deltas(entries, tmp_pack)
+        stored = clone.store_pack(entries, pack_sha1, tmp_pack, git_dir)
+
+        assert set(stored) == all_objects(source_repo)
+        pack_path = git_dir / "objects" / "pack" / f"pack-{pack_sha1}.pack"
+        assert pack_path.read_bytes() == source_pack
+        assert not tmp_pack.exists()
+
+        # Byte-for-byte identical to the index git itself builds
+        reference = tmp_path / "reference.pack"
+        reference.write_bytes(source_pack)
+        run_git(tmp_path, "index-pack", str(reference))
+        idx_path = pack_path.with_suffix(".idx")
+        assert idx_path.read_bytes() == reference.with_suffix(".idx").read_bytes()
+
+    def test_corrupt_pack_trailer(self, source_pack):
+        clone = GitClone("unused")
+        pack = PackStream.from_bytes(source_pack[:-1] + b"\x00")
+        header = clone.parse_pack_header(pack)
+        clone.parse_pack_objects(pack, header.num_objects)
+        with pytest.raises(ValueError, match="checksum"):
+            pack.read_trailer()
+
+    @pytest.mark.parametrize("jobs", [1, 2])
+    def test_clone(self, tmp_path, source_repo, fake_remote, jobs):
+        work_dir = tmp_path / "clone"
+        Git().clone(fake_remote, work_dir, jobs=jobs)
+
+        pack_dir = work_dir / ".git" / "objects" / "pack"
+        assert [path.suffix for path in sorted(pack_dir.iterdir())] == [".idx", ".pack"]
+        assert run_git(work_dir, "fsck", "--strict") == b""
+        assert run_git(work_dir, "diff-files", "--quiet") == b""
+        assert run_git(work_dir, "status", "--porcelain") == b""
+        assert (work_dir / "src" / "lib" / "module.py").read_bytes() == (
+            source_repo / "src" / "lib" / "module.py"
+        ).read_bytes()
+        assert (work_dir / "run.sh").stat().st_mode & 0o111
+
+        # The index caches the same trees git derives from HEAD
+        run_git(work_dir, "read-tree", f"--index-output={tmp_path / 'index'}", "HEAD")
+        index = GitIndex.read(work_dir / ".git" / "index")
+        assert index.trees == GitIndex.read(tmp_path / "index").trees
+        assert sorted(index.trees) == ["", "src", "src/lib"]
+
+    def test_ref_prefixes(self, source_repo, fake_remote):
+        for i in range(3):
+            run_git(source_repo, "tag", f"v{i}", f"HEAD~{i}")
+        run_git(source_repo, "update-ref", "refs/pull/1/head", "HEAD~1")
+        head = run_git(source_repo, "rev-parse", "HEAD").decode().strip()
+
+        with GitClone(fake_remote) as clone:
+            assert clone.protocol_version == 2
+            assert sorted(clone.refs) == ["HEAD", "refs/heads/main"]
+            assert clone.refs["HEAD"].sha1 == head
+        with GitClone(fake_remote, ref_prefixes=["refs/tags/v1"]) as clone:
+            assert list(clone.refs) == ["refs/tags/v1"]
+
+    def test_protocol_v0_fallback(self, source_repo, fake_remote, remote_server):
+        run_git(source_repo, "tag", "v0")
+        remote_server.protocol_v2 = False
+        with GitClone(fake_remote) as clone:
+            assert clone.protocol_version == 0
+            # Without ls-refs every ref is advertised
+            assert "refs/tags/v0" in clone.refs
+            assert "shallow" in clone.capabilities
+
+    @pytest.mark.parametrize("protocol_v2", [True, False])
+    @pytest.mark.parametrize("depth", [1, 2])
+    def test_shallow_clone(
+        self, tmp_path, source_repo, fake_remote, remote_server, depth, protocol_v2
+    ):
+        remote_server.protocol_v2 = protocol_v2
+        work_dir = tmp_path / "clone"
+        Git().clone(fake_remote, work_dir, depth=depth)
+
+        head = run_git(source_repo, "rev-parse", "HEAD").decode().strip()
+        cut = run_git(source_repo, "rev-parse", f"HEAD~{depth - 1}").decode().strip()
+        assert (work_dir / ".git" / "shallow").read_text() == f"{cut}\n"
+        assert run_git(work_dir, "rev-list", "--count", "HEAD") == f"{depth}\n".encode()
+        assert run_git(work_dir, "fsck", "--strict") == b""
+        assert run_git(work_dir, "status", "--porcelain") == b""
+        assert run_git(work_dir, "rev-parse", "HEAD").decode().strip() == head
+        assert len(all_objects(work_dir)) < len(all_objects(source_repo))
+
+    def test_shallow_clone_unsupported(self, fake_remote):
+        with GitClone(fake_remote, depth=1) as clone:
+            clone.capabilities.remove("shallow")
+            with pytest.raises(RuntimeError, match="shallow"):
+                clone.send_want_request()
+
+    @pytest.mark.parametrize("filter_spec", ["blob:none", "blob:limit=200"])
+    def test_partial_clone(
+        self,
+        tmp_path,
+        source_repo,
+        fake_remote,
+        remote_server,
+        filter_spec,
+        monkeypatch,
+    ):
+        monkeypatch.setattr("app.models.git.FETCH_BATCH_SIZE", 2)
+        work_dir = tmp_path / "clone"
+        Git().clone(fake_remote, work_dir, filter_spec=filter_spec)
+
+        assert run_git(work_dir, "config", "extensions.partialClone") == b"origin\n"
+        assert run_git(work_dir, "config", "remote.origin.url").decode().strip() == (
+            fake_remote
+        )
+        pack_dir = work_dir / ".git" / "objects" / "pack"
+        promisor_packs = list(pack_dir.glob("*.promisor"))
+        assert len(promisor_packs) == len(fetch_requests(remote_server))
+        assert run_git(work_dir, "fsck", "--strict") == b""
+        assert run_git(work_dir, "status", "--porcelain") == b""
+        assert (work_dir / "src" / "lib" / "module.py").read_bytes() == (
+            source_repo / "src" / "lib" / "module.py"
+        ).read_bytes()
+
+        blobs = run_git(source_repo, "ls-tree", "-r", "HEAD").split()[2::4]
+        old_readme = run_git(source_repo, "rev-parse", "HEAD~3:README.md").strip()
+        old_readme = old_readme.decode()
+        if filter_spec == "blob:none":
+            # The checkout fetched the blobs of HEAD in batches of two
+            assert len(fetch_requests(remote_server)) == 1 + (len(blobs) + 1) // 2
+            with ObjectStore(work_dir / ".git" / "objects") as store:
+                assert old_readme not in store
+
+        with contextlib.chdir(work_dir):
+            assert Git().cat_file(old_readme).body == run_git(
+                source_repo, "cat-file", "blob", old_readme
+            )
+
+    def test_partial_clone_unsupported_filter(self):
+        with pytest.raises(ValueError, match="filter"):
+            GitClone("unused", filter_spec="tree:0")
+
+
+class TestFetch:
+    @pytest.mark.parametrize("protocol_v2", [True, False])
+    def test_fetch(
+        self, tmp_path, source_repo, fake_remote, remote_server, protocol_v2
+    ):
+        remote_server.protocol_v2 = protocol_v2
+        work_dir = tmp_path / "clone"
+        Git().clone(fake_remote, work_dir)
+        old_head = run_git(work_dir, "rev-parse", "HEAD").decode().strip()
+        head = add_commits(source_repo, 3)
+        run_git(source_repo, "branch", "feature", "HEAD~1")
+        remote_server.requests.clear()
+
+        with contextlib.chdir(work_dir):
+            updates = Git().fetch()
+        assert updates == {
+            "refs/remotes/origin/main": head,
+            "refs/remotes/origin/feature": run_git(source_repo, "rev-parse", "feature")
+            .decode()
+            .strip(),
+        }
+        assert run_git(work_dir, "rev-parse", "origin/main").decode().strip() == head
+        # The thin pack was completed with the bases we already had
+        assert run_git(work_dir, "fsck", "--strict") == b""
+        have = f"have {old_head}".encode()
+        assert any(have in body for body in fetch_requests(remote_server))
+        new_objects = run_git(
+            source_repo, "rev-list", "--objects", f"{old_head}..{head}"
+        ).splitlines()
+        new_pack = max(
+            (work_dir / ".git" / "objects" / "pack").glob("*.idx"),
+            key=lambda path: path.stat().st_mtime_ns,
+        )
+        listing = run_git(work_dir, "show-index", input=new_pack.read_bytes())
+        # New objects, plus the bases appended to complete the thin pack
+        assert (
+            len(new_objects) < len(listing.splitlines()) < len(all_objects(source_repo))
+        )
+
+        # Nothing changed since: no pack is requested
+        remote_server.requests.clear()
+        with contextlib.chdir(work_dir):
+            assert Git().fetch() == {}
+        assert fetch_requests(remote_server) == []
+
+    def test_fetch_into_shallow_clone(self, tmp_path, source_repo, fake_remote):
+        work_dir = tmp_path / "clone"
+        Git().clone(fake_remote, work_dir, depth=1)
+        head = add_commits(source_repo, 2)
+
+        with contextlib.chdir(work_dir):
+            Git().fetch()
+        assert run_git(work_dir, "rev-parse", "origin/main").decode().strip() == head
+        assert run_git(work_dir, "fsck", "--strict") == b""
+        assert run_git(work_dir, "rev-list", "--count", "origin/main") == b"3\n"
+
+    def test_unknown_remote(self, tmp_path, source_repo, fake_remote):
+        work_dir = tmp_path / "clone"
+        Git().clone(fake_remote, work_dir)
+        with contextlib.chdir(work_dir), pytest.raises(ValueError, match="upstream"):
+            Git().fetch("upstream")
+
+    @pytest.mark.parametrize(
+        "offered, requested",
+        [
+            (
+                ["multi_ack_detailed", "no-done", "thin-pack", "ofs-delta"],
+                "multi_ack_detailed no-done thin-pack ofs-delta",
+            ),
+            (["multi_ack", "no-done", "side-band-64k"], "multi_ack side-band-64k"),
+            (["agent=git/1.0"], ""),
+        ],
+    )
+    def test_v0_requests_only_offered_capabilities(
+        self, monkeypatch, offered, requested
+    ):
+        clone = GitClone("unused")
+        clone.protocol_version = 0
+        clone.capabilities = offered
+        bodies = []
+
+        def negotiate_pack(fetch_body, haves, *, on_common):
+            bodies.append(fetch_body(haves=[]))
+            return iter(())
+
+        monkeypatch.setattr(clone, "_negotiate_pack", negotiate_pack)
+        clone.send_fetch_request(["a" * 40], [])
+        want = f"want {'a' * 40} {requested}".strip()
+        assert bodies[0].startswith(GitClone.format_pkt_line(f"{want}\n"))
+
+    def test_haves_stop_at_common_commits(self, source_repo):
+        head, parent = run_git(source_repo, "rev-parse", "HEAD", "HEAD~1").split()
+        head, parent = head.decode(), parent.decode()
+        with ObjectStore(source_repo / ".git" / "objects") as store:
+            walker = _HaveWalker(store, [head, head])
+            haves = []
+            for sha1 in walker:
+                haves.append(sha1)
+                walker.mark_common(parent)
+            assert haves == [head]
+
+            walker = _HaveWalker(store, [head])
+            history = run_git(source_repo, "rev-list", "HEAD").decode().split()
+            assert list(walker) == history
+
+
+class TestCheckout:
+    @pytest.mark.parametrize("workers", [1, 4])
+    def test_streaming_checkout(self, tmp_path, source_repo, source_pack, workers):
+        head = run_git(source_repo, "rev-parse", "HEAD").decode().strip()
+        tree_sha = run_git(source_repo, "rev-parse", "HEAD^{tree}").decode().strip()
+        dest = tmp_path / "checkout"
+        clone = GitClone("unused")
+        with StreamingCheckout(head, dest, workers=workers) as streaming:
+            pack = PackStream.from_bytes(source_pack, chunk_size=100)
+            header = clone.parse_pack_header(pack)
+            clone.parse_pack_objects(pack, header.num_objects, on_object=streaming.add)
+
+        # Git packs the newest version of every file whole
+        assert sorted(streaming.written) == ["README.md", "run.sh", "src/lib/module.py"]
+        assert (dest / "run.sh").stat().st_mode & 0o111
+        module = (source_repo / "src" / "lib" / "module.py").read_bytes()
+        assert (dest / "src" / "lib" / "module.py").read_bytes() == module
+
+        # The checkout only records them in the index
+        written = {path: entry for path, (entry, _) in streaming.written.items()}
+        (dest / "README.md").write_text("changed since")
+        with ObjectStore(source_repo / ".git" / "objects") as store:
+            stats = clone.checkout(
+                tree_sha,
+                store,
+                dest,
+                index_path=tmp_path / "index",
+                written=streaming.written,
+            )
+        assert stats.files == 3
+        assert (dest / "README.md").read_text() == "changed since"
+        index = GitIndex.read(tmp_path / "index")
+        assert index.entries == written
+
+    def test_streaming_checkout_other_commit(self, tmp_path, source_repo, source_pack):
+        parent = run_git(source_repo, "rev-parse", "HEAD~1").decode().strip()
+        clone = GitClone("unused")
+        with StreamingCheckout(parent, tmp_path / "checkout") as streaming:
+            pack = PackStream.from_bytes(source_pack)
+            header = clone.parse_pack_header(pack)
+            clone.parse_pack_objects(pack, header.num_objects, on_object=streaming.add)
+        # Older versions are deltas: left to the checkout after resolution
+        assert "src/lib/module.py" not in streaming.written
+
+    @pytest.mark.parametrize("workers", [1, 4])
+    def test_checkout(self, tmp_path, source_repo, workers):
+        (source_repo / "latest.py").symlink_to("src/lib/module.py")
+        gitlink = f"160000,{'1' * 40},vendor"
+        run_git(source_repo, "update-index", "--add", "--cacheinfo", gitlink)
+        run_git(source_repo, "add", "latest.py")
+        run_git(source_repo, "commit", "-q", "-m", "Add link and submodule")
+        tree_sha = run_git(source_repo, "rev-parse", "HEAD^{tree}").decode().strip()
+
+        dest = tmp_path / "checkout"
+        clone = GitClone("unused", checkout_workers=workers)
+        with ObjectStore(source_repo / ".git" / "objects") as store:
+            stats = clone.checkout(tree_sha, store, dest)
+
+        module = (source_repo / "src" / "lib" / "module.py").read_bytes()
+        readme = (source_repo / "README.md").read_bytes()
+        script = (source_repo / "run.sh").read_bytes()
+        assert stats.files == 4
+        assert stats.bytes == len(module + readme + script + b"src/lib/module.py")
+        assert (dest / "src" / "lib" / "module.py").read_bytes() == module
+        assert os.readlink(dest / "latest.py") == "src/lib/module.py"
+        assert (dest / "run.sh").stat().st_mode & 0o111
+        assert not (dest / "README.md").stat().st_mode & 0o111
+        assert (dest / "vendor").is_dir()
+        assert "files/s" in str(stats)
@@ -0,0 +1,97 @@
+import base64
+import contextlib
+import io
+import os
+import threading
+
+import pytest
+from conftest import all_objects, run_git
+
+from app import client
+from app.daemon import GitDaemon
+
+
+@pytest.fixture
+def daemon(source_repo):
+    with contextlib.chdir(source_repo):
+        server = GitDaemon()
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            yield server
+        finally:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+
+
+def run(argv, **kwargs) -> tuple[int, bytes, str]:
+    response = client.request(argv, **kwargs)
+    assert response["elapsed"] >= 0
+    return response["status"], base64.b64decode(response["stdout"]), response["stderr"]
+
+
+class TestDaemon:
+    def test_commands(self, daemon, source_repo):
+        head_tree = run_git(source_repo, "rev-parse", "HEAD^{tree}").decode().strip()
+        readme = run_git(source_repo, "rev-parse", "HEAD:README.md").decode().strip()
+
+        status, stdout, _ = run(["cat-file", "-p", readme])
+        assert status == 0
+        assert stdout == (source_repo / "README.md").read_bytes()
+
+        status, stdout, _ = run(["ls-tree", "--name-only", head_tree])
+        assert stdout == b"README.md\nrun.sh\nsrc\n"
+
+        names = "".join(f"{name}\n" for name in all_objects(source_repo)).encode()
+        status, stdout, _ = run(["cat-file", "--batch-check"], stdin=names)
+        assert stdout == run_git(source_repo, "cat-file", "--batch-check", input=names)
+
+    def test_errors(self, daemon, source_repo, tmp_path):
+        status, _, stderr = run(["cat-file"])
+        assert status == 2
+        assert "an object is required" in stderr
+
+        status, _, stderr = run(["cat-file", "-p", "0" * 40])
+        assert status == 1
+        assert "KeyError" in stderr
+
+        status, _, stderr = run(["daemon"])
+        assert status == 1
+        for command in (["http-backend", "--port", "0"], ["mirror", "repos.txt"]):
+            status, _, stderr = run(command)
+            assert status == 1
+            assert f"does not run {command[0]}" in stderr
+
+        with contextlib.chdir(tmp_path):
+            socket_path = str(source_repo / ".git" / "daemon.sock")
+            status, _, stderr = run(["init"], socket_path=socket_path)
+        assert status == 1
+        assert "This daemon serves" in stderr
+        assert not (tmp_path / ".git").exists()
+
+    def test_second_daemon_is_refused(self, daemon):
+        with pytest.raises(RuntimeError, match="already listening"):
+            GitDaemon(daemon.server_address)
+
+    def test_socket_is_removed(self, source_repo):
+        with contextlib.chdir(source_repo):
+            with GitDaemon():
+                assert os.path.exists(client.DEFAULT_SOCKET)
+            assert not os.path.exists(client.DEFAULT_SOCKET)
+
+
+class TestClient:
+    def test_forwards_to_daemon(self, daemon, source_repo, capsysbinary):
+        readme = run_git(source_repo, "rev-parse", "HEAD:README.md").decode().strip()
+        assert client.main(["cat-file", "-p", readme]) == 0
+        assert capsysbinary.readouterr().out == (source_repo / "README.md").read_bytes()
+
+    def test_runs_in_process_without_daemon(self, source_repo, capsys, monkeypatch):
+        readme = run_git(source_repo, "rev-parse", "HEAD:README.md").decode().strip()
+        stdin = io.TextIOWrapper(io.BytesIO(f"{readme}\n".encode()))
+        monkeypatch.setattr("sys.stdin", stdin)
+        with contextlib.chdir(source_repo):
+            assert client.main(["cat-file", "--batch-check"]) == 0
+        size = len((source_repo / "README.md").read_bytes())
+        assert capsys.readouterr().out == f"{readme} blob {size}\n"
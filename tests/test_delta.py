@@ -0,0 +1,118 @@
+import pytest
+
+from app.models import delta as delta_module
+from app.models.delta import (
+    DeltaError,
+    DeltaIndex,
+    apply_delta,
+    create_delta,
+    encode_delta_size,
+)
+
+
+def copy_op(offset: int, size: int) -> bytes:
+    cmd = 0x80 | 0x0F | 0x70
+    return bytes([cmd]) + offset.to_bytes(4, "little") + size.to_bytes(3, "little")
+
+
+@pytest.fixture(params=["python", "compiled"])
+def engine(request, monkeypatch):
+    if request.param == "python":
+        monkeypatch.setattr(delta_module, "_compiled_apply_delta", None)
+    elif delta_module._compiled_apply_delta is None:
+        pytest.skip("no compiled delta engine installed")
+    return request.param
+
+
+class TestApplyDelta:
+    def test_copy_and_insert(self, engine):
+        base = b"hello world"
+        delta = (
+            encode_delta_size(11)
+            + encode_delta_size(12)
+            + copy_op(6, 5)
+            + b"\x02, "
+            + copy_op(0, 5)
+        )
+        assert apply_delta(base, delta) == b"world, hello"
+
+    def test_default_copy_size(self, engine):
+        base = bytes(range(256)) * 512
+        # Copy with no size bytes copies 64KiB
+        delta = encode_delta_size(len(base)) + encode_delta_size(0x10000) + b"\x80"
+        assert apply_delta(base, delta) == base[:0x10000]
+
+    def test_base_size_mismatch(self, engine):
+        delta = encode_delta_size(4) + encode_delta_size(3) + copy_op(0, 3)
+        with pytest.raises(DeltaError, match="base"):
+            apply_delta(b"abc", delta)
+
+    @pytest.mark.parametrize(
+        "instructions",
+        [
+            copy_op(2, 3),  # copies past the end of the base
+            b"\x03ab",  # insert runs past the end of the delta
+            b"\x00",  # reserved opcode
+            copy_op(0, 2),  # produces less than declared
+            copy_op(0, 3) + b"\x01x",  # produces more than declared
+        ],
+    )
+    def test_corrupt_delta(self, engine, instructions):
+        delta = encode_delta_size(3) + encode_delta_size(3) + instructions
+        with pytest.raises(DeltaError):
+            apply_delta(b"abc", delta)
+
+
+class TestCreateDelta:
+    @pytest.mark.parametrize(
+        "target",
+        [
+            b"",
+            b"short",
+            b"head " + bytes(range(256)) * 40 + b" tail",
+            bytes(range(256)) * 20 + b"inserted" * 50 + bytes(range(256)) * 20,
+            bytes(range(255, -1, -1)) * 40,
+        ],
+    )
+    def test_round_trip(self, target):
+        base = bytes(range(256)) * 40
+        delta = create_delta(base, target)
+        assert apply_delta(base, delta) == target
+
+    def test_copies_are_split(self):
+        base = bytes(range(256)) * 1024
+        delta = create_delta(base, base)
+        # Four copies of 64KiB, against the 256KiB of a literal target
+        assert len(delta) < 40
+        assert apply_delta(base, delta) == base
+
+    def test_extends_matches_backward(self):
+        base = bytes(range(256)) * 16
+        target = b"!" + base[3:]
+        delta = create_delta(base, target)
+        # Sizes, one insert and one copy: the match starts before the first block
+        assert (
+            delta
+            == encode_delta_size(4096)
+            + encode_delta_size(4094)
+            + b"\x01!\xb1\x03\xfd\x0f"
+        )
+        assert apply_delta(base, delta) == target
+
+    def test_repeated_blocks_copy_the_longest_match(self):
+        block = b"0123456789abcdef"
+        tail = bytes(range(100, 200))
+        base = block + b"short" + bytes(11) + block + tail
+        delta = create_delta(base, block + tail)
+        # A single copy of all 116 bytes from offset 32
+        assert (
+            delta
+            == encode_delta_size(len(base)) + encode_delta_size(116) + b"\x91\x20\x74"
+        )
+
+    def test_max_size(self):
+        index = DeltaIndex(b"0123456789abcdef" * 64)
+        target = b"0123456789abcdef" * 32 + b"unrelated" * 20
+        delta = index.create_delta(target)
+        assert index.create_delta(target, max_size=len(delta)) == delta
+        assert index.create_delta(target, max_size=len(delta) - 1) is None
@@ -4,8 +4,10 @@ import subprocess
 from operator import attrgetter
 
 import pytest
+from conftest import all_objects, run_git
 
 from app.main import Git
+from app.models.pack import TYPE_NAMES
 
 
 @pytest.fixture
@@ -32,7 +34,6 @@ def create_git_tree(change_to_tmp_dir):
     parent_folder.mkdir()
     file1 = parent_folder / "file1.txt"
     file1.write_text("hello")
-    #
     child_folder = parent_folder / "child_folder"
     child_folder.mkdir()
     file2 = child_folder / "file2.txt"
@@ -98,6 +99,34 @@ class TestGit:
         assert expected_path.exists() == write
         assert capsys.readouterr().out == hash_value
 
+    @pytest.mark.parametrize("chunk_size", [7, 1024 * 1024])
+    def test_hash_object_streams_binary_files(
+        self, change_to_tmp_dir, chunk_size, monkeypatch
+    ):
+        monkeypatch.setattr("app.models.git.BLOB_CHUNK_SIZE", chunk_size)
+        git = Git()
+        git.init_repo()
+        content = "héllo wörld\n".encode() + bytes(range(256)) * 64
+        tmp_file = change_to_tmp_dir / "file.bin"
+        tmp_file.write_bytes(content)
+        expected = subprocess.run(
+            ["git", "hash-object", str(tmp_file)],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+
+        hash_value = git.hash_object(tmp_file, write=True, pretty_print=False)
+        assert hash_value == expected
+        assert git.cat_file(hash_value).body == content
+        assert not list((change_to_tmp_dir / ".git/objects").glob("tmp_obj_*"))
+
+    def test_create_blob_counts_bytes(self, change_to_tmp_dir):
+        git = Git()
+        git.init_repo()
+        hash_value = git.create_blob("héllo")
+        assert git.cat_file(hash_value).header == b"blob 6"
+
     def test_read_tree(self, create_git_tree):
         git = Git()
         entries = git.ls_tree(create_git_tree)
@@ -141,6 +170,43 @@ class TestGit:
         assert git.cat_file(file1_entry.hash).body == b"hello"
         assert git.cat_file(file2_entry.hash).body == b"world"
 
+    @pytest.mark.parametrize("jobs", [1, 4])
+    def test_create_tree(self, create_git_tree, jobs):
+        # Without an index every file is hashed again
+        pathlib.Path(".git/index").unlink()
+        git = Git()
+        assert git.create_tree(pretty_print=False, jobs=jobs) == create_git_tree
+        assert git.cat_file(create_git_tree).header.startswith(b"tree ")
+
+    def test_repack(self, source_repo):
+        objects = all_objects(source_repo)
+        # One of them already packed, which only needs its loose copy pruned
+        readme = run_git(source_repo, "rev-parse", "HEAD:README.md")
+        pack_prefix = ".git/objects/pack/pack"
+        run_git(source_repo, "pack-objects", "-q", pack_prefix, input=readme)
+        with contextlib.chdir(source_repo):
+            pack_sha1 = Git().repack()
+
+        assert not list((source_repo / ".git" / "objects").glob("??/*"))
+        stats = run_git(source_repo, "count-objects", "-v").decode()
+        assert "count: 0" in stats and "packs: 2" in stats
+        run_git(source_repo, "fsck", "--full", "--strict")
+        pack = source_repo / ".git" / "objects" / "pack" / f"pack-{pack_sha1}.idx"
+        verified = run_git(source_repo, "verify-pack", "-v", str(pack)).decode()
+        packed = {line[:40] for line in verified.splitlines()} & objects
+        assert len(packed) == len(objects) - 1
+        # Every version of module.py but the largest is a delta
+        assert "chain length = 1: " in verified
+
+        # Read back through the pack, deltas included
+        with contextlib.chdir(source_repo):
+            git = Git()
+            for sha1 in objects:
+                obj = git.store.read(sha1)
+                expected = run_git(source_repo, "cat-file", TYPE_NAMES[obj.type], sha1)
+                assert obj.data == expected
+            assert git.repack() is None
+
     def test_git_commit_tree(self, create_git_tree):
         git = Git()
         hash_value = git.commit_tree(create_git_tree, "Test commit", pretty_print=False)
@@ -0,0 +1,170 @@
+import contextlib
+import http.client
+import io
+import subprocess
+
+import pytest
+from conftest import GIT_ENV, add_commits, all_objects, run_git
+
+from app.http_backend import GitHttpServer, PackStats, UploadPack, side_band
+from app.models import Git
+from app.models.clone import FLUSH_PKT, GitClone
+
+
+def git_clone(url: str, work_dir) -> str:
+    """Clone `url` with git, returning what it printed to stderr."""
+    result = subprocess.run(
+        ["git", "clone", url, str(work_dir)],
+        capture_output=True,
+        check=False,
+        env=GIT_ENV,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"git clone failed:\n{result.stderr.decode()}")
+    return result.stderr.decode()
+
+
+def get_status(server: GitHttpServer, path: str) -> int:
+    connection = http.client.HTTPConnection(*server.server_address[:2])
+    with contextlib.closing(connection):
+        connection.request("GET", path)
+        return connection.getresponse().status
+
+
+def read_pkt_lines(data: bytes) -> list[bytes]:
+    """The lines of `data`, up to its flush packet."""
+    stream = io.BytesIO(data)
+    lines = []
+    while (line := GitClone._read_pkt_line(stream)) is not None:
+        lines.append(line)
+    assert stream.read() == b""
+    return lines
+
+
+class TestHttpBackend:
+    def test_clone(self, tmp_path, source_repo, backend):
+        work_dir = tmp_path / "clone"
+        Git().clone(f"{backend.url}/source.git", work_dir)
+
+        assert run_git(work_dir, "fsck", "--strict") == b""
+        assert run_git(work_dir, "status", "--porcelain") == b""
+        assert all_objects(work_dir) == all_objects(source_repo)
+        assert (work_dir / "src" / "lib" / "module.py").read_bytes() == (
+            source_repo / "src" / "lib" / "module.py"
+        ).read_bytes()
+
+    def test_git_clone_reuses_packed_objects(self, tmp_path, source_repo, backend):
+        run_git(source_repo, "tag", "-a", "v1", "-m", "Version 1")
+        run_git(source_repo, "gc", "-q")
+        work_dir = tmp_path / "clone"
+        progress = git_clone(f"{backend.url}/source", work_dir)
+
+        objects = len(all_objects(source_repo))  # the tag among them
+        assert f"remote: Total {objects} (delta " in progress
+        assert f"reused {objects}" in progress
+        assert run_git(work_dir, "fsck", "--strict") == b""
+        assert run_git(work_dir, "rev-parse", "v1^{}") == run_git(
+            source_repo, "rev-parse", "HEAD"
+        )
+
+    def test_bare_repository(self, tmp_path, source_repo, backend):
+        run_git(tmp_path, "clone", "-q", "--bare", "source", "bare.git")
+        work_dir = tmp_path / "clone"
+        git_clone(f"{backend.url}/bare", work_dir)
+        assert run_git(work_dir, "rev-parse", "HEAD") == run_git(
+            source_repo, "rev-parse", "HEAD"
+        )
+
+    @pytest.mark.parametrize("client", ["ours", "git"])
+    def test_fetch_thin_pack(self, tmp_path, source_repo, backend, client):
+        work_dir = tmp_path / "clone"
+        git_clone(f"{backend.url}/source", work_dir)
+        run_git(source_repo, "gc", "-q")
+        old_head = run_git(work_dir, "rev-parse", "HEAD").decode().strip()
+        head = add_commits(source_repo, 3)
+
+        if client == "ours":
+            with contextlib.chdir(work_dir):
+                assert Git().fetch() == {"refs/remotes/origin/main": head}
+        else:
+            run_git(work_dir, "fetch", "-q")
+        assert run_git(work_dir, "rev-parse", "origin/main").decode().strip() == head
+        assert run_git(work_dir, "fsck", "--strict") == b""
+        new_objects = run_git(
+            source_repo, "rev-list", "--objects", f"{old_head}..{head}"
+        ).splitlines()
+        assert all_objects(work_dir) == all_objects(source_repo)
+        assert len(new_objects) < len(all_objects(source_repo)) // 2
+
+    def test_not_found(self, backend):
+        assert get_status(backend, "/source/info/refs?service=git-upload-pack") == 200
+        assert get_status(backend, "/missing/info/refs?service=git-upload-pack") == 404
+        assert get_status(backend, "/source/info/refs?service=git-receive-pack") == 404
+        escape = "/../source/info/refs?service=git-upload-pack"
+        assert get_status(backend, escape) == 404
+        assert backend.git_dir("source/../..") is None
+        assert backend.git_dir("source.git") == backend.root / "source" / ".git"
+
+
+class TestUploadPack:
+    def test_advertise_refs(self, source_repo):
+        run_git(source_repo, "tag", "-a", "v1", "-m", "Version 1")
+        with UploadPack(source_repo / ".git") as upload_pack:
+            lines = read_pkt_lines(upload_pack.advertise_refs())
+
+        head = run_git(source_repo, "rev-parse", "HEAD").decode().strip()
+        tag = run_git(source_repo, "rev-parse", "v1").decode().strip()
+        first, _, capabilities = lines[0].partition(b"\0")
+        assert first == f"{head} HEAD".encode()
+        assert b"symref=HEAD:refs/heads/main" in capabilities.split()
+        assert lines[1:] == [
+            f"{head} refs/heads/main".encode(),
+            f"{tag} refs/tags/v1".encode(),
+            f"{head} refs/tags/v1^{{}}".encode(),
+        ]
+
+    def test_advertise_empty_repository(self, tmp_path):
+        run_git(tmp_path, "init", "-q", "empty")
+        with UploadPack(tmp_path / "empty" / ".git") as upload_pack:
+            lines = read_pkt_lines(upload_pack.advertise_refs())
+        assert len(lines) == 1
+        assert lines[0].startswith(b"0" * 40 + b" capabilities^{}\0")
+
+    def test_not_our_ref(self, source_repo):
+        request = GitClone.format_pkt_line(f"want {'0' * 40}\n") + FLUSH_PKT
+        with UploadPack(source_repo / ".git") as upload_pack:
+            response = b"".join(upload_pack.upload_pack(request + b"0009done\n"))
+        assert b"ERR upload-pack: not our ref" in response
+
+    @pytest.mark.parametrize("ofs_delta", [True, False])
+    def test_pack_objects(self, tmp_path, source_repo, ofs_delta):
+        run_git(source_repo, "gc", "-q")
+        sha1s = sorted(all_objects(source_repo))
+        stats = PackStats()
+        with UploadPack(source_repo / ".git") as upload_pack:
+            pack = b"".join(
+                upload_pack.pack_objects(sha1s, ofs_delta=ofs_delta, stats=stats)
+            )
+
+        pack_path = tmp_path / "sent.pack"
+        pack_path.write_bytes(pack)
+        run_git(tmp_path, "index-pack", "--strict", str(pack_path))
+        idx = pack_path.with_suffix(".idx").read_bytes()
+        listing = run_git(tmp_path, "show-index", input=idx).decode()
+        assert sorted(line.split()[1] for line in listing.splitlines()) == sha1s
+        # Every entry, deltas included, was copied from the repository's pack
+        assert stats.objects == stats.reused == len(sha1s)
+        assert stats.deltas > 0
+        assert str(stats).startswith(f"Total {len(sha1s)} (delta {stats.deltas})")
+
+    def test_side_band(self):
+        data = bytes(range(256)) * 600
+        packets = list(side_band([data[:1000], data[1000:]]))
+        # The length, the band and 65515 bytes of data
+        assert [len(packet) for packet in packets] == [65520, 65520, 22575]
+        assert all(packet[4] == 1 for packet in packets)
+        assert b"".join(packet[5:] for packet in packets) == data
+        assert list(side_band([b"oops\n"], 3, size=10)) == [b"000a\3oops\n"]
+        assert list(side_band([b"x" * 10], size=4)) == [b"0009\1xxxx"] * 2 + [
+            b"0007\1xx"
+        ]
@@ -0,0 +1,187 @@
+import contextlib
+import os
+
+import pytest
+from conftest import run_git
+
+from app.main import Git
+from app.models.index import CachedTree, GitIndex, IndexEntry
+
+
+@pytest.fixture
+def work_tree(tmp_path):
+    with contextlib.chdir(tmp_path):
+        run_git(tmp_path, "init", "-q", ".")
+        (tmp_path / "docs").mkdir()
+        (tmp_path / "docs" / "guide.md").write_text("guide\n")
+        (tmp_path / "main.py").write_text("print('hello')\n")
+        yield tmp_path
+
+
+class TestGitIndex:
+    def test_round_trip_with_git(self, work_tree):
+        run_git(work_tree, "add", ".")
+        index = GitIndex.read(work_tree / ".git" / "index")
+        assert sorted(index.entries) == ["docs/guide.md", "main.py"]
+        st = os.stat(work_tree / "main.py")
+        assert index.entries["main.py"].stat_matches(st)
+
+        expected = run_git(work_tree, "ls-files", "--stage", "--debug")
+        (work_tree / ".git" / "index").unlink()
+        index.write(work_tree / ".git" / "index")
+        assert run_git(work_tree, "ls-files", "--stage", "--debug") == expected
+        assert run_git(work_tree, "diff-files", "--quiet") == b""
+
+    def test_tree_extension_round_trip_with_git(self, work_tree):
+        (work_tree / "docs" / "api").mkdir()
+        (work_tree / "docs" / "api" / "ref.md").write_text("ref\n")
+        (work_tree / "src").mkdir()
+        (work_tree / "src" / "app.py").write_text("app\n")
+        run_git(work_tree, "add", ".")
+        tree_hash = run_git(work_tree, "write-tree").decode().strip()
+
+        index_path = work_tree / ".git" / "index"
+        data = index_path.read_bytes()
+        index = GitIndex.read(index_path)
+        assert sorted(index.trees) == ["", "docs", "docs/api", "src"]
+        assert index.trees[""] == CachedTree(tree_hash, 4, 2)
+        assert index.trees["docs"].entry_count == 2
+
+        index_path.unlink()
+        index.write(index_path)
+        assert index_path.read_bytes() == data
+
+    def test_missing_index(self, tmp_path):
+        assert GitIndex.read(tmp_path / "index").entries == {}
+
+    def test_corrupt_index(self, work_tree):
+        run_git(work_tree, "add", ".")
+        index_path = work_tree / ".git" / "index"
+        index_path.write_bytes(index_path.read_bytes()[:-1] + b"\0")
+        with pytest.raises(ValueError, match="checksum"):
+            GitIndex.read(index_path)
+
+    def test_racily_clean_entry(self, work_tree):
+        st = os.stat(work_tree / "main.py")
+        entry = IndexEntry.from_stat("main.py", 0o100644, "0" * 40, st)
+        index = GitIndex({"main.py": entry}, timestamp=st.st_mtime_ns)
+        assert index.lookup_clean("main.py", st) is None
+        index.timestamp = st.st_mtime_ns + 1
+        assert index.lookup_clean("main.py", st) is entry
+
+
+class TestWriteTreeWithIndex:
+    def test_unchanged_files_are_not_rehashed(self, work_tree, monkeypatch):
+        git = Git()
+        tree_hash = git.create_tree(pretty_print=False)
+        run_git(work_tree, "add", ".")
+        assert tree_hash == run_git(work_tree, "write-tree").decode().strip()
+        # Let the cache become strictly newer than the files it describes
+        cache = git.tree_cache_path
+        os.utime(cache, ns=(0, os.stat(cache).st_mtime_ns + 10**9))
+
+        hashed = []
+        hash_object = git.hash_object
+
+        def recording_hash_object(path, **kwargs):
+            hashed.append(path)
+            return hash_object(path, **kwargs)
+
+        monkeypatch.setattr(git, "hash_object", recording_hash_object)
+        assert git.create_tree(pretty_print=False) == tree_hash
+        assert hashed == []
+
+        (work_tree / "main.py").write_text("print('changed')\n")
+        os.utime(cache, ns=(0, os.stat(cache).st_mtime_ns + 10**9))
+        new_hash = git.create_tree(pretty_print=False)
+        assert new_hash != tree_hash
+        assert [path.name for path in hashed] == ["main.py"]
+
+    def test_unchanged_directories_are_not_rebuilt(self, work_tree, monkeypatch):
+        (work_tree / "docs" / "faq.md").write_text("faq\n")
+        (work_tree / "src").mkdir()
+        (work_tree / "src" / "app.py").write_text("app\n")
+        git = Git()
+
+        def create_tree():
+            # Let the cache become strictly newer than the files it describes
+            if git.tree_cache_path.exists():
+                mtime = os.stat(git.tree_cache_path).st_mtime_ns + 10**9
+                os.utime(git.tree_cache_path, ns=(0, mtime))
+            return git.create_tree(pretty_print=False)
+
+        tree_hash = create_tree()
+        built = []
+        write_tree_object = git._write_tree_object
+
+        def recording_write_tree_object(entries, **kwargs):
+            built.append(write_tree_object(entries, **kwargs))
+            return built[-1]
+
+        monkeypatch.setattr(git, "_write_tree_object", recording_write_tree_object)
+        assert create_tree() == tree_hash
+        assert built == []
+
+        (work_tree / "docs" / "guide.md").write_text("changed\n")
+        tree_hash = create_tree()
+        assert len(built) == 2 and built[-1] == tree_hash  # docs and the root
+        run_git(work_tree, "add", ".")
+        assert tree_hash == run_git(work_tree, "write-tree").decode().strip()
+
+        # A removed file invalidates its directory, the remaining ones are clean
+        built.clear()
+        (work_tree / "docs" / "faq.md").unlink()
+        assert create_tree() != tree_hash
+        assert len(built) == 2
+
+    def test_staging_area_is_left_alone(self, work_tree):
+        (work_tree / ".gitignore").write_text("*.log\n")
+        (work_tree / "main.py").write_text("print('staged')\n")
+        run_git(work_tree, "add", ".")
+        (work_tree / "main.py").write_text("print('unstaged')\n")
+        (work_tree / "build.log").write_text("ignored\n")
+        staged = run_git(work_tree, "diff", "--cached")
+        files = run_git(work_tree, "ls-files", "--stage")
+        index = (work_tree / ".git" / "index").read_bytes()
+
+        status = run_git(work_tree, "status", "--porcelain")
+
+        Git().create_tree(pretty_print=False)
+        assert (work_tree / ".git" / "index").read_bytes() == index
+        assert run_git(work_tree, "status", "--porcelain") == status
+        assert run_git(work_tree, "diff", "--cached") == staged
+        assert run_git(work_tree, "ls-files", "--stage") == files
+
+    def test_trees_cached_by_git_need_the_same_files(self, work_tree):
+        run_git(work_tree, "add", ".")
+        run_git(work_tree, "write-tree")
+        # As many files in docs/ as git cached, but not the same ones
+        (work_tree / "docs" / "guide.md").unlink()
+        (work_tree / "docs" / "notes.md").write_text("untracked\n")
+        status = run_git(work_tree, "status", "--porcelain")
+
+        tree_hash = Git().create_tree(pretty_print=False)
+        assert run_git(work_tree, "status", "--porcelain") == status
+        run_git(work_tree, "add", "-A")
+        assert tree_hash == run_git(work_tree, "write-tree").decode().strip()
+
+    def test_unreadable_index(self, work_tree):
+        run_git(work_tree, "add", ".")
+        run_git(work_tree, "update-index", "--index-version", "4")
+        with pytest.raises(ValueError, match="version 4"):
+            GitIndex.read(work_tree / ".git" / "index")
+
+        tree_hash = Git().create_tree(pretty_print=False)
+        assert tree_hash == run_git(work_tree, "write-tree").decode().strip()
+
+    def test_matches_git_order_and_modes(self, work_tree):
+        (work_tree / "a").mkdir()
+        (work_tree / "a" / "b.txt").write_text("b\n")
+        (work_tree / "a.txt").write_text("a\n")
+        (work_tree / "empty").mkdir()
+        (work_tree / "run.sh").write_text("#!/bin/sh\n")
+        (work_tree / "run.sh").chmod(0o755)
+
+        tree_hash = Git().create_tree(write=False, pretty_print=False)
+        run_git(work_tree, "add", ".")
+        assert tree_hash == run_git(work_tree, "write-tree").decode().strip()
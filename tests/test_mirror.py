@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+from conftest import run_git
+
+from app.main import main
+from app.mirror import _mirror_repository, mirror, read_manifest
+from app.models import Git
+
+
+def commit(repo, message: str) -> str:
+    (repo / "NEWS.md").write_text(f"{message}\n")
+    run_git(repo, "add", ".")
+    run_git(repo, "commit", "-q", "-m", message)
+    return run_git(repo, "rev-parse", "HEAD").decode().strip()
+
+
+class TestManifest:
+    def test_read_manifest(self, tmp_path):
+        manifest = tmp_path / "repos.txt"
+        manifest.write_text(
+            "# Mirrored nightly\n"
+            "https://example.com/org/tool.git\n"
+            "\n"
+            "https://example.com/org/lib/ library-mirror\n"
+        )
+        assert read_manifest(manifest, tmp_path / "mirrors") == [
+            ("https://example.com/org/tool.git", tmp_path / "mirrors" / "tool"),
+            ("https://example.com/org/lib/", tmp_path / "mirrors" / "library-mirror"),
+        ]
+
+    def test_duplicate_paths(self, tmp_path):
+        manifest = tmp_path / "repos.txt"
+        manifest.write_text("https://a.example/tool.git\nhttps://b.example/tool\n")
+        with pytest.raises(ValueError, match="same path"):
+            read_manifest(manifest, tmp_path)
+
+
+class TestMirror:
+    def test_clone_then_fetch(self, tmp_path, source_repo, fake_remote):
+        repositories = [(fake_remote, tmp_path / name) for name in ("a", "b", "c")]
+        reported = []
+
+        summary = asyncio.run(
+            mirror(repositories, concurrency=2, report=reported.append)
+        )
+        assert sorted(result.path.name for result in reported) == ["a", "b", "c"]
+        assert {result.action for result in summary.results} == {"cloned"}
+        assert summary.bytes > 0 and not summary.failed
+        for _, path in repositories:
+            assert run_git(path, "fsck", "--strict") == b""
+
+        head = commit(source_repo, "Release")
+        summary = asyncio.run(mirror(repositories, concurrency=2))
+        assert {result.action for result in summary.results} == {"fetched"}
+        for _, path in repositories:
+            assert run_git(path, "rev-parse", "origin/main").decode().strip() == head
+
+        summary = asyncio.run(mirror(repositories))
+        assert {result.action for result in summary.results} == {"up to date"}
+        assert summary.bytes == 0
+
+    def test_failures_are_reported(self, tmp_path, fake_remote):
+        missing = fake_remote.replace("source", "missing")
+        repositories = [(missing, tmp_path / "missing"), (fake_remote, tmp_path / "ok")]
+
+        summary = asyncio.run(mirror(repositories))
+        (failed,) = summary.failed
+        assert failed.url == missing and "404" in failed.error
+        # A failed clone leaves nothing to mistake for a mirror next time
+        assert not (tmp_path / "missing").exists()
+        assert (tmp_path / "ok" / ".git").is_dir()
+
+    def test_bugs_are_not_failures(self, tmp_path, monkeypatch):
+        def clone(self, url, work_dir, **kwargs):
+            work_dir.mkdir()
+            raise error
+
+        monkeypatch.setattr(Git, "clone", clone)
+        error = RuntimeError("HTTP 503 Service Unavailable")
+        result = _mirror_repository("http://unused", tmp_path / "repo", 1)
+        assert result.error == "RuntimeError: HTTP 503 Service Unavailable"
+
+        error = TypeError("a bug")
+        with pytest.raises(TypeError):
+            _mirror_repository("http://unused", tmp_path / "repo", 1)
+        assert not (tmp_path / "repo").exists()
+
+    def test_command(self, tmp_path, fake_remote, capsys):
+        manifest = tmp_path / "repos.txt"
+        manifest.write_text(f"{fake_remote}\n")
+        main(["mirror", "-c", "1", str(manifest), str(tmp_path / "mirrors")])
+        output = capsys.readouterr()
+        assert "mirrors/source: cloned" in output.out
+        assert output.err.startswith("Mirrored 1 repositories (0 failed)")
+
+        manifest.write_text(f"{fake_remote.replace('source', 'missing')}\n")
+        with pytest.raises(SystemExit):
+            main(["mirror", str(manifest), str(tmp_path / "mirrors")])
+
+    def test_empty_remote(self, tmp_path, backend, capsys):
+        run_git(tmp_path, "init", "-q", "empty")
+        manifest = tmp_path / "repos.txt"
+        manifest.write_text(f"{backend.url}/empty\n{backend.url}/source\n")
+        with pytest.raises(SystemExit) as exit_info:
+            main(["mirror", str(manifest), str(tmp_path / "mirrors")])
+        assert exit_info.value.code == 1
+
+        output = capsys.readouterr()
+        assert "mirrors/empty: failed after" in output.out
+        assert "RuntimeError: remote has no HEAD" in output.out
+        assert "mirrors/source: cloned" in output.out
+        assert output.err.startswith("Mirrored 2 repositories (1 failed)")
@@ -0,0 +1,237 @@
+import hashlib
+import struct
+import sys
+import zlib
+
+import pytest
+from conftest import run_git
+
+from app.models.clone import GitClone
+from app.models.delta import DeltaError, encode_delta_size
+from app.models.pack import (
+    OBJ_BLOB,
+    OBJ_COMMIT,
+    OBJ_OFS_DELTA,
+    OBJ_REF_DELTA,
+    ZLIB_SLACK,
+    DeltaBaseCache,
+    PackData,
+    PackEntry,
+    PackStream,
+    compute_sha1,
+    encode_entry_header,
+    encode_ofs_distance,
+    resolve_deltas,
+    resolve_deltas_parallel,
+)
+
+
+def build_chain_pack(depth: int) -> tuple[bytes, list[bytes]]:
+    """Pack with one blob followed by `depth` OFS deltas, each on the previous one."""
+    contents = [b"x"]
+    body = bytearray(struct.pack(">4sII", b"PACK", 2, depth + 1))
+    previous = len(body)
+    body += encode_entry_header(OBJ_BLOB, 1) + zlib.compress(b"x")
+    for _ in range(depth):
+        base = contents[-1]
+        contents.append(base + b"y")
+        # Copy the whole base, then insert one byte
+        delta = (
+            encode_delta_size(len(base))
+            + encode_delta_size(len(base) + 1)
+            + bytes([0x80 | 0x10 | 0x20, len(base) & 0xFF, len(base) >> 8])
+            + b"\x01y"
+        )
+        offset = len(body)
+        body += encode_entry_header(OBJ_OFS_DELTA, len(delta))
+        body += encode_ofs_distance(offset - previous) + zlib.compress(delta)
+        previous = offset
+    body += hashlib.sha1(body).digest()
+    return bytes(body), contents
+
+
+def scan_entries(pack: PackData, count: int) -> list[PackEntry]:
+    entries = []
+    offset = 12
+    for _ in range(count):
+        obj_type, size, data_offset, delta_base = pack.read_entry_header(offset)
+        entry = PackEntry(offset, obj_type, size, data_offset, delta_base=delta_base)
+        if delta_base is None:
+            entry.sha1 = compute_sha1(obj_type, pack.inflate(data_offset, size))
+        entries.append(entry)
+        # Each synthetic entry is followed directly by the next one
+        window = pack._view[data_offset : data_offset + size + 64]
+        decompressor = zlib.decompressobj()
+        decompressor.decompress(window)
+        offset = data_offset + len(window) - len(decompressor.unused_data)
+    return entries
+
+
+class TestEncoding:
+    @pytest.mark.parametrize(
+        "obj_type, size, expected",
+        [
+            (OBJ_BLOB, 1, b"\x31"),
+            (OBJ_COMMIT, 15, b"\x1f"),
+            (OBJ_BLOB, 16, b"\xb0\x01"),
+            (OBJ_OFS_DELTA, 1000, b"\xe8\x3e"),
+            (OBJ_REF_DELTA, 2**20, b"\xf0\x80\x80\x04"),
+        ],
+    )
+    def test_entry_header(self, obj_type, size, expected):
+        assert encode_entry_header(obj_type, size) == expected
+
+    @pytest.mark.parametrize(
+        "distance, expected",
+        [
+            (1, b"\x01"),
+            (127, b"\x7f"),
+            (128, b"\x80\x00"),
+            (16511, b"\xff\x7f"),
+            (16512, b"\x80\x80\x00"),
+        ],
+    )
+    def test_ofs_distance(self, distance, expected):
+        assert encode_ofs_distance(distance) == expected
+
+    @pytest.mark.parametrize(
+        "size, expected",
+        [(0, b"\x00"), (127, b"\x7f"), (128, b"\x80\x01"), (300, b"\xac\x02")],
+    )
+    def test_delta_size(self, size, expected):
+        assert encode_delta_size(size) == expected
+
+    @pytest.mark.parametrize("ofs_delta", [True, False])
+    def test_matches_git_pack(self, tmp_path, source_repo, ofs_delta):
+        options = ["--delta-base-offset"] if ofs_delta else []
+        source_pack = run_git(
+            source_repo, "pack-objects", *options, "--stdout", "--revs", input=b"HEAD\n"
+        )
+        pack_path = tmp_path / "git.pack"
+        pack_path.write_bytes(source_pack)
+        run_git(tmp_path, "index-pack", str(pack_path))
+        idx = pack_path.with_suffix(".idx").read_bytes()
+        listing = run_git(tmp_path, "show-index", input=idx).decode().splitlines()
+        sha1_at = {int(line.split()[0]): line.split()[1] for line in listing}
+
+        def object_size(sha1: str) -> int:
+            return int(run_git(source_repo, "cat-file", "-s", sha1))
+
+        pack = PackData(pack_path)
+        deltas = 0
+        for offset, sha1 in sha1_at.items():
+            obj_type, size, data_offset, base = pack.read_entry_header(offset)
+            expected = encode_entry_header(obj_type, size)
+            if obj_type == OBJ_OFS_DELTA:
+                expected += encode_ofs_distance(offset - base)
+                base = sha1_at[base]
+            elif obj_type == OBJ_REF_DELTA:
+                expected += bytes.fromhex(base)
+            if base is not None:
+                delta = pack.inflate(data_offset, size)
+                sizes = encode_delta_size(object_size(base))
+                sizes += encode_delta_size(object_size(sha1))
+                assert delta.startswith(sizes)
+                deltas += 1
+            assert source_pack[offset:data_offset] == expected
+        pack.close()
+        assert deltas > 0
+
+
+class TestPackStream:
+    def test_inflate_windows_are_bounded(self, monkeypatch, source_pack):
+        windows = []
+        decompressobj = zlib.decompressobj
+
+        class RecordingDecompressor:
+            def __init__(self):
+                self._decompressor = decompressobj()
+
+            def __getattr__(self, name):
+                return getattr(self._decompressor, name)
+
+            def decompress(self, data):
+                windows.append(len(data))
+                return self._decompressor.decompress(data)
+
+        monkeypatch.setattr(zlib, "decompressobj", RecordingDecompressor)
+        # The whole pack as one chunk: the worst case for tail slicing
+        pack = PackStream([source_pack])
+        clone = GitClone("unused")
+        header = clone.parse_pack_header(pack)
+        entries = clone.parse_pack_objects(pack, header.num_objects)
+        pack.read_trailer()
+
+        assert len(windows) >= len(entries)
+        assert max(windows) <= max(entry.size for entry in entries) + ZLIB_SLACK
+
+    def test_inflate_checks_declared_size(self):
+        pack = PackStream([zlib.compress(b"hello")])
+        with pytest.raises(ValueError, match="expected 4"):
+            pack.inflate(4)
+
+
+class TestDeltaBaseCache:
+    def test_evicts_least_recently_used(self):
+        cache = DeltaBaseCache(10)
+        cache.put(1, b"aaaa")
+        cache.put(2, b"bbbb")
+        assert cache.get(1) == b"aaaa"
+        cache.put(3, b"cccc")
+        assert cache.get(2) is None
+        assert cache.get(1) == b"aaaa"
+        assert cache.size == 8
+
+    def test_skips_oversized_entries(self):
+        cache = DeltaBaseCache(3)
+        cache.put(1, b"aaaa")
+        assert len(cache) == 0
+
+
+class TestResolveDeltas:
+    @pytest.mark.parametrize("cache_size", [4096, 1024 * 1024])
+    def test_deep_chain(self, tmp_path, cache_size):
+        depth = sys.getrecursionlimit() + 500
+        data, contents = build_chain_pack(depth)
+        pack_path = tmp_path / "chain.pack"
+        pack_path.write_bytes(data)
+
+        pack = PackData(pack_path)
+        try:
+            entries = scan_entries(pack, depth + 1)
+            resolve_deltas(pack, entries, cache_size=cache_size)
+        finally:
+            pack.close()
+
+        assert [entry.type for entry in entries] == [OBJ_BLOB] * (depth + 1)
+        assert [entry.sha1 for entry in entries] == [
+            compute_sha1(OBJ_BLOB, content) for content in contents
+        ]
+
+    def test_missing_ref_base(self, tmp_path):
+        data, _contents = build_chain_pack(0)
+        pack_path = tmp_path / "single.pack"
+        pack_path.write_bytes(data)
+        pack = PackData(pack_path)
+        try:
+            entries = scan_entries(pack, 1)
+            entries.append(PackEntry(9999, 7, 0, 0, delta_base="ab" * 20))
+            with pytest.raises(DeltaError):
+                resolve_deltas(pack, entries)
+        finally:
+            pack.close()
+
+    def test_parallel_matches_serial(self, tmp_path):
+        data, contents = build_chain_pack(300)
+        pack_path = tmp_path / "chain.pack"
+        pack_path.write_bytes(data)
+        pack = PackData(pack_path)
+        try:
+            entries = scan_entries(pack, len(contents))
+        finally:
+            pack.close()
+
+        resolve_deltas_parallel(pack_path, entries, jobs=2)
+        assert [entry.sha1 for entry in entries] == [
+            compute_sha1(OBJ_BLOB, content) for content in contents
+        ]
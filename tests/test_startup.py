@@ -0,0 +1,21 @@
+import pytest
+
+from benchmarks.startup import HEAVY_MODULES, import_profile, local_commands
+
+# Import time allowed for a local subcommand; importing the network stack
+# alone used to take it over budget
+STARTUP_BUDGET_MS = 150
+ATTEMPTS = 3
+
+
+def test_local_commands_within_startup_budget(source_repo):
+    for argv, stdin in local_commands(source_repo):
+        timings = []
+        for _ in range(ATTEMPTS):
+            milliseconds, modules = import_profile(argv, source_repo, stdin=stdin)
+            assert not HEAVY_MODULES & modules, argv
+            timings.append(milliseconds)
+            if milliseconds <= STARTUP_BUDGET_MS:
+                break
+        else:
+            pytest.fail(f"{argv} spent {min(timings):.1f}ms importing modules")
@@ -0,0 +1,101 @@
+import contextlib
+import io
+
+import pytest
+from conftest import all_objects, run_git
+
+from app.main import Git
+from app.models.pack import TYPE_NAMES, Pack
+from app.models.store import ObjectStore
+
+
+def git_objects(repo) -> dict[str, tuple[str, bytes]]:
+    """Map every object of `repo` to its (type, content) according to git."""
+    objects = {}
+    for sha1 in all_objects(repo):
+        obj_type = run_git(repo, "cat-file", "-t", sha1).decode().strip()
+        objects[sha1] = obj_type, run_git(repo, "cat-file", obj_type, sha1)
+    return objects
+
+
+@pytest.fixture
+def packed_repo(source_repo):
+    """`source_repo` with every object moved into a single OFS-delta pack."""
+    run_git(source_repo, "repack", "-a", "-d", "-q")
+    run_git(source_repo, "prune-packed")
+    return source_repo
+
+
+class TestObjectStore:
+    def test_read_packed_objects(self, packed_repo):
+        expected = git_objects(packed_repo)
+        assert not list((packed_repo / ".git" / "objects").glob("??/*"))
+        with ObjectStore(packed_repo / ".git" / "objects") as store:
+            for sha1, (obj_type, content) in expected.items():
+                obj = store.read(sha1)
+                assert (TYPE_NAMES[obj.type], obj.data) == (obj_type, content)
+                assert sha1 in store
+
+    def test_read_ref_delta_pack(self, tmp_path, source_repo, source_pack):
+        pack_path = tmp_path / "objects" / "pack" / "pack-test.pack"
+        pack_path.parent.mkdir(parents=True)
+        pack_path.write_bytes(source_pack)
+        run_git(tmp_path, "index-pack", str(pack_path))
+
+        pack = Pack(pack_path.with_suffix(".idx"))
+        delta_types = {
+            pack.data.read_entry_header(offset)[0] for _, offset in pack.index
+        }
+        pack.close()
+        assert 7 in delta_types  # pack-objects defaults to REF deltas
+
+        with ObjectStore(tmp_path / "objects") as store:
+            for sha1, (obj_type, content) in git_objects(source_repo).items():
+                obj = store.read(sha1)
+                assert (TYPE_NAMES[obj.type], obj.data) == (obj_type, content)
+
+    def test_read_headers(self, tmp_path, source_repo, source_pack):
+        pack_path = tmp_path / "objects" / "pack" / "pack-test.pack"
+        pack_path.parent.mkdir(parents=True)
+        pack_path.write_bytes(source_pack)
+        run_git(tmp_path, "index-pack", str(pack_path))
+
+        with ObjectStore(tmp_path / "objects") as store:
+            for sha1, (obj_type, content) in git_objects(source_repo).items():
+                assert store.read_header(sha1) == (store.read(sha1).type, len(content))
+            with pytest.raises(KeyError):
+                store.read_header("0" * 40)
+
+    def test_missing_object(self, packed_repo):
+        with ObjectStore(packed_repo / ".git" / "objects") as store:
+            assert "0" * 40 not in store
+            with pytest.raises(KeyError):
+                store.read("0" * 40)
+
+    def test_git_commands_on_packed_repo(self, packed_repo):
+        head = run_git(packed_repo, "rev-parse", "HEAD^{tree}").decode().strip()
+        with contextlib.chdir(packed_repo):
+            git = Git()
+            names = [entry.file_name for entry in git.ls_tree(head)]
+            assert names == [b"README.md", b"run.sh", b"src"]
+            readme = git.ls_tree(head)[0]
+            assert git.cat_file(readme.hash).body.startswith(b"# Project\n\nRevision 4")
+            with pytest.raises(ValueError, match="Not a tree object"):
+                git.ls_tree(readme.hash)
+
+    @pytest.mark.parametrize("packed", [False, True])
+    @pytest.mark.parametrize("option", ["--batch", "--batch-check"])
+    def test_cat_file_batch(self, source_repo, packed, option):
+        if packed:
+            run_git(source_repo, "repack", "-a", "-d", "-q")
+            run_git(source_repo, "prune-packed")
+        names = [*all_objects(source_repo), "0" * 40, "not-an-object", ""]
+        request = "".join(f"{name}\n" for name in names).encode()
+        expected = run_git(source_repo, "cat-file", option, input=request)
+
+        output = io.BytesIO()
+        with contextlib.chdir(source_repo):
+            Git().cat_file_batch(
+                io.BytesIO(request), output, contents=option == "--batch", buffer=True
+            )
+        assert output.getvalue() == expected
@@ -0,0 +1,68 @@
+import pytest
+from conftest import run_git
+
+from app.main import Git
+from app.models.clone import GitClone
+from app.models.transport import HttpTransport
+
+
+def discover(transport: HttpTransport, url: str) -> bytes:
+    with transport.request(f"{url}/info/refs?service=git-upload-pack") as response:
+        return response.read()
+
+
+class TestHttpTransport:
+    def test_clone_uses_one_connection(self, tmp_path, remote_server, monkeypatch):
+        # Discovery, ls-refs, the pack and two batches of missing blobs
+        monkeypatch.setattr("app.models.git.FETCH_BATCH_SIZE", 2)
+        work_dir = tmp_path / "clone"
+        Git().clone(remote_server.url, work_dir, filter_spec="blob:none")
+        assert len(remote_server.requests) == 4
+        assert remote_server.connections == 1
+        assert run_git(work_dir, "status", "--porcelain") == b""
+
+    def test_gzip_responses(self, tmp_path, remote_server):
+        remote_server.gzip_responses = True
+        work_dir = tmp_path / "clone"
+        Git().clone(remote_server.url, work_dir)
+        assert run_git(work_dir, "fsck", "--strict") == b""
+        assert remote_server.connections == 1
+
+    def test_gzip_large_requests(self, remote_server):
+        prefixes = [f"refs/tags/release-{i}" for i in range(100)]
+        with GitClone(remote_server.url, ref_prefixes=prefixes) as clone:
+            assert clone.refs == {}
+        # Only the ls-refs body is large enough to be compressed
+        assert remote_server.gzipped_requests == 1
+        assert b"ref-prefix refs/tags/release-99\n" in remote_server.requests[0]
+
+    def test_retry_busy_server(self, remote_server):
+        remote_server.failures = 2
+        with HttpTransport(backoff=0) as transport:
+            assert discover(transport, remote_server.url).startswith(b"001e# service=")
+            assert remote_server.failures == 0
+
+            remote_server.failures = 3
+            transport.retries = 2
+            with pytest.raises(RuntimeError, match="503"):
+                discover(transport, remote_server.url)
+
+    def test_no_retry_when_not_idempotent(self, remote_server):
+        remote_server.failures = 1
+        with HttpTransport(backoff=0) as transport, pytest.raises(RuntimeError):
+            transport.request(f"{remote_server.url}/git-upload-pack", data=b"0000")
+
+    def test_replace_dropped_connection(self, remote_server):
+        remote_server.drop_connections = True
+        with HttpTransport(retries=0) as transport:
+            for _ in range(3):
+                assert discover(transport, remote_server.url)
+        assert remote_server.connections == 3
+
+    def test_error_status(self, remote_server):
+        with HttpTransport() as transport, pytest.raises(RuntimeError, match="404"):
+            discover(transport, remote_server.url.replace("source", "missing"))
+
+    def test_unsupported_scheme(self):
+        with pytest.raises(ValueError, match="ftp"):
+            HttpTransport().request("ftp://example.com/repo.git/info/refs")
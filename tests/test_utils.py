@@ -12,11 +12,36 @@ from app.main import get_parser
         (["init"], Namespace(command="init")),
         (
             ["cat-file", "some_hash"],
-            Namespace(command="cat-file", hash="some_hash", pretty_print=False),
+            Namespace(
+                command="cat-file",
+                hash="some_hash",
+                pretty_print=False,
+                batch=False,
+                batch_check=False,
+                buffer=False,
+            ),
         ),
         (
             ["cat-file", "-p", "some_hash"],
-            Namespace(command="cat-file", hash="some_hash", pretty_print=True),
+            Namespace(
+                command="cat-file",
+                hash="some_hash",
+                pretty_print=True,
+                batch=False,
+                batch_check=False,
+                buffer=False,
+            ),
+        ),
+        (
+            ["cat-file", "--batch-check", "--buffer"],
+            Namespace(
+                command="cat-file",
+                hash=None,
+                pretty_print=False,
+                batch=False,
+                batch_check=True,
+                buffer=True,
+            ),
         ),
         (
             ["hash-object", "some_file.txt"],
@@ -42,7 +67,8 @@ from app.main import get_parser
             ],
             Namespace(command="ls-tree", name_only=True, hash_value="some_hash"),
         ),
-        (["write-tree"], Namespace(command="write-tree")),
+        (["write-tree"], Namespace(command="write-tree", jobs=1)),
+        (["write-tree", "-j", "8"], Namespace(command="write-tree", jobs=8)),
         (
             ["commit-tree", "some_hash", "-m", "Some commit message"],
             Namespace(
@@ -61,9 +87,113 @@ from app.main import get_parser
                 parent="some_parent_hash",
             ),
         ),
+        (
+            ["clone", "https://example.com/repo", "some_dir"],
+            Namespace(
+                command="clone",
+                url="https://example.com/repo",
+                work_dir=pathlib.Path("some_dir"),
+                jobs=1,
+                depth=None,
+                filter_spec=None,
+            ),
+        ),
+        (
+            ["clone", "-j", "4", "https://example.com/repo", "some_dir"],
+            Namespace(
+                command="clone",
+                url="https://example.com/repo",
+                work_dir=pathlib.Path("some_dir"),
+                jobs=4,
+                depth=None,
+                filter_spec=None,
+            ),
+        ),
+        (
+            ["clone", "--depth", "1", "https://example.com/repo", "some_dir"],
+            Namespace(
+                command="clone",
+                url="https://example.com/repo",
+                work_dir=pathlib.Path("some_dir"),
+                jobs=1,
+                depth=1,
+                filter_spec=None,
+            ),
+        ),
+        (
+            ["clone", "--filter=blob:none", "https://example.com/repo", "some_dir"],
+            Namespace(
+                command="clone",
+                url="https://example.com/repo",
+                work_dir=pathlib.Path("some_dir"),
+                jobs=1,
+                depth=None,
+                filter_spec="blob:none",
+            ),
+        ),
+        (["fetch"], Namespace(command="fetch", remote="origin", jobs=1)),
+        (
+            ["fetch", "-j", "2", "upstream"],
+            Namespace(command="fetch", remote="upstream", jobs=2),
+        ),
+        (
+            ["mirror", "repos.txt"],
+            Namespace(
+                command="mirror",
+                manifest=pathlib.Path("repos.txt"),
+                dest=pathlib.Path("."),
+                concurrency=4,
+                jobs=1,
+            ),
+        ),
+        (
+            ["mirror", "-c", "16", "repos.txt", "mirrors"],
+            Namespace(
+                command="mirror",
+                manifest=pathlib.Path("repos.txt"),
+                dest=pathlib.Path("mirrors"),
+                concurrency=16,
+                jobs=1,
+            ),
+        ),
+        (["repack"], Namespace(command="repack", window=10, depth=50)),
+        (
+            ["gc", "--window", "250", "--depth", "4"],
+            Namespace(command="gc", window=250, depth=4),
+        ),
+        (
+            ["http-backend"],
+            Namespace(
+                command="http-backend",
+                root=pathlib.Path("."),
+                bind="127.0.0.1",
+                port=8000,
+            ),
+        ),
+        (
+            ["http-backend", "repos", "--bind", "0.0.0.0", "--port", "0"],
+            Namespace(
+                command="http-backend",
+                root=pathlib.Path("repos"),
+                bind="0.0.0.0",
+                port=0,
+            ),
+        ),
+        (["daemon"], Namespace(command="daemon", socket=".git/daemon.sock")),
+        (
+            ["daemon", "--socket", "/tmp/git.sock"],
+            Namespace(command="daemon", socket="/tmp/git.sock"),
+        ),
     ],
 )
 def test_parser(params, expected):
     parser = get_parser()
     args = parser.parse_args(params)
     assert args == expected
+
+
+def test_repack_defaults_match_pack():
+    from app.models.pack import DELTA_DEPTH, DELTA_WINDOW
+
+    args = get_parser().parse_args(["repack"])
+    assert (args.window, args.depth) == (DELTA_WINDOW, DELTA_DEPTH)